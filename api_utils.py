@@ -1,6 +1,13 @@
 import streamlit as st
 import requests
+import json
+import time
+import hashlib
 from config import API_ENDPOINTS
+from transport import get_transport
+from response_cache import request_key, should_cache, get_response_cache
+from single_flight import get_chat_flights
+from resilience import admit, record_outcome, release_probe
 
 def get_euron_api_key():
     """
@@ -17,7 +24,7 @@ def get_euron_api_key():
             return st.session_state.api_key
         return None
 
-def call_euron_api(messages, model_id, temperature=0.5, max_tokens=2000):
+def call_euron_api(messages, model_id, temperature=0.5, max_tokens=2000, use_cache=None):
     """
     Call the Euron API for chat completions
     
@@ -26,15 +33,24 @@ def call_euron_api(messages, model_id, temperature=0.5, max_tokens=2000):
         model_id (str): ID of the model to use
         temperature (float): Temperature parameter
         max_tokens (int): Maximum tokens for response
+        use_cache (bool, optional): Serve and store the response in the response cache.
+            Defaults to caching only when temperature is 0.
         
     Returns:
-        dict: API response
+        dict: API response, with request timing under "timing"
     """
     api_key = get_euron_api_key()
     
     if not api_key:
         return {"error": "API key not found. Please add it to Streamlit secrets or enter it in the sidebar."}
     
+    key = request_key(model_id, messages, temperature, max_tokens)
+    cache_key = key if should_cache(temperature, use_cache) else None
+    if cache_key:
+        cached = get_response_cache().get(cache_key)
+        if cached is not None:
+            return cached
+    
     headers = {
         "Content-Type": "application/json",
         "Authorization": f"Bearer {api_key}"
@@ -47,27 +63,54 @@ def call_euron_api(messages, model_id, temperature=0.5, max_tokens=2000):
         "temperature": temperature
     }
     
-    try:
-        response = requests.post(API_ENDPOINTS["chat"], headers=headers, json=payload)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        return {"error": f"API request failed: {str(e)}"}
-    except Exception as e:
-        return {"error": f"An error occurred: {str(e)}"}
+    def send():
+        # Fail fast if the model's circuit is open or the rate limit is exhausted
+        rejected = admit(model_id, api_key)
+        if rejected:
+            return {"error": rejected}
+        
+        try:
+            response, timing = get_transport().post(API_ENDPOINTS["chat"], headers=headers, json=payload)
+            record_outcome(model_id, response.status_code, timing["total_ms"])
+            response.raise_for_status()
+            response_data = response.json()
+            response_data["timing"] = timing
+            if cache_key:
+                get_response_cache().set(cache_key, response_data)
+            return response_data
+        except requests.exceptions.HTTPError as e:
+            return {"error": f"API request failed: {str(e)}"}
+        except requests.exceptions.RequestException as e:
+            record_outcome(model_id, error=str(e))
+            return {"error": f"API request failed: {str(e)}"}
+        except Exception as e:
+            return {"error": f"An error occurred: {str(e)}"}
+    
+    # Identical requests already in flight (from any session using the same key)
+    # wait for that call and share its response or error instead of sending their own
+    flight_key = hashlib.sha256(api_key.encode()).hexdigest()[:16] + ":" + key
+    response_data, shared = get_chat_flights().do(flight_key, send)
+    if shared:
+        response_data = dict(response_data)
+        if "timing" in response_data:
+            response_data["timing"] = dict(response_data["timing"], coalesced=True)
+    return response_data
 
-def call_image_api(prompt, model_id):
+def call_image_api(prompt, model_id, n=1, size="512x512", api_key=None):
     """
     Call the Euron API for image generation
     
     Args:
         prompt (str): Image description
         model_id (str): ID of the model to use
+        n (int): Number of variants to generate in the one call
+        size (str): Image size as "WIDTHxHEIGHT"
+        api_key (str, optional): Euron API key, read with get_euron_api_key() if not given
         
     Returns:
-        dict: API response
+        dict: API response, with request timing under "timing"
     """
-    api_key = get_euron_api_key()
+    api_key = api_key or get_euron_api_key()
     
     if not api_key:
         return {"error": "API key not found. Please add it to Streamlit secrets or enter it in the sidebar."}
@@ -80,15 +123,148 @@ def call_image_api(prompt, model_id):
     payload = {
         "model": model_id,
         "prompt": prompt,
-        "n": 1,
-        "size": "512x512"
+        "n": n,
+        "size": size
     }
     
     try:
-        response = requests.post(API_ENDPOINTS["image"], headers=headers, json=payload)
+        response, timing = get_transport().post(API_ENDPOINTS["image"], headers=headers, json=payload)
         response.raise_for_status()
-        return response.json()
+        response_data = response.json()
+        response_data["timing"] = timing
+        return response_data
     except requests.exceptions.RequestException as e:
         return {"error": f"API request failed: {str(e)}"}
     except Exception as e:
         return {"error": f"An error occurred: {str(e)}"}
+
+def stream_euron_api(messages, model_id, temperature=0.5, max_tokens=2000, use_cache=None):
+    """
+    Call the Euron API for chat completions with server-sent-events streaming
+    
+    Args:
+        messages (list): List of message objects
+        model_id (str): ID of the model to use
+        temperature (float): Temperature parameter
+        max_tokens (int): Maximum tokens for response
+        use_cache (bool, optional): As for call_euron_api. A cache hit is yielded as a
+            single delta; a completed stream is stored as a regular response.
+        
+    Yields:
+        dict: {"delta": str} for each content fragment as it arrives, then a final
+            {"done": True, "timing": dict}, or {"error": str} if the request fails
+    """
+    api_key = get_euron_api_key()
+    
+    if not api_key:
+        yield {"error": "API key not found. Please add it to Streamlit secrets or enter it in the sidebar."}
+        return
+    
+    key = request_key(model_id, messages, temperature, max_tokens)
+    cache_key = key if should_cache(temperature, use_cache) else None
+    if cache_key:
+        cached = get_response_cache().get(cache_key)
+        if cached is not None and cached.get("choices"):
+            yield {"delta": cached["choices"][0]["message"]["content"]}
+            yield {"done": True, "timing": cached["timing"]}
+            return
+    
+    # Identical streams already in flight are joined: their deltas so far are
+    # replayed, then the rest arrive as the one upstream request produces them
+    flight_key = "stream:" + hashlib.sha256(api_key.encode()).hexdigest()[:16] + ":" + key
+    
+    def upstream():
+        return _stream_upstream(messages, model_id, temperature, max_tokens, api_key, cache_key)
+    
+    for event, shared in get_chat_flights().stream(flight_key, upstream):
+        if shared and "timing" in event:
+            event = dict(event, timing=dict(event["timing"], coalesced=True))
+        yield event
+
+def _stream_upstream(messages, model_id, temperature, max_tokens, api_key, cache_key):
+    """
+    Send one streaming chat completion request and yield its events
+    
+    Runs on a SingleFlight stream thread, so everything from the session
+    (the API key) is passed in.
+    """
+    headers = {
+        "Content-Type": "application/json",
+        "Accept": "text/event-stream",
+        "Authorization": f"Bearer {api_key}"
+    }
+    
+    payload = {
+        "messages": messages,
+        "model": model_id,
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "stream": True
+    }
+    
+    rejected = admit(model_id, api_key)
+    if rejected:
+        yield {"error": rejected}
+        return
+    
+    start = time.perf_counter()
+    response = None
+    parts = []
+    recorded = False
+    try:
+        response, timing = get_transport().post(API_ENDPOINTS["chat"], headers=headers, json=payload, stream=True)
+        if response.status_code >= 400:
+            recorded = True
+            record_outcome(model_id, response.status_code)
+        response.raise_for_status()
+        
+        for line in response.iter_lines(decode_unicode=True):
+            # SSE frames are "data: <json>" lines separated by blank lines
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            
+            chunk = json.loads(data)
+            if "error" in chunk:
+                yield {"error": str(chunk["error"])}
+                return
+            
+            choices = chunk.get("choices") or []
+            if not choices:
+                continue
+            delta = choices[0].get("delta", {}).get("content")
+            if delta:
+                if "first_token_ms" not in timing:
+                    timing["first_token_ms"] = round((time.perf_counter() - start) * 1000, 2)
+                    # For streams the latency users notice is time to first token
+                    recorded = True
+                    record_outcome(model_id, response.status_code, timing["first_token_ms"])
+                parts.append(delta)
+                yield {"delta": delta}
+        
+        timing["total_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        if cache_key and parts:
+            get_response_cache().set(cache_key, {
+                "choices": [{"message": {"role": "assistant", "content": "".join(parts)}}]
+            })
+        if not recorded:
+            recorded = True
+            record_outcome(model_id, response.status_code, timing["total_ms"])
+        yield {"done": True, "timing": timing}
+    except requests.exceptions.HTTPError as e:
+        yield {"error": f"API request failed: {str(e)}"}
+    except requests.exceptions.RequestException as e:
+        if not recorded:
+            recorded = True
+            record_outcome(model_id, error=str(e))
+        yield {"error": f"API request failed: {str(e)}"}
+    except Exception as e:
+        yield {"error": f"An error occurred: {str(e)}"}
+    finally:
+        # Also runs when the consumer stops iterating early
+        if response is not None:
+            response.close()
+        if not recorded:
+            release_probe(model_id)
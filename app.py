@@ -1,11 +1,22 @@
 import streamlit as st
 import os
 from config import AVAILABLE_MODELS, MODEL_CAPABILITIES, DEFAULT_MODEL
-from chat_handler import handle_chat_message
-from file_handler import process_uploaded_file
-from image_handler import generate_image
+from chat_handler import handle_chat_message, is_error_response, model_latency_ms
+from ingestion import ingest_files, uploaded_documents
+from image_jobs import get_image_jobs
 from utils import initialize_session_state
 from api_utils import get_euron_api_key
+from response_cache import get_response_cache
+from single_flight import get_chat_flights
+from resilience import get_model_states
+from hedging import get_hedge_stats
+from image_payload import get_image_payload_stats
+from image_store import get_image_store, ImageUnavailableError
+from file_cache import get_file_cache
+from model_router import format_decision
+from database_handler import get_db_logger
+from config import IMAGE_GENERATION_SETTINGS
+import time
 import io
 from PIL import Image
 from fpdf import FPDF
@@ -78,6 +89,30 @@ def get_download_link(file_bytes, file_name, file_type):
     b64 = base64.b64encode(file_bytes).decode()
     return f'<a href="data:{file_type};base64,{b64}" download="{file_name}">Download {file_name}</a>'
 
+def log_chat_turn(selected_model, route_info, user_input, response, execution_time_ms):
+    """Record a chat turn in the log database; logging failures never interrupt the chat."""
+    try:
+        # Only queued here; the shared logger's writer thread commits in batches
+        db_logger = get_db_logger()
+        db_logger.log_session(st.session_state.session_id)
+        db_logger.log_interaction(
+            st.session_state.session_id,
+            route_info.get("model_name", selected_model),
+            route_info.get("model_id", AVAILABLE_MODELS[selected_model]),
+            st.session_state.temperature,
+            st.session_state.max_tokens,
+            user_input,
+            response,
+            has_file=st.session_state.uploaded_file_content is not None,
+            file_name=st.session_state.uploaded_file_name,
+            has_image=st.session_state.uploaded_image is not None,
+            execution_time_ms=execution_time_ms,
+            is_error=is_error_response(response),
+            latency_ms=model_latency_ms(route_info.get("timing"))
+        )
+    except Exception:
+        pass
+
 def main():
     """Main function to run the Streamlit app."""
     st.set_page_config(page_title="ResearchBuddy AI: A Multi-Model AI Assistant", layout="wide")
@@ -107,6 +142,23 @@ def main():
         for capability, supported in capabilities.items():
             st.checkbox(capability, value=supported, disabled=True)
         
+        # Circuit breaker state of each model
+        with st.expander("Model health"):
+            model_states = get_model_states(AVAILABLE_MODELS.values())
+            for model_name, model_id in AVAILABLE_MODELS.items():
+                state = model_states[model_id]
+                if state["state"] == "open":
+                    st.caption(f"🔴 {model_name}: unavailable, retrying in {state['retry_in']:.0f}s")
+                elif state["state"] == "half-open":
+                    st.caption(f"🟡 {model_name}: probing")
+                else:
+                    st.caption(f"🟢 {model_name}: healthy")
+            hedge_stats = get_hedge_stats()
+            st.caption(
+                f"Hedged requests: {hedge_stats['requests']} | Hedges sent: {hedge_stats['hedges']} | "
+                f"Fallbacks: {hedge_stats['fallbacks']} | Answered by another model: {hedge_stats['hedge_wins']}"
+            )
+        
         # Check if API key is available
         api_key = get_euron_api_key()
         if not api_key:
@@ -127,12 +179,63 @@ def main():
         max_tokens = st.slider("Max Tokens", min_value=100, max_value=3000, value=1000, step=100)
         st.session_state.max_tokens = max_tokens
         
+        # Streaming toggle
+        st.session_state.stream_responses = st.checkbox("Stream responses", value=st.session_state.stream_responses)
+        
+        # Let the router pick the fastest healthy model instead of the selection
+        st.session_state.prefer_fastest = st.checkbox(
+            "Route to the fastest capable model",
+            value=st.session_state.prefer_fastest
+        )
+        
+        # Race a slow model against the next capable one
+        st.session_state.hedge_requests = st.checkbox(
+            "Hedge slow requests across models",
+            value=st.session_state.hedge_requests
+        )
+        
+        # Responses are cached at temperature 0; this opts in at other temperatures too
+        st.session_state.cache_all_responses = st.checkbox(
+            "Reuse cached answers at any temperature",
+            value=st.session_state.cache_all_responses
+        )
+        with st.expander("Caches"):
+            cache_stats = get_response_cache().get_stats()
+            st.caption(
+                f"Hits: {cache_stats['memory_hits']} memory, {cache_stats['disk_hits']} disk | "
+                f"Misses: {cache_stats['misses']} | Evictions: {cache_stats['evictions']} | "
+                f"Hit rate: {cache_stats['hit_rate']:.0%}"
+            )
+            file_stats = get_file_cache().get_stats()
+            st.caption(
+                f"Parsed uploads: {file_stats['memory_hits'] + file_stats['disk_hits']} reused, "
+                f"{file_stats['misses']} parsed | Hit rate: {file_stats['hit_rate']:.0%} | "
+                f"Parse time saved: {file_stats['parse_ms_saved'] / 1000:.1f}s"
+            )
+            image_stats = get_image_payload_stats()
+            st.caption(
+                f"Image payloads: {image_stats['hits']} reused, {image_stats['misses']} encoded | "
+                f"Saved {image_stats['bytes_saved'] / 1e6:.1f} MB vs. full-resolution PNG payloads"
+            )
+            store_stats = get_image_store().get_stats()
+            st.caption(
+                f"Stored images: {store_stats['stored']} | Thumbnails made: {store_stats['thumbnails']} | "
+                f"Full-resolution decodes: {store_stats['decodes']}"
+            )
+            flight_stats = get_chat_flights().get_stats()
+            st.caption(
+                f"Duplicate in-flight requests collapsed: {flight_stats['collapsed']} "
+                f"of {flight_stats['calls']}"
+            )
+        
         # Clear chat button
         if st.button("Clear Chat"):
             st.session_state.messages = []
             st.session_state.uploaded_file_content = None
             st.session_state.uploaded_file_name = None
             st.session_state.uploaded_image = None
+            st.session_state.uploaded_tables = []
+            st.session_state.uploaded_files = []
             st.experimental_rerun()
         
         # Download chat options
@@ -164,34 +267,95 @@ def main():
     with col2:
         # File upload section
         st.subheader("File Upload")
-        uploaded_file = st.file_uploader("Upload a file", type=["txt", "pdf", "csv", "xlsx", "jpg", "jpeg", "png"])
-        if uploaded_file:
-            file_details = process_uploaded_file(uploaded_file)
-            st.session_state.uploaded_file_content = file_details["content"]
-            st.session_state.uploaded_file_name = file_details["name"]
+        uploaded_files = st.file_uploader(
+            "Upload files",
+            type=["txt", "pdf", "csv", "xlsx", "jpg", "jpeg", "png"],
+            accept_multiple_files=True
+        )
+        if uploaded_files:
+            progress = st.empty()
             
-            # If it's an image, store it separately and display it
-            if file_details["is_image"]:
-                st.session_state.uploaded_image = file_details["image"]
-                st.image(file_details["image"], caption=file_details["name"], use_column_width=True)
-                st.info("Image uploaded! You can now ask questions about this image.")
+            def show_progress(statuses):
+                lines = []
+                for status in statuses:
+                    if status["status"] == "done":
+                        lines.append(f"✅ {status['name']} ({status['elapsed_ms'] / 1000:.1f}s)")
+                    elif status["status"] == "error":
+                        lines.append(f"❌ {status['name']}: {status['error']}")
+                    elif status["pages_total"]:
+                        lines.append(f"⏳ {status['name']}: page {status['pages_done']} of {status['pages_total']}")
+                    else:
+                        lines.append(f"⏳ {status['name']}")
+                progress.markdown("  \n".join(lines))
+            
+            # Files are parsed side by side; a failed file is reported and skipped
+            statuses = ingest_files(uploaded_files, progress_callback=show_progress)
+            progress.empty()
+            parsed = [status["details"] for status in statuses if status["status"] == "done"]
+            documents = uploaded_documents(statuses)
+            if len(parsed) == 1:
+                st.session_state.uploaded_file_content = parsed[0]["content"]
             else:
-                st.success(f"File uploaded: {file_details['name']}")
+                st.session_state.uploaded_file_content = "\n\n".join(
+                    f"--- {document['name']} ---\n{document['content']}" for document in documents
+                ) or None
+            st.session_state.uploaded_file_name = ", ".join(details["name"] for details in parsed) or None
+            st.session_state.uploaded_files = documents
+            st.session_state.uploaded_tables = [table for details in parsed for table in details.get("tables", [])]
+            
+            for status in statuses:
+                if status["status"] == "error":
+                    st.error(f"Could not process {status['name']}: {status['error']}")
+            
+            # The first image is kept separately for image questions and displayed
+            images = [details for details in parsed if details["is_image"]]
+            st.session_state.uploaded_image = images[0]["image"] if images else None
+            for details in images:
+                # A thumbnail made once at upload; the full image stays undecoded in the store
+                st.image(details["image"].thumbnail(), caption=details["name"], use_column_width=True)
+            if images:
+                st.info("Image uploaded! You can now ask questions about this image.")
+            if documents:
+                st.success(f"Files uploaded: {', '.join(document['name'] for document in documents)}")
         
-        # Image generation section
+        # Image generation section: jobs run in the background and are polled, so
+        # the chat stays usable while an image is generated
         st.subheader("Image Generation")
         image_prompt = st.text_input("Image Description")
+        variants = st.number_input(
+            "Variants", min_value=1, max_value=IMAGE_GENERATION_SETTINGS["max_variants"], value=1, step=1
+        )
         if st.button("Generate Image") and image_prompt:
-            with st.spinner("Generating image..."):
-                image_result = generate_image(
-                    image_prompt, 
-                    api_key,  # This parameter is now ignored but kept for compatibility
-                    selected_model
-                )
-                if "image" in image_result:
-                    st.image(image_result["image"], caption=image_prompt)
+            job_id = get_image_jobs().submit(image_prompt, selected_model, n=int(variants))
+            st.session_state.image_jobs.append(job_id)
+        
+        jobs = get_image_jobs()
+        running = any(
+            (jobs.get(job_id) or {}).get("status") in ("queued", "running")
+            for job_id in st.session_state.image_jobs
+        )
+        
+        @st.experimental_fragment(run_every=IMAGE_GENERATION_SETTINGS["poll_interval"] if running else None)
+        def show_image_jobs():
+            states = [jobs.get(job_id) for job_id in reversed(st.session_state.image_jobs)]
+            if running and not any(job and job["status"] in ("queued", "running") for job in states):
+                # Everything finished: rerun once without the polling timer
+                st.experimental_rerun()
+            for job in states:
+                if job is None:
+                    continue
+                if job["status"] in ("queued", "running"):
+                    st.info(f"Generating: {job['prompt']}")
+                elif job["status"] == "error":
+                    st.error(job["error"])
                 else:
-                    st.error(image_result["error"])
+                    for ref in job["images"]:
+                        try:
+                            st.image(get_image_store().original(ref.key), caption=job["prompt"])
+                        except ImageUnavailableError as e:
+                            st.caption(str(e))
+        
+        show_image_jobs()
     
     with col1:
         # Chat interface
@@ -218,29 +382,90 @@ def main():
             
             # Generate AI response
             with st.chat_message("assistant"):
-                with st.spinner("Thinking..."):
-                    message_placeholder = st.empty()
-                    
-                    # Check if an image is uploaded and the selected model supports image analysis
-                    has_image = st.session_state.uploaded_image is not None
-                    model_supports_images = MODEL_CAPABILITIES.get(selected_model, {}).get("Image Analysis", False)
-                    
-                    # If image is uploaded and model doesn't support images, add a warning
-                    if has_image and not model_supports_images:
-                        st.warning(f"Note: {selected_model} doesn't fully support image analysis. For best results with images, try using Google Gemini 2.5 Pro Exp.")
-                    
-                    response = handle_chat_message(
-                        user_input,
-                        st.session_state.messages,
-                        selected_model,
-                        AVAILABLE_MODELS[selected_model],
-                        api_key,  # This parameter is now ignored but kept for compatibility
-                        st.session_state.temperature,
-                        st.session_state.max_tokens,
-                        st.session_state.uploaded_file_content,
-                        st.session_state.uploaded_image if has_image else None
-                    )
-                    message_placeholder.markdown(response)
+                # Check if an image is uploaded and the selected model supports image analysis
+                has_image = st.session_state.uploaded_image is not None
+                model_supports_images = MODEL_CAPABILITIES.get(selected_model, {}).get("Image Analysis", False)
+                
+                # If image is uploaded and model doesn't support images, add a warning
+                if has_image and not model_supports_images:
+                    st.warning(f"Note: {selected_model} doesn't fully support image analysis. For best results with images, try using Google Gemini 2.5 Pro Exp.")
+                
+                message_placeholder = st.empty()
+                chat_args = (
+                    user_input,
+                    st.session_state.messages,
+                    selected_model,
+                    AVAILABLE_MODELS[selected_model],
+                    api_key,  # This parameter is now ignored but kept for compatibility
+                    st.session_state.temperature,
+                    st.session_state.max_tokens,
+                    st.session_state.uploaded_file_content,
+                    st.session_state.uploaded_image if has_image else None
+                )
+                
+                route_info = {}
+                chat_options = {
+                    "use_cache": True if st.session_state.cache_all_responses else None,
+                    "hedge": st.session_state.hedge_requests,
+                    "prefer_fastest": st.session_state.prefer_fastest,
+                    "route_info": route_info,
+                    "tables": st.session_state.uploaded_tables,
+                    "files": st.session_state.uploaded_files
+                }
+                start_time = time.perf_counter()
+                
+                if st.session_state.stream_responses:
+                    # Render tokens as they arrive instead of waiting for the full reply
+                    message_placeholder.markdown("Thinking...")
+                    parts = []
+                    for delta in handle_chat_message(*chat_args, stream=True, **chat_options):
+                        parts.append(delta)
+                        message_placeholder.markdown("".join(parts) + "▌")
+                    response = "".join(parts)
+                else:
+                    with st.spinner("Thinking..."):
+                        response = handle_chat_message(*chat_args, **chat_options)
+                message_placeholder.markdown(response)
+                execution_time_ms = int((time.perf_counter() - start_time) * 1000)
+                
+                if route_info:
+                    with st.expander("Routing decision"):
+                        st.markdown(format_decision(route_info))
+                        context = route_info.get("context")
+                        if context:
+                            st.caption(
+                                f"Context: {context['used']} of {context['budget']} prompt tokens | "
+                                f"History: {context['history_included']} messages sent, "
+                                f"{context['history_dropped']} dropped"
+                                + (" | File content truncated" if context["file_truncated"] else "")
+                            )
+                        if route_info.get("table_results"):
+                            st.caption("Computed locally from the uploaded data:")
+                            st.code(route_info["table_results"], language=None)
+                        summary_report = route_info.get("summary")
+                        if summary_report:
+                            st.caption(
+                                f"Summary: {summary_report['sections']} sections in {summary_report['levels']} "
+                                f"levels, {summary_report['requests']} requests, {summary_report['cached']} cached, "
+                                f"{summary_report['elapsed_ms'] / 1000:.1f}s"
+                            )
+                        retrieval_report = route_info.get("retrieval")
+                        if retrieval_report:
+                            st.caption(
+                                (f"{retrieval_report['files']} files: " if "files" in retrieval_report else "File: ")
+                                + f"{retrieval_report['chunks_sent']} of {retrieval_report['chunks_total']} "
+                                f"sections sent ({retrieval_report['tokens_sent']} of "
+                                f"{retrieval_report['file_tokens']} tokens)"
+                            )
+                        image_report = route_info.get("image")
+                        if image_report:
+                            st.caption(
+                                f"Image sent at {image_report['width']}x{image_report['height']}, "
+                                f"{image_report['payload_bytes'] / 1024:.0f} KB"
+                                + (" (cached)" if image_report["cached"] else "")
+                            )
+            
+            log_chat_turn(selected_model, route_info, user_input, response, execution_time_ms)
             
             # Add assistant response to chat history
             st.session_state.messages.append({"role": "assistant", "content": response})
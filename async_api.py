@@ -0,0 +1,458 @@
+import asyncio
+import json
+import threading
+import time
+
+import httpx
+
+from config import API_ENDPOINTS, HTTP_SETTINGS, ASYNC_SETTINGS
+from transport import backoff_delay
+from resilience import admit_async, record_outcome, release_probe
+
+
+class AsyncEuronClient:
+    """Asyncio client for the Euron API sharing one pooled httpx.AsyncClient."""
+
+    def __init__(self, settings=None):
+        """
+        Create the async HTTP client.
+
+        Args:
+            settings (dict, optional): Overrides for config.HTTP_SETTINGS
+        """
+        self.settings = dict(HTTP_SETTINGS)
+        if settings:
+            self.settings.update(settings)
+
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=self.settings["pool_maxsize"] * self.settings["pool_connections"],
+                max_keepalive_connections=self.settings["pool_maxsize"],
+            ),
+            timeout=httpx.Timeout(
+                self.settings["read_timeout"],
+                connect=self.settings["connect_timeout"],
+            ),
+        )
+
+    async def _send(self, url, api_key, payload):
+        """
+        POST a JSON payload with retries, returning the response with its body read.
+
+        Returns:
+            tuple: (httpx.Response, dict timing)
+        """
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}"
+        }
+        max_retries = self.settings["max_retries"]
+        retry_statuses = self.settings["retry_statuses"]
+        connect_ms = 0.0
+        connect_started = {}
+
+        async def trace(event_name, info):
+            # httpcore reports connection setup through the "trace" extension
+            nonlocal connect_ms
+            if event_name in ("connection.connect_tcp.started", "connection.start_tls.started"):
+                connect_started[event_name.rsplit(".", 1)[0]] = time.perf_counter()
+            elif event_name in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+                started = connect_started.pop(event_name.rsplit(".", 1)[0], None)
+                if started is not None:
+                    connect_ms += (time.perf_counter() - started) * 1000
+
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                request = self.client.build_request("POST", url, headers=headers, json=payload,
+                                                    extensions={"trace": trace})
+                response = await self.client.send(request, stream=True)
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                if attempt > max_retries:
+                    raise
+                await asyncio.sleep(backoff_delay(attempt - 1, self.settings))
+                continue
+
+            if response.status_code in retry_statuses and attempt <= max_retries:
+                delay = backoff_delay(attempt - 1, self.settings, response.headers.get("Retry-After"))
+                await response.aclose()
+                await asyncio.sleep(delay)
+                continue
+            break
+
+        ttfb = time.perf_counter()
+        try:
+            await response.aread()
+        finally:
+            await response.aclose()
+
+        timing = {
+            "connect_ms": round(connect_ms, 2),
+            "ttfb_ms": round((ttfb - start) * 1000, 2),
+            "total_ms": round((time.perf_counter() - start) * 1000, 2),
+            "attempts": attempt,
+            "reused_connection": connect_ms == 0.0,
+        }
+        return response, timing
+
+    async def _post(self, url, api_key, payload):
+        """Send a request and shape the result like the sync api_utils functions."""
+        if not api_key:
+            return {"error": "API key not found. Please add it to Streamlit secrets or enter it in the sidebar."}
+
+        try:
+            response, timing = await self._send(url, api_key, payload)
+            response.raise_for_status()
+            response_data = response.json()
+            response_data["timing"] = timing
+            return response_data
+        except httpx.HTTPStatusError as e:
+            return {"error": f"API request failed: {str(e)}", "status_code": e.response.status_code}
+        except httpx.HTTPError as e:
+            return {"error": f"API request failed: {str(e)}"}
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            return {"error": f"An error occurred: {str(e)}"}
+
+    async def chat(self, messages, model_id, api_key, temperature=0.5, max_tokens=2000):
+        """
+        Async equivalent of api_utils.call_euron_api
+
+        Args:
+            messages (list): List of message objects
+            model_id (str): ID of the model to use
+            api_key (str): Euron API key
+            temperature (float): Temperature parameter
+            max_tokens (int): Maximum tokens for response
+
+        Returns:
+            dict: API response, with request timing under "timing", or {"error": str}
+                (with "status_code" for HTTP error responses)
+        """
+        payload = {
+            "messages": messages,
+            "model": model_id,
+            "max_tokens": max_tokens,
+            "temperature": temperature
+        }
+        return await self._post(API_ENDPOINTS["chat"], api_key, payload)
+
+    async def image(self, prompt, model_id, api_key, n=1, size="512x512"):
+        """
+        Async equivalent of api_utils.call_image_api
+
+        Args:
+            prompt (str): Image description
+            model_id (str): ID of the model to use
+            api_key (str): Euron API key
+            n (int): Number of variants to generate
+            size (str): Image size as "WIDTHxHEIGHT"
+
+        Returns:
+            dict: API response, with request timing under "timing", or {"error": str}
+        """
+        payload = {
+            "model": model_id,
+            "prompt": prompt,
+            "n": n,
+            "size": size
+        }
+        return await self._post(API_ENDPOINTS["image"], api_key, payload)
+
+    async def stream_chat(self, messages, model_id, api_key, temperature=0.5, max_tokens=2000):
+        """
+        Async equivalent of api_utils.stream_euron_api
+
+        Yields:
+            dict: {"delta": str} fragments, then {"done": True, "timing": dict},
+                or {"error": str} (with "status_code" for HTTP error responses)
+        """
+        if not api_key:
+            yield {"error": "API key not found. Please add it to Streamlit secrets or enter it in the sidebar."}
+            return
+
+        headers = {
+            "Content-Type": "application/json",
+            "Accept": "text/event-stream",
+            "Authorization": f"Bearer {api_key}"
+        }
+        payload = {
+            "messages": messages,
+            "model": model_id,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stream": True
+        }
+
+        start = time.perf_counter()
+        timing = {}
+        try:
+            async with self.client.stream("POST", API_ENDPOINTS["chat"], headers=headers, json=payload) as response:
+                timing["ttfb_ms"] = round((time.perf_counter() - start) * 1000, 2)
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line or not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+
+                    chunk = json.loads(data)
+                    if "error" in chunk:
+                        yield {"error": str(chunk["error"])}
+                        return
+
+                    choices = chunk.get("choices") or []
+                    if not choices:
+                        continue
+                    delta = choices[0].get("delta", {}).get("content")
+                    if delta:
+                        if "first_token_ms" not in timing:
+                            timing["first_token_ms"] = round((time.perf_counter() - start) * 1000, 2)
+                        yield {"delta": delta}
+
+            timing["total_ms"] = round((time.perf_counter() - start) * 1000, 2)
+            yield {"done": True, "timing": timing}
+        except httpx.HTTPStatusError as e:
+            yield {"error": f"API request failed: {str(e)}", "status_code": e.response.status_code}
+        except httpx.HTTPError as e:
+            yield {"error": f"API request failed: {str(e)}"}
+
+    async def aclose(self):
+        """Close all pooled connections."""
+        await self.client.aclose()
+
+
+class RequestScheduler:
+    """
+    Bounded-concurrency executor for API calls.
+
+    Every job holds a slot of the global semaphore and of its model's semaphore
+    while it runs, so fan-out across models or document chunks cannot oversubscribe
+    the upstream. Jobs are asyncio tasks and can be cancelled; each has a deadline
+    that covers both queueing and execution.
+    """
+
+    def __init__(self, max_concurrency=None, per_model_concurrency=None, model_concurrency=None):
+        """
+        Args:
+            max_concurrency (int, optional): Global limit on in-flight calls
+            per_model_concurrency (int, optional): Default limit per model ID
+            model_concurrency (dict, optional): Per model ID overrides
+        """
+        self.max_concurrency = max_concurrency or ASYNC_SETTINGS["max_concurrency"]
+        self.per_model_concurrency = per_model_concurrency or ASYNC_SETTINGS["per_model_concurrency"]
+        self.model_concurrency = dict(ASYNC_SETTINGS["model_concurrency"])
+        if model_concurrency:
+            self.model_concurrency.update(model_concurrency)
+
+        self._global = asyncio.Semaphore(self.max_concurrency)
+        self._per_model = {}
+        self._tasks = set()
+
+    def _model_semaphore(self, model_id):
+        if model_id not in self._per_model:
+            limit = self.model_concurrency.get(model_id, self.per_model_concurrency)
+            self._per_model[model_id] = asyncio.Semaphore(limit)
+        return self._per_model[model_id]
+
+    async def _run(self, model_id, coro_factory):
+        async with self._global:
+            async with self._model_semaphore(model_id):
+                return await coro_factory()
+
+    async def run(self, model_id, coro_factory, deadline=None):
+        """
+        Run one job under the concurrency limits.
+
+        Args:
+            model_id (str): Model the job calls, used for the per-model limit
+            coro_factory (callable): Zero-argument function returning the coroutine to run.
+                It is only called once a slot is free.
+            deadline (float, optional): Seconds allowed for queueing plus execution
+
+        Returns:
+            The job's result, or {"error": str} if the deadline passes
+        """
+        if deadline is None:
+            deadline = ASYNC_SETTINGS["default_deadline"]
+        try:
+            return await asyncio.wait_for(self._run(model_id, coro_factory), timeout=deadline)
+        except asyncio.TimeoutError:
+            return {"error": f"Request to {model_id} exceeded its {deadline:g}s deadline"}
+
+    def submit(self, model_id, coro_factory, deadline=None):
+        """
+        Schedule a job and return its task so the caller can await or cancel it.
+
+        Returns:
+            asyncio.Task: Task resolving to the job's result
+        """
+        task = asyncio.ensure_future(self.run(model_id, coro_factory, deadline))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def cancel_all(self):
+        """Cancel every job that has not finished yet."""
+        for task in list(self._tasks):
+            task.cancel()
+
+    def in_flight(self):
+        """Return the number of submitted jobs that have not finished."""
+        return len(self._tasks)
+
+
+class _BackgroundLoop:
+    """Event loop running in a daemon thread, shared by all sync callers."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="euron-async-loop", daemon=True)
+        self.thread.start()
+        self.client = None
+        self.scheduler = None
+
+    async def _init(self):
+        # httpx clients and semaphores must be created on the loop that uses them
+        self.client = AsyncEuronClient()
+        self.scheduler = RequestScheduler()
+
+    def run(self, coro, timeout=None):
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+
+_background = None
+_background_lock = threading.Lock()
+
+
+def _get_background():
+    global _background
+    if _background is None:
+        with _background_lock:
+            if _background is None:
+                background = _BackgroundLoop()
+                background.run(background._init())
+                _background = background
+    return _background
+
+
+def get_async_client():
+    """
+    Get the shared AsyncEuronClient. Only use it from coroutines passed to run_sync.
+
+    Returns:
+        AsyncEuronClient: Shared client bound to the background loop
+    """
+    return _get_background().client
+
+
+def get_scheduler():
+    """
+    Get the shared RequestScheduler. Only use it from coroutines passed to run_sync.
+
+    Returns:
+        RequestScheduler: Shared scheduler bound to the background loop
+    """
+    return _get_background().scheduler
+
+
+def submit_async(coro):
+    """
+    Start a coroutine on the shared background loop without waiting for it
+
+    Args:
+        coro: Coroutine to run
+
+    Returns:
+        concurrent.futures.Future: Future for the result; cancelling it cancels the coroutine
+    """
+    return asyncio.run_coroutine_threadsafe(coro, _get_background().loop)
+
+
+def run_sync(coro, timeout=None):
+    """
+    Run a coroutine on the shared background loop and wait for its result
+
+    Safe to call from Streamlit script threads, which have no running event loop.
+    If the wait is interrupted or times out, the coroutine is cancelled.
+
+    Args:
+        coro: Coroutine to run
+        timeout (float, optional): Seconds to wait for the result
+
+    Returns:
+        The coroutine's result
+    """
+    return _get_background().run(coro, timeout)
+
+
+def call_euron_api_many(requests, api_key, deadline=None):
+    """
+    Send several chat completion requests concurrently and wait for all of them
+
+    Each request passes the model's circuit breaker and the rate limits before it
+    is sent, waiting for rate-limit tokens up to its deadline, and its outcome is
+    recorded like that of any other chat request.
+
+    Args:
+        requests (list): Dicts with messages, model_id and optionally temperature and max_tokens
+        api_key (str): Euron API key (read it with api_utils.get_euron_api_key on the
+            calling thread; Streamlit secrets are not available on the background loop)
+        deadline (float, optional): Seconds allowed per request, including queueing
+
+    Returns:
+        list: One response dict per request, in the same order
+    """
+    if not api_key:
+        return [
+            {"error": "API key not found. Please add it to Streamlit secrets or enter it in the sidebar."}
+            for _ in requests
+        ]
+
+    async def send(client, request):
+        model_id = request["model_id"]
+        rejected = await admit_async(model_id, api_key, max_wait=deadline)
+        if rejected:
+            return {"error": rejected}
+        try:
+            response = await client.chat(
+                request["messages"],
+                model_id,
+                api_key,
+                temperature=request.get("temperature", 0.5),
+                max_tokens=request.get("max_tokens", 2000)
+            )
+        except asyncio.CancelledError:
+            # Deadline passed before an outcome; free a half-open probe slot
+            release_probe(model_id)
+            raise
+        if "error" in response:
+            record_outcome(model_id, response.get("status_code"), error=response["error"])
+        else:
+            record_outcome(model_id, 200, response["timing"]["total_ms"])
+        return response
+
+    async def gather():
+        client = get_async_client()
+        scheduler = get_scheduler()
+        tasks = [
+            scheduler.submit(request["model_id"], lambda request=request: send(client, request), deadline)
+            for request in requests
+        ]
+        try:
+            return await asyncio.gather(*tasks)
+        except asyncio.CancelledError:
+            for task in tasks:
+                task.cancel()
+            raise
+
+    return run_sync(gather())
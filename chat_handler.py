@@ -1,82 +1,211 @@
-import requests
-import base64
-import io
-from config import SPECIALIZED_MODELS, MODEL_CAPABILITIES
-from api_utils import call_euron_api
+from api_utils import call_euron_api, stream_euron_api, get_euron_api_key
+from hedging import hedged_stream
+from model_router import get_router, required_capabilities
+from context_builder import build_context, message_tokens, prompt_budget, ContextBudgetError
+from image_payload import prepare_image_part
+from image_store import ImageUnavailableError
+from retrieval import select_file_context, select_files_context
+from summarizer import is_summary_request, needs_map_reduce, summarize_document, SummaryError
+from table_store import answer_from_tables
 
-def handle_chat_message(user_input, message_history, selected_model_name, model_id, api_key, temperature, max_tokens, file_content=None, image=None):
+def is_error_response(response):
     """
-    Handles sending chat messages to the API and processing responses
+    Whether a reply from handle_chat_message is one of its error messages
+    
+    Args:
+        response (str): Full reply text
+        
+    Returns:
+        bool: True for "Error: ..." and "An error occurred: ..." replies, including
+            an error that ended a partly streamed reply
+    """
+    return response.startswith(("Error: ", "An error occurred: ")) or "\n\nError: " in response
+
+def model_latency_ms(timing):
+    """
+    The model's latency for a chat turn, as ModelStats measures live requests
+    
+    Args:
+        timing (dict, optional): Timing of the API response or the stream's done event
+        
+    Returns:
+        int: Time to first token for streams, time to the full response otherwise,
+            or None when the reply did not come from the model (cache hit or a
+            coalesced duplicate)
+    """
+    if not timing or timing.get("cache_hit") or timing.get("coalesced"):
+        return None
+    latency = timing.get("first_token_ms", timing.get("total_ms"))
+    return int(latency) if latency is not None else None
+
+def build_chat_request(user_input, message_history, selected_model_name, model_id, file_content=None, image=None, prefer_fastest=False, route_info=None, max_tokens=2000, tables=None, files=None):
+    """
+    Pick the model and assemble the messages array for a chat turn
     
     Args:
         user_input (str): The user's input message
         message_history (list): List of previous message objects
         selected_model_name (str): Display name of the selected model
         model_id (str): ID of the model to use
-        api_key (str): API key for authentication (legacy parameter, now uses secrets)
-        temperature (float): Temperature parameter for response generation
-        max_tokens (int): Maximum tokens for response
         file_content (str, optional): Content of uploaded file if any
-        image (PIL.Image, optional): Uploaded image if any
+        image (image_store.ImageRef, optional): Uploaded image if any
+        prefer_fastest (bool): Route to the fastest healthy capable model even if the
+            selected one would do
+        route_info (dict, optional): Filled with the routing decision (see ModelRouter.route),
+            the context report under "context" (see context_builder.build_context),
+            the retrieval report under "retrieval" (see retrieval.select_file_context) and
+            for summaries of large documents the report under "summary"
+            (see summarizer.summarize_document), and any locally computed table results
+            under "table_results"
+        max_tokens (int): Tokens reserved for the response
+        tables (list, optional): Stored tables of the upload (file_details["tables"])
+        files (list, optional): Name and content of each uploaded document when several
+            were uploaded (see ingestion.uploaded_documents); file_content is then
+            their combined text
         
     Returns:
-        str: The AI's response
+        tuple: (model_id, messages) to send to the API
+        
+    Raises:
+        ContextBudgetError: If the request cannot fit the model's token budget
+        SummaryError: If a map-reduce summary of a large document failed
+        ImageUnavailableError: If the uploaded image is no longer stored
     """
-    # Check if we need to switch models based on content or image presence
-    if file_content and "code" in file_content.lower():
-        if not MODEL_CAPABILITIES.get(selected_model_name, {}).get("Code Generation", False):
-            model_id = SPECIALIZED_MODELS["code_analysis"]
-    
-    if image and not MODEL_CAPABILITIES.get(selected_model_name, {}).get("Image Analysis", False):
-        model_id = SPECIALIZED_MODELS["image_analysis"]
-    
-    # Create the messages array for the API
-    messages = []
-    
-    # Add system message if there's a file to analyze
-    if file_content:
-        messages.append({
-            "role": "system",
-            "content": f"The user has uploaded a file with the following content. Please help analyze or respond to queries about it:\n\n{file_content}"
-        })
+    # Route on capabilities and measured latency/health rather than the selection alone
+    decision = get_router().route(required_capabilities(file_content, image), model_id, prefer_fastest)
+    model_id = decision["model_id"]
+    if route_info is not None:
+        route_info.update(decision)
+    
+    query_parts = []
     
-    # Handle image if present
+    # Data questions about an uploaded table are computed exactly on the stored
+    # columns; the model gets the results instead of guessing from a sample
+    table_results = answer_from_tables(tables, user_input)
+    if table_results:
+        query_parts.append({"role": "system", "content": table_results})
+        if route_info is not None:
+            route_info["table_results"] = table_results
+    
+    # Build the image part if an image is attached
     if image:
-        # Need to convert PIL Image to base64
-        buffered = io.BytesIO()
-        image.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
+        # Downsized and compressed once per image and model resolution, then reused;
+        # the full-resolution image is only decoded for the first encoding
+        image_part, image_report = prepare_image_part(image.open, model_id, content_hash=image.key)
+        if route_info is not None:
+            route_info["image"] = image_report
         
         # Add image message in a format suitable for models that accept images
         # This format is based on ChatGPT's vision format, adapt as needed for other APIs
-        messages.append({
+        query_parts.append({
             "role": "user",
             "content": [
                 {"type": "text", "text": "Here is an image the user uploaded:"},
-                {
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:image/png;base64,{img_str}"
-                    }
-                }
+                image_part
             ]
         })
     
-    # Add message history (limited to last 10 messages to avoid token limits)
-    # Skip the system message if it exists
-    start_idx = 1 if messages and messages[0]["role"] == "system" else 0
-    for msg in message_history[-10:]:
-        messages.append({
-            "role": msg["role"],
-            "content": msg["content"]
-        })
+    # The app appends the current input to the history before calling us
+    history = message_history
+    if history and history[-1]["role"] == "user" and history[-1]["content"] == user_input:
+        history = history[:-1]
     
-    # Add current user input if not already in message history
-    if message_history and message_history[-1]["role"] != "user":
-        messages.append({
-            "role": "user",
-            "content": user_input
-        })
+    # Excerpts cannot answer "summarize this": send the whole document when it fits
+    # the model's context, otherwise summarize all of it with map-reduce and answer
+    # from that summary instead
+    summary_request = bool(file_content) and is_summary_request(user_input)
+    if summary_request:
+        reserved = message_tokens({"role": "user", "content": user_input}) + sum(message_tokens(m) for m in query_parts)
+        if needs_map_reduce(file_content, model_id, max_tokens, reserved):
+            summary, summary_report = summarize_document(file_content, model_id, get_euron_api_key())
+            file_content = f"Summary of the full document, built from {summary_report['sections']} sections:\n\n{summary}"
+            if route_info is not None:
+                route_info["summary"] = summary_report
+    
+    # Large documents are indexed once and only the excerpts relevant to this
+    # question are sent, instead of the whole text on every turn. Several documents
+    # share one budget so a large one cannot crowd out the others.
+    if file_content and not summary_request:
+        if files and len(files) > 1:
+            file_content, retrieval_report = select_files_context(files, user_input)
+        else:
+            file_content, retrieval_report = select_file_context(file_content, user_input)
+        if route_info is not None:
+            route_info["retrieval"] = retrieval_report
+    
+    # Fill the model's token budget: current query and image, file content, then
+    # as much recent history as fits. Raises ContextBudgetError if even the query
+    # does not fit, so oversized requests never reach the network.
+    messages, context_report = build_context(
+        model_id,
+        max_tokens,
+        user_input,
+        history=history,
+        file_content=file_content,
+        query_parts=query_parts
+    )
+    if route_info is not None:
+        route_info["context"] = context_report
+    
+    return model_id, messages
+
+def handle_chat_message(user_input, message_history, selected_model_name, model_id, api_key, temperature, max_tokens, file_content=None, image=None, stream=False, use_cache=None, hedge=False, prefer_fastest=False, route_info=None, tables=None, files=None):
+    """
+    Handles sending chat messages to the API and processing responses
+    
+    Args:
+        user_input (str): The user's input message
+        message_history (list): List of previous message objects
+        selected_model_name (str): Display name of the selected model
+        model_id (str): ID of the model to use
+        api_key (str): API key for authentication (legacy parameter, now uses secrets)
+        temperature (float): Temperature parameter for response generation
+        max_tokens (int): Maximum tokens for response
+        file_content (str, optional): Content of uploaded file if any
+        image (image_store.ImageRef, optional): Uploaded image if any
+        stream (bool): Return a generator of response deltas instead of the full text
+        use_cache (bool, optional): Use the response cache; by default only at temperature 0
+        hedge (bool): If the model is slow to start answering, also ask the next capable
+            model and keep whichever answers first (bypasses the response cache)
+        prefer_fastest (bool): Route to the fastest healthy capable model even if the
+            selected one would do
+        route_info (dict, optional): Filled with the routing decision (see ModelRouter.route),
+            the context report under "context" and the API timing under "timing"
+        tables (list, optional): Stored tables of the upload, used to compute exact
+            answers to data questions
+        files (list, optional): Each uploaded document's name and content when several
+            were uploaded
+        
+    Returns:
+        str or generator: The AI's response, or its text deltas as they arrive when stream is True
+    """
+    try:
+        model_id, messages = build_chat_request(user_input, message_history, selected_model_name, model_id,
+                                                file_content, image, prefer_fastest, route_info, max_tokens, tables, files)
+    except (ContextBudgetError, SummaryError, ImageUnavailableError) as e:
+        error = f"Error: {str(e)}"
+        return iter([error]) if stream else error
+    except Exception as e:
+        error = f"An error occurred: {str(e)}"
+        return iter([error]) if stream else error
+    
+    if hedge:
+        # Fall back in the router's order: fastest healthy candidates first
+        decision = route_info if route_info else get_router().route(required_capabilities(file_content, image), model_id)
+        # Fallbacks must also fit the assembled prompt within their own budget
+        needed = sum(message_tokens(m) for m in messages)
+        fallbacks = [
+            info["model_id"] for info in decision["candidates"]
+            if info["model_id"] != model_id and prompt_budget(info["model_id"], max_tokens) >= needed
+        ]
+        deltas = _deltas_from_events(
+            hedged_stream(messages, [model_id] + fallbacks, get_euron_api_key(), temperature, max_tokens),
+            route_info
+        )
+        return deltas if stream else "".join(deltas)
+    
+    if stream:
+        return _stream_chat_response(messages, model_id, temperature, max_tokens, use_cache, route_info)
     
     try:
         # Call the Euron API using our utility function
@@ -84,9 +213,13 @@ def handle_chat_message(user_input, message_history, selected_model_name, model_
             messages=messages,
             model_id=model_id,
             temperature=temperature,
-            max_tokens=max_tokens
+            max_tokens=max_tokens,
+            use_cache=use_cache
         )
         
+        if route_info is not None and "timing" in response_data:
+            route_info["timing"] = response_data["timing"]
+        
         # Check for errors in the response
         if "error" in response_data:
             return f"Error: {response_data['error']}"
@@ -100,3 +233,37 @@ def handle_chat_message(user_input, message_history, selected_model_name, model_
     
     except Exception as e:
         return f"An error occurred: {str(e)}"
+
+def _stream_chat_response(messages, model_id, temperature, max_tokens, use_cache=None, route_info=None):
+    """
+    Yield the assistant's reply text as it streams in
+    """
+    return _deltas_from_events(stream_euron_api(
+        messages=messages,
+        model_id=model_id,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        use_cache=use_cache
+    ), route_info)
+
+def _deltas_from_events(events, route_info=None):
+    """
+    Turn streaming API events into reply text fragments
+    
+    Errors are yielded as a final "Error: ..." fragment so the caller can render
+    them the same way as the non-streaming response. The done event's timing is
+    put in route_info["timing"].
+    """
+    received = False
+    for event in events:
+        if "done" in event and route_info is not None:
+            route_info["timing"] = event.get("timing")
+        if "error" in event:
+            yield f"\n\nError: {event['error']}" if received else f"Error: {event['error']}"
+            return
+        if "delta" in event:
+            received = True
+            yield event["delta"]
+    
+    if not received:
+        yield "Sorry, I couldn't generate a response. Please try again."
@@ -135,3 +135,214 @@ API_ENDPOINTS = {
 
 # Default model if none selected
 DEFAULT_MODEL = "gemini-2.5-pro-exp-03-25"
+
+# HTTP transport settings for calls to the Euron API
+HTTP_SETTINGS = {
+    "pool_connections": 4,        # Number of host pools to keep
+    "pool_maxsize": 16,           # Keep-alive connections per host
+    "pool_block": False,          # Open extra connections instead of waiting when the pool is busy
+    "connect_timeout": 5.0,       # Seconds to establish a connection
+    "read_timeout": 120.0,        # Seconds to wait between bytes from the server
+    "max_retries": 3,             # Retries for connection errors and retryable statuses
+    "backoff_base": 0.5,          # First retry waits up to this many seconds
+    "backoff_max": 8.0,           # Upper bound for a single backoff
+    "retry_statuses": (429, 500, 502, 503, 504)
+}
+
+# Limits for the asyncio client and request scheduler
+ASYNC_SETTINGS = {
+    "max_concurrency": 16,        # Calls in flight across all models
+    "per_model_concurrency": 4,   # Calls in flight per model unless overridden below
+    "model_concurrency": {},      # e.g. {"gpt-4.1-mini": 8}
+    "default_deadline": 180.0     # Seconds per call, including time spent queued
+}
+
+# Response cache for chat completions
+CACHE_SETTINGS = {
+    "enabled": True,
+    "memory_max_bytes": 32 * 1024 * 1024,   # In-process LRU tier
+    "db_path": "cache/responses.db",        # Persistent SQLite tier, "" to disable
+    "ttl_seconds": 7 * 24 * 3600            # Lifetime of persistent entries
+}
+
+# Client-side token-bucket rate limits
+RATE_LIMIT_SETTINGS = {
+    "model_rate": 2.0,            # Requests per second per model
+    "model_burst": 10,            # Burst allowance per model
+    "model_limits": {},           # Per model ID overrides: {"gpt-4.1-mini": (rate, burst)}
+    "key_rate": 5.0,              # Requests per second per API key
+    "key_burst": 20,              # Burst allowance per API key
+    "max_wait": 5.0               # Seconds a request may wait for a token before failing
+}
+
+# Per-model circuit breaker
+CIRCUIT_BREAKER_SETTINGS = {
+    "failure_threshold": 5,       # Consecutive failures (or SLO breaches) that open the circuit
+    "latency_slo_ms": 60000,      # Responses slower than this count as failures
+    "probe_interval": 30.0        # Seconds before a half-open probe is let through
+}
+
+# Rolling per-model latency and error statistics
+MODEL_STATS_SETTINGS = {
+    "window_size": 200,           # Recent outcomes kept per model
+    "min_samples": 10             # Samples needed before a percentile is trusted
+}
+
+# Hedged requests: send a duplicate to the next capable model when the first is slow
+HEDGING_SETTINGS = {
+    "percentile": 0.95,           # Hedge once the primary is slower than this percentile
+    "default_delay_ms": 8000,     # Hedge delay while a model has too few samples
+    "min_delay_ms": 1000,         # Never hedge sooner than this
+    "max_hedges": 1               # Extra models that may be tried per request
+}
+
+# Database file used by DatabaseLogger for chat logs
+LOG_DB_PATH = "logs/chat_logs.db"
+
+# Background writer for the chat log database
+DB_LOG_SETTINGS = {
+    "queue_size": 10000,          # Log records waiting to be written
+    "batch_size": 256,            # Records committed per transaction at most
+    "flush_interval": 0.5,        # Seconds a record may wait for its batch to fill
+    "put_timeout": 0.05,          # Seconds a full queue blocks a caller before the record is dropped
+    "synchronous": "NORMAL",      # SQLite synchronous pragma; NORMAL is durable enough with WAL
+    "cache_kb": 8192,             # SQLite page cache per connection
+    "busy_timeout_ms": 5000       # Wait this long for another connection's lock
+}
+
+# Hourly and daily per-model rollups of the chat log
+ROLLUP_SETTINGS = {
+    "latency_relative_error": 0.02  # Latency histogram accuracy; rebuild the rollups after changing it
+}
+
+# Model routing
+ROUTER_SETTINGS = {
+    "max_error_rate": 0.5         # Models failing more often than this are treated as unhealthy
+}
+
+# Token budget per model for a whole request (prompt + max_tokens). Kept below the
+# models' context windows so a single request cannot grow without bound.
+MODEL_CONTEXT_BUDGETS = {
+    "gpt-4.1-nano": 128000,
+    "gpt-4.1-mini": 128000,
+    "gemini-2.5-pro-exp-03-25": 128000,
+    "gemini-2.0-flash-001": 128000,
+    "gemini-2.0-flash-exp": 128000,
+    "llama-4-scout-17b-16e-instruct": 128000,
+    "llama-4-maverick-17b-128e-instruct": 128000,
+    "llama-3.3-70b-versatile": 128000,
+    "deepseek-r1-distill-llama-70b": 128000,
+    "qwen-qwq-32b": 128000,
+    "mistral-saba-24b": 32000,
+    "default": 32000
+}
+
+# Context assembly
+CONTEXT_SETTINGS = {
+    "tokens_per_message": 4,      # Role and framing overhead per message
+    "tokens_per_image": 1000,     # Allowance for an attached image
+    "max_history_messages": None, # Optional cap on history messages; None fills the budget
+    "token_cache_size": 4096      # Messages whose token counts are remembered
+}
+
+# Preparation of uploaded images for vision requests
+IMAGE_PAYLOAD_SETTINGS = {
+    "max_dimension": 1536,                  # Largest side sent to a model, in pixels
+    "model_max_dimension": {},              # Per model ID overrides
+    "format": "JPEG",                       # "JPEG", "WEBP" or "PNG"
+    "quality": 85,                          # Encoder quality for JPEG/WEBP
+    "cache_max_bytes": 64 * 1024 * 1024     # Encoded payloads kept in memory
+}
+
+# Uploaded images, stored once by content hash and decoded only when needed
+IMAGE_STORE_SETTINGS = {
+    "dir": "cache/images",                  # Original bytes and thumbnails, "" to keep them in memory only
+    "memory_max_bytes": 64 * 1024 * 1024,   # Recently used bytes kept in memory
+    "thumbnail_size": 512                   # Largest side of the display thumbnail, in pixels
+}
+
+# Background image generation
+IMAGE_GENERATION_SETTINGS = {
+    "size": "512x512",                      # Size requested from the image API
+    "max_variants": 4,                      # Largest n the UI offers
+    "max_download_bytes": 20 * 1024 * 1024, # Generated images larger than this are rejected
+    "download_timeout": (5.0, 30.0),        # (connect, read) seconds for fetching a generated image
+    "cache_dir": "cache/generated",         # Generated images by model, prompt and size, "" to disable
+    "workers": 2,                           # Generation jobs run at the same time
+    "job_ttl": 3600,                        # Seconds a finished job is kept for polling
+    "poll_interval": 1.0                    # Seconds between UI checks on running jobs
+}
+
+# Cache of parsed uploads, keyed by content hash
+FILE_CACHE_SETTINGS = {
+    "memory_max_bytes": 256 * 1024 * 1024,  # Shared by all sessions in the process
+    "disk_dir": "cache/files"               # Pickled results, "" to keep them in memory only
+}
+
+# Process pool shared by the CPU-bound file parsers
+WORKER_SETTINGS = {
+    "processes": None,            # Worker processes, None for one per CPU
+    # Workers must not be forked from the multithreaded server: a lock held by
+    # another thread at fork time (logging, the log writer, HTTP pools) stays
+    # locked in the child forever. "spawn" is used where forkserver is unavailable.
+    "start_method": "forkserver",
+    # Imported once by the forkserver, so workers start with the parsers and
+    # pandas already loaded instead of importing them on their first task
+    "preload": ["pdf_extractor", "excel_reader"]
+}
+
+# PDF text extraction
+PDF_SETTINGS = {
+    "pages_per_task": 16,         # Pages each worker extracts per task
+    "parallel_min_pages": 32,     # Smaller documents are extracted in-process
+    "max_pages": None,            # Only extract the first N pages, None for all
+    "max_chars": 2000000          # Stop extracting after this many characters
+}
+
+# Retrieval of relevant excerpts from large uploaded documents (BM25)
+RETRIEVAL_SETTINGS = {
+    "min_file_tokens": 4000,      # Smaller documents are sent whole
+    "chunk_tokens": 300,          # Target size of an indexed chunk
+    "context_tokens": 3000,       # Excerpt tokens sent per question
+    "top_k": 10,                  # Most chunks sent per question
+    "k1": 1.5,                    # BM25 term frequency saturation
+    "b": 0.75,                    # BM25 length normalization
+    "index_cache_size": 32        # Document indexes kept in memory
+}
+
+# Map-reduce summaries of documents too large to send whole
+SUMMARY_SETTINGS = {
+    "section_tokens": 3000,       # Size of each section summarized in the map step
+    "summary_max_tokens": 600,    # Response limit for each summary request
+    "reduce_input_tokens": 6000,  # Summaries combined per request in the reduce steps
+    "deadline": 120.0             # Seconds per summary request, including queueing
+}
+
+# Streaming profile of uploaded CSV files
+CSV_PROFILE_SETTINGS = {
+    "chunk_rows": 100000,             # Rows read per chunk
+    "sample_size": 10000,             # Values sampled per column for quantiles
+    "quantiles": [0.25, 0.5, 0.75],   # Quantiles reported per numeric column
+    "hll_precision": 14               # HyperLogLog registers = 2**precision (~0.8% error)
+}
+
+# Streaming summary of uploaded Excel workbooks
+EXCEL_SETTINGS = {
+    "max_rows_per_sheet": 1000000,  # Data rows read per sheet at most
+    "chunk_rows": 50000             # Rows converted to a DataFrame at a time
+}
+
+# Columnar store of uploaded tables for exact local answers
+TABLE_SETTINGS = {
+    "dir": "cache/tables",        # One directory of .npy columns per table
+    "open_tables": 16,            # Opened tables kept per process
+    "max_groups": 20,             # Groups listed in a group-by result
+    "convert_block_rows": 1000000 # Rows re-encoded at a time when a column turns out not to be numeric
+}
+
+# Multi-file uploads
+INGEST_SETTINGS = {
+    "max_threads": 8,             # Files parsed at the same time
+    "context_tokens": 6000,       # Prompt tokens shared by all uploaded documents
+    "poll_interval": 0.2          # Seconds between progress updates while parsing
+}
@@ -0,0 +1,171 @@
+import math
+import re
+from functools import lru_cache
+
+from config import MODEL_CONTEXT_BUDGETS, CONTEXT_SETTINGS
+
+# Word pieces and individual punctuation marks, roughly how BPE tokenizers split text
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+FILE_PREAMBLE = "The user has uploaded a file with the following content. Please help analyze or respond to queries about it:\n\n"
+TRUNCATION_NOTE = "\n\n[File content truncated to fit the model's context budget]"
+
+
+class ContextBudgetError(Exception):
+    """Raised when the mandatory parts of a request do not fit the model's token budget."""
+
+
+def count_tokens(text):
+    """
+    Approximate the number of tokens in a piece of text
+
+    Counts one token per punctuation mark and one per four characters of each
+    word, which tracks common BPE tokenizers closely enough for budgeting.
+
+    Args:
+        text (str): Text to measure
+
+    Returns:
+        int: Estimated token count
+    """
+    return sum(math.ceil(len(piece) / 4) for piece in _TOKEN_PATTERN.findall(text))
+
+
+@lru_cache(maxsize=CONTEXT_SETTINGS["token_cache_size"])
+def estimate_tokens(text):
+    """
+    count_tokens() cached per text, so history messages are only counted once
+
+    Use count_tokens() directly for one-off pieces such as document chunks.
+    """
+    return count_tokens(text)
+
+
+def message_tokens(message):
+    """
+    Approximate the tokens a chat message takes, including per-message overhead
+
+    Args:
+        message (dict): Message object with role and content (text or a list of parts)
+
+    Returns:
+        int: Estimated token count
+    """
+    tokens = CONTEXT_SETTINGS["tokens_per_message"]
+    content = message["content"]
+    if isinstance(content, str):
+        return tokens + estimate_tokens(content)
+    for part in content:
+        if part.get("type") == "text":
+            tokens += estimate_tokens(part["text"])
+        elif part.get("type") == "image_url":
+            tokens += CONTEXT_SETTINGS["tokens_per_image"]
+    return tokens
+
+
+def prompt_budget(model_id, max_tokens):
+    """
+    Tokens available for the prompt of a request
+
+    Args:
+        model_id (str): ID of the model
+        max_tokens (int): Tokens reserved for the response
+
+    Returns:
+        int: Budget for all request messages
+    """
+    budget = MODEL_CONTEXT_BUDGETS.get(model_id, MODEL_CONTEXT_BUDGETS["default"])
+    return budget - max_tokens
+
+
+def _truncate_to_tokens(text, tokens):
+    """Cut text so that count_tokens() of the result is at most tokens."""
+    if tokens <= 0:
+        return ""
+    total = count_tokens(text)
+    if total <= tokens:
+        return text
+    # Start from the proportional cut, then tighten until it fits
+    end = int(len(text) * tokens / total)
+    while end > 0 and count_tokens(text[:end]) > tokens:
+        end = int(end * 0.9)
+    return text[:end]
+
+
+def build_context(model_id, max_tokens, current_query, history=None, file_content=None, system_prompt=None, query_parts=None):
+    """
+    Assemble request messages within the model's token budget
+
+    Parts are admitted in priority order: system prompt, current query (and any
+    attached parts such as an image), file content, then history from the most
+    recent message backwards. File content is truncated if only part of it fits;
+    older history is dropped.
+
+    Args:
+        model_id (str): ID of the model the request goes to
+        max_tokens (int): Tokens reserved for the response
+        current_query (str): The user's current message
+        history (list, optional): Previous messages, oldest first, without the current query
+        file_content (str, optional): Content of uploaded file if any
+        system_prompt (str, optional): Instructions placed first in the request
+        query_parts (list, optional): Extra messages sent just before the current query,
+            e.g. an uploaded image
+
+    Returns:
+        tuple: (messages, report) where report has budget, used, file_truncated,
+            history_included and history_dropped
+
+    Raises:
+        ContextBudgetError: If the system prompt and current query alone exceed the budget
+    """
+    budget = prompt_budget(model_id, max_tokens)
+    history = history or []
+    query_parts = query_parts or []
+
+    system_messages = []
+    if system_prompt:
+        system_messages.append({"role": "system", "content": system_prompt})
+    query_message = {"role": "user", "content": current_query}
+
+    used = sum(message_tokens(m) for m in system_messages + query_parts) + message_tokens(query_message)
+    if used > budget:
+        raise ContextBudgetError(
+            f"The request needs about {used} tokens but {model_id} allows {budget} "
+            f"with max_tokens={max_tokens}. Shorten the message or lower Max Tokens."
+        )
+
+    file_truncated = False
+    if file_content:
+        file_message = {"role": "system", "content": FILE_PREAMBLE + file_content}
+        file_cost = message_tokens(file_message)
+        if used + file_cost > budget:
+            overhead = message_tokens({"role": "system", "content": FILE_PREAMBLE + TRUNCATION_NOTE})
+            kept = _truncate_to_tokens(file_content, budget - used - overhead)
+            file_message = {"role": "system", "content": FILE_PREAMBLE + kept + TRUNCATION_NOTE}
+            file_cost = message_tokens(file_message)
+            file_truncated = True
+        system_messages.append(file_message)
+        used += file_cost
+
+    included = []
+    max_history = CONTEXT_SETTINGS["max_history_messages"]
+    for message in reversed(history):
+        if max_history is not None and len(included) >= max_history:
+            break
+        entry = {"role": message["role"], "content": message["content"]}
+        cost = message_tokens(entry)
+        if used + cost > budget:
+            break
+        included.append(entry)
+        used += cost
+    included.reverse()
+
+    messages = system_messages + query_parts + included + [query_message]
+    report = {
+        "budget": budget,
+        "used": used,
+        "file_truncated": file_truncated,
+        "history_included": len(included),
+        "history_dropped": len(history) - len(included)
+    }
+    return messages, report
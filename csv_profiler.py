@@ -0,0 +1,268 @@
+import numpy as np
+import pandas as pd
+
+from config import CSV_PROFILE_SETTINGS
+from table_store import store_chunks
+
+
+def _bit_length(values):
+    """Bit length of each uint64, computed exactly on 32-bit halves."""
+    high = (values >> np.uint64(32)).astype(np.float64)
+    low = (values & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    return np.where(high > 0, 32 + np.frexp(high)[1], np.frexp(low)[1])
+
+
+class HyperLogLog:
+    """
+    Approximate distinct counter with 2**precision one-byte registers.
+
+    The standard error is about 1.04 / sqrt(2**precision), 0.8% at precision 14,
+    whatever the number of values added.
+    """
+
+    def __init__(self, precision=None):
+        self.precision = precision or CSV_PROFILE_SETTINGS["hll_precision"]
+        self.registers = np.zeros(1 << self.precision, dtype=np.uint8)
+
+    def add_hashes(self, hashes):
+        """
+        Add values by their 64-bit hashes
+
+        Args:
+            hashes (numpy.ndarray): uint64 hashes, e.g. from pandas.util.hash_array
+        """
+        if not len(hashes):
+            return
+        suffix_bits = 64 - self.precision
+        index = (hashes >> np.uint64(suffix_bits)).astype(np.intp)
+        suffix = hashes & np.uint64((1 << suffix_bits) - 1)
+        # Position of the leftmost 1 bit in the remaining bits, counting from 1
+        rank = (suffix_bits - _bit_length(suffix) + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def count(self):
+        """
+        Estimated number of distinct values added
+
+        Returns:
+            int: Distinct count estimate
+        """
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate while many registers are still empty
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+
+class ReservoirSample:
+    """
+    Fixed-size uniform sample of a stream of numbers, for approximate quantiles.
+
+    Every value gets a random key and the values with the smallest keys are kept
+    (bottom-k sampling), which is equivalent to reservoir sampling and can be
+    updated a whole chunk at a time.
+    """
+
+    def __init__(self, size=None, seed=0):
+        self.size = size or CSV_PROFILE_SETTINGS["sample_size"]
+        self.values = np.empty(0, dtype=np.float64)
+        self.keys = np.empty(0, dtype=np.float64)
+        self._random = np.random.default_rng(seed)
+
+    def add(self, values):
+        """
+        Offer a chunk of values to the sample
+
+        Args:
+            values (numpy.ndarray): Non-null numeric values
+        """
+        if not len(values):
+            return
+        values = np.concatenate([self.values, values.astype(np.float64)])
+        keys = np.concatenate([self.keys, self._random.random(len(values) - len(self.keys))])
+        if len(values) > self.size:
+            keep = np.argpartition(keys, self.size)[:self.size]
+            values, keys = values[keep], keys[keep]
+        self.values, self.keys = values, keys
+
+    def quantiles(self, qs):
+        """
+        Approximate quantiles of everything offered so far
+
+        Args:
+            qs (list): Quantiles between 0 and 1
+
+        Returns:
+            list: One value per quantile, or None values if the sample is empty
+        """
+        if not len(self.values):
+            return [None] * len(qs)
+        return [float(v) for v in np.quantile(self.values, qs)]
+
+
+class ColumnProfile:
+    """Running statistics of one table column, updated one chunk at a time."""
+
+    def __init__(self, name):
+        self.name = name
+        self.dtypes = []
+        self.count = 0
+        self.nulls = 0
+        self.minimum = None
+        self.maximum = None
+        self.total = 0.0
+        self.numeric_count = 0
+        self.sample = ReservoirSample()
+        self.distinct = HyperLogLog()
+
+    def update(self, series):
+        """Fold a chunk of the column into the statistics."""
+        if series.dtype not in self.dtypes:
+            self.dtypes.append(series.dtype)
+        values = series.dropna()
+        self.count += len(values)
+        self.nulls += len(series) - len(values)
+        if not len(values):
+            return
+
+        if pd.api.types.is_numeric_dtype(values.dtype) and not pd.api.types.is_bool_dtype(values.dtype):
+            array = values.to_numpy(dtype=np.float64)
+            low, high = float(array.min()), float(array.max())
+            self.minimum = low if self.minimum is None else min(self.minimum, low)
+            self.maximum = high if self.maximum is None else max(self.maximum, high)
+            self.total += float(array.sum())
+            self.numeric_count += len(array)
+            self.sample.add(array)
+            # Hash numbers as float64 so 1 and 1.0 count once across chunks
+            self.distinct.add_hashes(pd.util.hash_array(array, categorize=False))
+        else:
+            array = values.astype(str).to_numpy(dtype=object)
+            self.distinct.add_hashes(pd.util.hash_array(array, categorize=False))
+
+    @property
+    def dtype(self):
+        """Common dtype of every chunk, as pandas would infer it for the whole file."""
+        if len(self.dtypes) == 1:
+            return self.dtypes[0]
+        if all(pd.api.types.is_numeric_dtype(d) and not pd.api.types.is_bool_dtype(d) for d in self.dtypes):
+            return np.result_type(*self.dtypes)
+        return np.dtype(object)
+
+    def summary(self):
+        """
+        Statistics of the column
+
+        Returns:
+            dict: name, dtype, count, nulls, distinct, and for numeric columns min,
+                max, mean and the configured quantiles (approximate)
+        """
+        stats = {
+            "name": self.name,
+            "dtype": str(self.dtype),
+            "count": self.count,
+            "nulls": self.nulls,
+            "distinct": min(self.distinct.count(), self.count)
+        }
+        # Numbers seen in a column that later turned out to be text are not meaningful
+        if self.numeric_count and self.dtype != np.dtype(object):
+            stats["min"] = self.minimum
+            stats["max"] = self.maximum
+            stats["mean"] = self.total / self.numeric_count
+            qs = CSV_PROFILE_SETTINGS["quantiles"]
+            stats["quantiles"] = dict(zip(qs, self.sample.quantiles(qs)))
+        return stats
+
+
+def profile_csv(source, chunk_rows=None, table_writer=None):
+    """
+    Profile a CSV file in one pass with bounded memory
+
+    The file is read chunk_rows rows at a time; only running totals, a fixed-size
+    sample and HyperLogLog registers are kept per column, so memory does not grow
+    with the number of rows.
+
+    Args:
+        source: Path or file-like object accepted by pandas.read_csv
+        chunk_rows (int, optional): Rows per chunk, defaults to CSV_PROFILE_SETTINGS
+        table_writer (table_store.TableWriter, optional): Also store the table in the same pass
+
+    Returns:
+        dict: rows, columns (list of ColumnProfile.summary() dicts) and head
+            (DataFrame of the first five rows)
+    """
+    chunk_rows = chunk_rows or CSV_PROFILE_SETTINGS["chunk_rows"]
+    with pd.read_csv(source, chunksize=chunk_rows) as reader:
+        return profile_chunks(store_chunks(reader, table_writer) if table_writer else reader)
+
+
+def profile_chunks(chunks):
+    """
+    Profile a table delivered as a sequence of DataFrame chunks with the same columns
+
+    Args:
+        chunks: Iterable of DataFrames
+
+    Returns:
+        dict: rows, columns and head as returned by profile_csv()
+    """
+    profiles = {}
+    head = None
+    rows = 0
+    for chunk in chunks:
+        if head is None:
+            head = chunk.head()
+            profiles = {name: ColumnProfile(name) for name in chunk.columns}
+        rows += len(chunk)
+        for name in chunk.columns:
+            profiles[name].update(chunk[name])
+
+    return {
+        "rows": rows,
+        "columns": [profile.summary() for profile in profiles.values()],
+        "head": head if head is not None else pd.DataFrame()
+    }
+
+
+def _format_number(value):
+    if value is None:
+        return "n/a"
+    return f"{value:.6g}"
+
+
+def format_profile(profile, title="CSV File Summary"):
+    """
+    Render a profile as the CSV summary text sent to the model
+
+    Args:
+        profile (dict): Result of profile_csv()
+        title (str): First line of the summary
+
+    Returns:
+        str: Shape, columns, dtypes with non-null counts, sample rows and column statistics
+    """
+    columns = profile["columns"]
+    dtype_lines = [f"{'#':>3}  {'Column':<30} {'Non-Null Count':>14}  Dtype"]
+    for i, column in enumerate(columns):
+        dtype_lines.append(f"{i:>3}  {str(column['name']):<30} {column['count']:>14}  {column['dtype']}")
+
+    stat_lines = []
+    for column in columns:
+        line = f"- {column['name']}: {column['nulls']} nulls, ~{column['distinct']} distinct"
+        if "mean" in column:
+            quantiles = ", ".join(f"p{q * 100:g} {_format_number(v)}" for q, v in column["quantiles"].items())
+            line += (
+                f", min {_format_number(column['min'])}, max {_format_number(column['max'])}, "
+                f"mean {_format_number(column['mean'])}, {quantiles}"
+            )
+        stat_lines.append(line)
+
+    summary = f"{title}:\n\n"
+    summary += f"Shape: {profile['rows']} rows, {len(columns)} columns\n"
+    summary += f"Columns: {', '.join(str(column['name']) for column in columns)}\n\n"
+    summary += f"Data Types:\n" + "\n".join(dtype_lines) + "\n\n"
+    summary += f"Sample Data (first 5 rows):\n{profile['head'].to_string()}\n\n"
+    summary += "Column Statistics (distinct counts and quantiles are approximate):\n" + "\n".join(stat_lines)
+    return summary
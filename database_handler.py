@@ -3,76 +3,194 @@ import json
 import datetime
 import os
 import uuid
+import atexit
+import queue
+import threading
+import time
+from config import DB_LOG_SETTINGS, LOG_DB_PATH
+from db_migrations import migrate
+from db_rollups import update_rollups, usage_by_model
+
+# Columns of an interaction record, in the order log_interaction writes them and
+# get_session_interactions returns them
+INTERACTION_COLUMNS = (
+    "interaction_id", "session_id", "timestamp", "model_name", "model_id", "temperature", "max_tokens",
+    "user_query", "model_response", "has_file", "file_name", "has_image", "execution_time_ms"
+)
+
+# Written columns: the interaction record, whether the turn failed, and the
+# model's own latency (what ModelStats samples) where one was measured
+_INSERT_COLUMNS = INTERACTION_COLUMNS + ("is_error", "latency_ms")
+
+_FLUSH = "flush"
+_STOP = "stop"
+
+
+def now_ms():
+    """Current time as integer epoch milliseconds, the log database's timestamp format."""
+    return int(time.time() * 1000)
+
+
+def to_epoch_ms(value):
+    """Epoch milliseconds of a naive local datetime."""
+    return int(value.timestamp() * 1000)
+
+
+def format_timestamp(value):
+    """
+    Render a stored timestamp as local time
+    
+    Args:
+        value (int): Epoch milliseconds, or None
+        
+    Returns:
+        str: "YYYY-MM-DD HH:MM:SS.ffffff", or None
+    """
+    if value is None:
+        return None
+    return datetime.datetime.fromtimestamp(value / 1000).strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+def _connect(db_path, check_same_thread=True):
+    """Open a connection in WAL mode with the DB_LOG_SETTINGS pragmas."""
+    conn = sqlite3.connect(db_path, check_same_thread=check_same_thread)
+    # WAL lets readers (db_tool, the router) work while the writer commits, and
+    # with synchronous=NORMAL a commit no longer waits for an fsync
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA synchronous={DB_LOG_SETTINGS['synchronous']}")
+    conn.execute(f"PRAGMA cache_size={-int(DB_LOG_SETTINGS['cache_kb'])}")
+    conn.execute(f"PRAGMA busy_timeout={int(DB_LOG_SETTINGS['busy_timeout_ms'])}")
+    return conn
 
 class DatabaseLogger:
-    """Class to handle logging of chat interactions to a database."""
+    """
+    Class to handle logging of chat interactions to a database.
     
-    def __init__(self, db_path="logs/chat_logs.db"):
-        """Initialize the database connection and create tables if they don't exist."""
+    With background=True, log_session and log_interaction only put the record on
+    a bounded queue; a writer thread with its own connection commits records in
+    batches, so a chat turn never waits for the disk. Read methods use the
+    logger's connection either way.
+    """
+    
+    def __init__(self, db_path="logs/chat_logs.db", background=False):
+        """
+        Initialize the database connection and create tables if they don't exist.
+        
+        Args:
+            db_path (str): Log database file
+            background (bool): Write log records from a background thread
+        """
         # Ensure logs directory exists
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
         
         self.db_path = db_path
-        self.conn = sqlite3.connect(db_path)
+        # A background logger is shared by every script thread; reads are serialized by _lock
+        self.conn = _connect(db_path, check_same_thread=not background)
         self.cursor = self.conn.cursor()
+        self._lock = threading.Lock()
         
         # Create tables if they don't exist
         self._create_tables()
+        
+        self.background = background
+        self._queue = None
+        self._writer = None
+        self.writer_stats = {"written": 0, "batches": 0, "dropped": 0, "errors": 0}
+        if background:
+            self._queue = queue.Queue(maxsize=DB_LOG_SETTINGS["queue_size"])
+            self._writer = threading.Thread(target=self._write_loop, name="db-log-writer", daemon=True)
+            self._writer.start()
     
     def _create_tables(self):
-        """Create necessary tables if they don't exist."""
-        # Sessions table to track unique chat sessions
-        self.cursor.execute('''
-        CREATE TABLE IF NOT EXISTS sessions (
-            session_id TEXT PRIMARY KEY,
-            start_time TIMESTAMP,
-            user_browser TEXT,
-            user_ip TEXT
-        )
-        ''')
-        
-        # Interactions table to log all queries and responses
-        self.cursor.execute('''
-        CREATE TABLE IF NOT EXISTS interactions (
-            interaction_id TEXT PRIMARY KEY,
-            session_id TEXT,
-            timestamp TIMESTAMP,
-            model_name TEXT,
-            model_id TEXT,
-            temperature REAL,
-            max_tokens INTEGER,
-            user_query TEXT,
-            model_response TEXT,
-            has_file BOOLEAN,
-            file_name TEXT,
-            has_image BOOLEAN,
-            execution_time_ms INTEGER,
-            FOREIGN KEY (session_id) REFERENCES sessions (session_id)
-        )
-        ''')
-        
-        self.conn.commit()
+        """Create the tables, or upgrade existing ones to the latest schema."""
+        migrate(self.conn)
+    
+    def _submit(self, kind, row):
+        """Queue a record for the writer, or write it now without one."""
+        if self._queue is None:
+            with self._lock:
+                self._execute_batch(self.conn, [(kind, row)])
+                self.conn.commit()
+            return
+        try:
+            # Backpressure: a full queue holds the caller briefly, then the record is dropped
+            self._queue.put((kind, row), timeout=DB_LOG_SETTINGS["put_timeout"])
+        except queue.Full:
+            self.writer_stats["dropped"] += 1
+    
+    @staticmethod
+    def _execute_batch(conn, records):
+        sessions = [row for kind, row in records if kind == "session"]
+        interactions = [row for kind, row in records if kind == "interaction"]
+        if sessions:
+            conn.executemany("INSERT OR IGNORE INTO sessions VALUES (?, ?, ?, ?)", sessions)
+        if interactions:
+            conn.executemany(
+                f"INSERT INTO interactions ({', '.join(_INSERT_COLUMNS)}) VALUES ({', '.join('?' * len(_INSERT_COLUMNS))})",
+                interactions
+            )
+            # Same transaction, so the rollups always agree with the raw rows
+            update_rollups(conn, [(row[2], row[3], row[4], row[12], row[13]) for row in interactions])
+    
+    def _write_loop(self):
+        """Writer thread: commit queued records in batches of up to batch_size, or every flush_interval."""
+        conn = _connect(self.db_path)
+        batch_size = DB_LOG_SETTINGS["batch_size"]
+        flush_interval = DB_LOG_SETTINGS["flush_interval"]
+        try:
+            while True:
+                item = self._queue.get()
+                records, events, stop = [], [], False
+                deadline = time.monotonic() + flush_interval
+                while True:
+                    if item[0] == _STOP:
+                        stop = True
+                    elif item[0] == _FLUSH:
+                        events.append(item[1])
+                    else:
+                        records.append(item)
+                    # A flush or stop request commits what has been gathered right away
+                    if stop or events or len(records) >= batch_size:
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                
+                if records:
+                    try:
+                        with conn:
+                            self._execute_batch(conn, records)
+                        self.writer_stats["written"] += len(records)
+                        self.writer_stats["batches"] += 1
+                    except sqlite3.Error:
+                        self.writer_stats["errors"] += 1
+                for event in events:
+                    event.set()
+                if stop:
+                    return
+        finally:
+            conn.close()
     
     def log_session(self, session_id, user_browser=None, user_ip=None):
         """Log a new session."""
-        self.cursor.execute(
-            "INSERT OR IGNORE INTO sessions VALUES (?, ?, ?, ?)",
-            (session_id, datetime.datetime.now(), user_browser, user_ip)
-        )
-        self.conn.commit()
+        self._submit("session", (session_id, now_ms(), user_browser, user_ip))
     
     def log_interaction(self, session_id, model_name, model_id, temperature, max_tokens, 
                          user_query, model_response, has_file=False, file_name=None, 
-                         has_image=False, execution_time_ms=0):
+                         has_image=False, execution_time_ms=0, is_error=False, latency_ms=None):
         """Log a chat interaction."""
         interaction_id = str(uuid.uuid4())
         
-        self.cursor.execute(
-            "INSERT INTO interactions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        self._submit(
+            "interaction",
             (
                 interaction_id,
                 session_id,
-                datetime.datetime.now(),
+                now_ms(),
                 model_name,
                 model_id,
                 temperature,
@@ -82,51 +200,99 @@ class DatabaseLogger:
                 has_file,
                 file_name,
                 has_image,
-                execution_time_ms
+                execution_time_ms,
+                is_error,
+                latency_ms
             )
         )
-        self.conn.commit()
         return interaction_id
     
+    def flush(self, timeout=None):
+        """
+        Wait until every record queued so far has been committed
+        
+        Args:
+            timeout (float, optional): Seconds to wait at most
+            
+        Returns:
+            bool: True if the records were committed in time
+        """
+        if self._writer is None or not self._writer.is_alive():
+            return True
+        done = threading.Event()
+        try:
+            self._queue.put((_FLUSH, done), timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+    
     def get_session_interactions(self, session_id):
         """Get all interactions for a specific session."""
-        self.cursor.execute(
-            "SELECT * FROM interactions WHERE session_id = ? ORDER BY timestamp",
-            (session_id,)
-        )
-        return self.cursor.fetchall()
+        with self._lock:
+            self.cursor.execute(
+                f"SELECT {', '.join(INTERACTION_COLUMNS)} FROM interactions WHERE session_id = ? ORDER BY timestamp",
+                (session_id,)
+            )
+            rows = self.cursor.fetchall()
+        # Timestamps come back as the local time strings earlier versions returned
+        return [row[:2] + (format_timestamp(row[2]),) + row[3:] for row in rows]
     
     def get_all_sessions(self, limit=100):
         """Get all sessions with optional limit."""
-        self.cursor.execute(
-            "SELECT * FROM sessions ORDER BY start_time DESC LIMIT ?",
-            (limit,)
-        )
-        return self.cursor.fetchall()
+        with self._lock:
+            self.cursor.execute(
+                "SELECT * FROM sessions ORDER BY start_time DESC LIMIT ?",
+                (limit,)
+            )
+            rows = self.cursor.fetchall()
+        return [(row[0], format_timestamp(row[1])) + row[2:] for row in rows]
     
     def get_stats(self):
         """Get basic usage statistics."""
         stats = {}
         
-        # Total number of sessions
-        self.cursor.execute("SELECT COUNT(*) FROM sessions")
-        stats["total_sessions"] = self.cursor.fetchone()[0]
-        
-        # Total number of interactions
-        self.cursor.execute("SELECT COUNT(*) FROM interactions")
-        stats["total_interactions"] = self.cursor.fetchone()[0]
+        with self._lock:
+            # Total number of sessions
+            self.cursor.execute("SELECT COUNT(*) FROM sessions")
+            stats["total_sessions"] = self.cursor.fetchone()[0]
+            
+            # Interaction totals come from the daily rollups: one row per model and day
+            model_usage = usage_by_model(self.conn)
+        stats["total_interactions"] = sum(row[1] for row in model_usage)
         
         # Most popular model
-        self.cursor.execute(
-            "SELECT model_name, COUNT(*) as count FROM interactions GROUP BY model_name ORDER BY count DESC LIMIT 1"
-        )
-        result = self.cursor.fetchone()
-        stats["most_popular_model"] = result[0] if result else None
-        stats["most_popular_model_count"] = result[1] if result else 0
+        stats["most_popular_model"] = model_usage[0][0] if model_usage else None
+        stats["most_popular_model_count"] = model_usage[0][1] if model_usage else 0
         
         return stats
     
     def close(self):
-        """Close the database connection."""
+        """Write any queued records, stop the writer and close the database connection."""
+        if self._writer is not None and self._writer.is_alive():
+            self._queue.put((_STOP, None))
+            self._writer.join()
         if self.conn:
             self.conn.close()
+            self.conn = None
+
+
+_db_logger = None
+_db_logger_lock = threading.Lock()
+
+
+def get_db_logger():
+    """
+    Get the process-wide background logger for LOG_DB_PATH, creating it on first use
+    
+    Queued records are written when the process exits normally.
+    
+    Returns:
+        DatabaseLogger: Shared logger with a background writer
+    """
+    global _db_logger
+    if _db_logger is None:
+        with _db_logger_lock:
+            if _db_logger is None:
+                _db_logger = DatabaseLogger(db_path=LOG_DB_PATH, background=True)
+                atexit.register(_db_logger.close)
+    return _db_logger
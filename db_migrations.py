@@ -0,0 +1,227 @@
+import sqlite3
+import time
+
+from db_rollups import create_rollup_tables, rebuild_rollups
+from db_search import create_search_index, fts5_available
+
+# Epoch milliseconds of a "YYYY-MM-DD HH:MM:SS[.ffffff]" local time string, as
+# written by DatabaseLogger before version 2; integer values are left as they are
+_EPOCH_MS_SQL = (
+    "CASE WHEN typeof({column}) = 'text' "
+    "THEN CAST(ROUND((julianday({column}, 'utc') - 2440587.5) * 86400000) AS INTEGER) "
+    "ELSE {column} END"
+)
+
+
+def _columns(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def _create_base_tables(conn):
+    """Tables as first released: TEXT primary keys and datetime strings."""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS sessions (
+        session_id TEXT PRIMARY KEY,
+        start_time TIMESTAMP,
+        user_browser TEXT,
+        user_ip TEXT
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS interactions (
+        interaction_id TEXT PRIMARY KEY,
+        session_id TEXT,
+        timestamp TIMESTAMP,
+        model_name TEXT,
+        model_id TEXT,
+        temperature REAL,
+        max_tokens INTEGER,
+        user_query TEXT,
+        model_response TEXT,
+        has_file BOOLEAN,
+        file_name TEXT,
+        has_image BOOLEAN,
+        execution_time_ms INTEGER,
+        FOREIGN KEY (session_id) REFERENCES sessions (session_id)
+    )
+    ''')
+
+
+def _compact_tables(conn):
+    """
+    Rebuild both tables with integer epoch-millisecond timestamps.
+
+    interactions gets an INTEGER PRIMARY KEY, which is the rowid itself: rows
+    are stored in insertion order and the separate index on the UUID primary
+    key goes away. The UUID is kept as a plain column.
+    """
+    if "id" not in _columns(conn, "interactions"):
+        conn.execute('''
+        CREATE TABLE interactions_v2 (
+            id INTEGER PRIMARY KEY,
+            interaction_id TEXT NOT NULL,
+            session_id TEXT,
+            timestamp INTEGER,
+            model_name TEXT,
+            model_id TEXT,
+            temperature REAL,
+            max_tokens INTEGER,
+            user_query TEXT,
+            model_response TEXT,
+            has_file INTEGER,
+            file_name TEXT,
+            has_image INTEGER,
+            execution_time_ms INTEGER,
+            FOREIGN KEY (session_id) REFERENCES sessions (session_id)
+        )
+        ''')
+        conn.execute(f'''
+        INSERT INTO interactions_v2 (
+            interaction_id, session_id, timestamp, model_name, model_id, temperature, max_tokens,
+            user_query, model_response, has_file, file_name, has_image, execution_time_ms
+        )
+        SELECT
+            interaction_id, session_id, {_EPOCH_MS_SQL.format(column="timestamp")}, model_name, model_id,
+            temperature, max_tokens, user_query, model_response, has_file, file_name, has_image,
+            execution_time_ms
+        FROM interactions
+        ORDER BY timestamp
+        ''')
+        conn.execute("DROP TABLE interactions")
+        conn.execute("ALTER TABLE interactions_v2 RENAME TO interactions")
+
+    conn.execute(f"UPDATE sessions SET start_time = {_EPOCH_MS_SQL.format(column='start_time')} "
+                 "WHERE typeof(start_time) = 'text'")
+
+
+def _add_indexes(conn):
+    """Indexes for per-session history, per-model statistics and date ranges."""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_interactions_session_time ON interactions (session_id, timestamp)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_interactions_model_name ON interactions (model_name)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_interactions_timestamp ON interactions (timestamp)")
+    # ModelRouter.seed_from_database reads the latest samples of each model
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_interactions_model_id_time ON interactions (model_id, timestamp)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_start_time ON sessions (start_time)")
+
+
+def _add_rollups(conn):
+    """Flag failed turns and build the per-model hourly and daily rollups from existing rows."""
+    if "is_error" not in _columns(conn, "interactions"):
+        conn.execute("ALTER TABLE interactions ADD COLUMN is_error INTEGER NOT NULL DEFAULT 0")
+    # Failed turns were only recorded as the error text chat_handler returns
+    conn.execute(
+        "UPDATE interactions SET is_error = 1 "
+        "WHERE model_response LIKE 'Error: %' OR model_response LIKE 'An error occurred:%' "
+        "OR model_response LIKE '%' || char(10, 10) || 'Error: %'"
+    )
+    create_rollup_tables(conn)
+    rebuild_rollups(conn)
+
+
+def _add_search_index(conn):
+    """Full-text index over queries and responses, backfilled from existing rows."""
+    # Builds without FTS5 keep logging; db_tool rebuild-search-index can add it later
+    if fts5_available(conn):
+        create_search_index(conn)
+
+
+def _add_model_latency(conn):
+    """
+    Column for the model's latency as the router measures it: time to first
+    token for streams, time to the full response otherwise. execution_time_ms
+    covers the whole turn, so older rows are left without one.
+    """
+    if "latency_ms" not in _columns(conn, "interactions"):
+        conn.execute("ALTER TABLE interactions ADD COLUMN latency_ms INTEGER")
+
+
+# Ordered (version, description, function) tuples. Each function must be safe to
+# run against a database that is already partly or fully in its target state.
+# Append new migrations; never edit or reorder released ones.
+MIGRATIONS = [
+    (1, "Create sessions and interactions tables", _create_base_tables),
+    (2, "Store timestamps as integer epoch milliseconds", _compact_tables),
+    (3, "Index interactions by session, model and time", _add_indexes),
+    (4, "Add error flags and hourly and daily per-model rollups", _add_rollups),
+    (5, "Add full-text search index over queries and responses", _add_search_index),
+    (6, "Record model latency separately from turn time", _add_model_latency),
+]
+
+
+def schema_version(conn):
+    """
+    Latest migration applied to a database
+
+    Args:
+        conn (sqlite3.Connection): Database connection
+
+    Returns:
+        int: Schema version, 0 for a database without a schema_version table
+    """
+    try:
+        row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return row[0] or 0
+
+
+def migrate(conn, migrations=None):
+    """
+    Upgrade a database in place to the latest schema
+
+    Pending migrations run in version order, each in its own IMMEDIATE
+    transaction together with its schema_version row, so a failure leaves the
+    database at the last completed version and concurrent processes apply each
+    migration once.
+
+    Args:
+        conn (sqlite3.Connection): Database connection with no open transaction
+        migrations (list, optional): (version, description, function) tuples,
+            defaults to MIGRATIONS
+
+    Returns:
+        list: Versions applied by this call
+    """
+    migrations = MIGRATIONS if migrations is None else migrations
+    applied = []
+    isolation_level = conn.isolation_level
+    # Manage transactions explicitly so DDL and data changes commit together
+    conn.isolation_level = None
+    try:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS schema_version ("
+            "version INTEGER PRIMARY KEY, description TEXT, applied_at INTEGER)"
+        )
+        for version, description, function in sorted(migrations, key=lambda migration: migration[0]):
+            if version <= schema_version(conn):
+                continue
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Another process may have applied it while we waited for the lock
+                if version > schema_version(conn):
+                    function(conn)
+                    conn.execute(
+                        "INSERT INTO schema_version VALUES (?, ?, ?)",
+                        (version, description, int(time.time() * 1000))
+                    )
+                    applied.append(version)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+    finally:
+        conn.isolation_level = isolation_level
+    return applied
+
+
+def applied_migrations(conn):
+    """
+    Migrations recorded in a database
+
+    Returns:
+        list: (version, description, applied_at epoch ms) tuples in version order
+    """
+    try:
+        return conn.execute("SELECT version, description, applied_at FROM schema_version ORDER BY version").fetchall()
+    except sqlite3.OperationalError:
+        return []
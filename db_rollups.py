@@ -0,0 +1,386 @@
+import datetime
+import math
+from collections import defaultdict
+from functools import lru_cache
+
+from config import ROLLUP_SETTINGS
+
+HOUR_MS = 3600 * 1000
+QUARTER_HOUR_MS = 900 * 1000
+
+# Log-spaced latency buckets: every value in bucket i lies in (gamma**(i-1), gamma**i],
+# so the bucket's midpoint is within latency_relative_error of any value in it.
+# Histograms with the same gamma merge by adding counts.
+_ALPHA = ROLLUP_SETTINGS["latency_relative_error"]
+GAMMA = (1 + _ALPHA) / (1 - _ALPHA)
+_LOG_GAMMA = math.log(GAMMA)
+
+# (period table, latency table, key column, key type)
+_PERIODS = (
+    ("rollup_hourly", "rollup_hourly_latency", "hour", "INTEGER"),
+    ("rollup_daily", "rollup_daily_latency", "day", "TEXT"),
+)
+
+
+def latency_bucket(latency_ms):
+    """
+    Histogram bucket of a latency
+
+    Args:
+        latency_ms (int): Latency in milliseconds
+
+    Returns:
+        int: Bucket index, 0 for 1 ms or less
+    """
+    if latency_ms is None or latency_ms <= 1:
+        return 0
+    return int(math.ceil(math.log(latency_ms) / _LOG_GAMMA))
+
+
+def bucket_latency(bucket):
+    """
+    Representative latency of a bucket
+
+    Returns:
+        float: Milliseconds, within latency_relative_error of every value in the bucket
+    """
+    if bucket <= 0:
+        return 1.0
+    return 2 * GAMMA ** bucket / (GAMMA + 1)
+
+
+def hour_of(timestamp):
+    """Start of the hour containing an epoch-ms timestamp, in epoch ms."""
+    return timestamp - timestamp % HOUR_MS
+
+
+@lru_cache(maxsize=4096)
+def _day_of_slot(slot):
+    return datetime.datetime.fromtimestamp(slot * QUARTER_HOUR_MS / 1000).strftime("%Y-%m-%d")
+
+
+def day_of(timestamp):
+    """Local date of an epoch-ms timestamp, as "YYYY-MM-DD"."""
+    # Every UTC offset is a multiple of 15 minutes, so local days start on a
+    # quarter-hour boundary and the date only needs computing once per quarter hour
+    return _day_of_slot(timestamp // QUARTER_HOUR_MS)
+
+
+def day_start(day):
+    """Epoch ms of local midnight starting a "YYYY-MM-DD" day."""
+    return int(datetime.datetime.strptime(day, "%Y-%m-%d").timestamp() * 1000)
+
+
+def _period_bounds(key, timestamp):
+    """(start epoch ms, end epoch ms) of the hour or local day containing a timestamp."""
+    if key == "hour":
+        start = hour_of(timestamp)
+        return start, start + HOUR_MS
+    day = datetime.datetime.strptime(day_of(timestamp), "%Y-%m-%d")
+    # Local days are not always 24 hours long, so step by date rather than by ms
+    return int(day.timestamp() * 1000), int((day + datetime.timedelta(days=1)).timestamp() * 1000)
+
+
+def _period_key(key, timestamp):
+    return hour_of(timestamp) if key == "hour" else day_of(timestamp)
+
+
+def create_rollup_tables(conn):
+    """Create the rollup tables if they don't exist."""
+    for table, latency_table, key, key_type in _PERIODS:
+        conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {table} (
+            {key} {key_type} NOT NULL,
+            model_name TEXT NOT NULL,
+            model_id TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            latency_sum INTEGER NOT NULL,
+            latency_max INTEGER NOT NULL,
+            errors INTEGER NOT NULL,
+            PRIMARY KEY ({key}, model_name, model_id)
+        )
+        ''')
+        conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {latency_table} (
+            {key} {key_type} NOT NULL,
+            model_name TEXT NOT NULL,
+            model_id TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY ({key}, model_name, model_id, bucket)
+        )
+        ''')
+
+
+def update_rollups(conn, rows, periods=_PERIODS):
+    """
+    Add interactions to the rollups, in the caller's transaction
+
+    Args:
+        conn (sqlite3.Connection): Log database connection
+        rows (list): (timestamp, model_name, model_id, execution_time_ms, is_error) tuples
+        periods (tuple, optional): Rollup tables to update, defaults to hourly and daily
+    """
+    for table, latency_table, key, _ in periods:
+        period_of = hour_of if key == "hour" else day_of
+        totals = defaultdict(lambda: [0, 0, 0, 0])
+        buckets = defaultdict(int)
+        for timestamp, model_name, model_id, latency, is_error in rows:
+            group = (period_of(timestamp), model_name or "", model_id or "")
+            latency = latency or 0
+            total = totals[group]
+            total[0] += 1
+            total[1] += latency
+            total[2] = max(total[2], latency)
+            total[3] += 1 if is_error else 0
+            buckets[group + (latency_bucket(latency),)] += 1
+
+        conn.executemany(
+            f"INSERT INTO {table} VALUES (?, ?, ?, ?, ?, ?, ?) "
+            f"ON CONFLICT ({key}, model_name, model_id) DO UPDATE SET "
+            "count = count + excluded.count, latency_sum = latency_sum + excluded.latency_sum, "
+            "latency_max = MAX(latency_max, excluded.latency_max), errors = errors + excluded.errors",
+            [group + tuple(total) for group, total in totals.items()]
+        )
+        conn.executemany(
+            f"INSERT INTO {latency_table} VALUES (?, ?, ?, ?, ?) "
+            f"ON CONFLICT ({key}, model_name, model_id, bucket) DO UPDATE SET count = count + excluded.count",
+            [group + (count,) for group, count in buckets.items()]
+        )
+
+
+_ROLLUP_QUERY = "SELECT timestamp, model_name, model_id, execution_time_ms, is_error FROM interactions"
+
+
+def _recompute_periods(conn, start_ms, end_ms=None):
+    """
+    Recompute from the raw rows every hourly and daily rollup overlapping
+    [start_ms, end_ms), in the caller's transaction
+
+    Each table is rebuilt over whole periods of its own: the hours and the
+    local days containing the range, which need not start at the same time
+    (with a half-hour UTC offset, local midnight falls mid-hour).
+
+    Returns:
+        int: Interactions rolled up
+    """
+    ranges = []
+    for period in _PERIODS:
+        table, latency_table, key, _ = period
+        low = _period_bounds(key, start_ms)[0]
+        high = _period_bounds(key, end_ms - 1)[1] if end_ms is not None else None
+        for name in (table, latency_table):
+            if high is None:
+                conn.execute(f"DELETE FROM {name} WHERE {key} >= ?", (_period_key(key, low),))
+            else:
+                conn.execute(f"DELETE FROM {name} WHERE {key} >= ? AND {key} <= ?",
+                             (_period_key(key, low), _period_key(key, high - 1)))
+        ranges.append((period, low, high))
+
+    # One pass over the raw rows covering every table's range
+    low = min(r[1] for r in ranges)
+    if end_ms is None:
+        cursor = conn.execute(_ROLLUP_QUERY + " WHERE timestamp >= ?", (low,))
+    else:
+        cursor = conn.execute(_ROLLUP_QUERY + " WHERE timestamp >= ? AND timestamp < ?",
+                              (low, max(r[2] for r in ranges)))
+    rolled = 0
+    while True:
+        rows = cursor.fetchmany(50000)
+        if not rows:
+            return rolled
+        for period, period_low, period_high in ranges:
+            update_rollups(conn, [
+                row for row in rows if row[0] >= period_low and (period_high is None or row[0] < period_high)
+            ], (period,))
+        rolled += len(rows)
+
+
+def rebuild_rollups(conn, since_ms=None):
+    """
+    Recompute the rollups from the interactions table, in the caller's transaction
+
+    Rollups are kept for raw rows that have since been deleted unless they fall
+    in the rebuilt range.
+
+    Args:
+        conn (sqlite3.Connection): Log database connection
+        since_ms (int, optional): Only rebuild from the start of the day containing
+            this epoch-ms timestamp
+
+    Returns:
+        int: Interactions rolled up
+    """
+    if since_ms is not None:
+        return _recompute_periods(conn, day_start(day_of(since_ms)))
+
+    for table, latency_table, _, _ in _PERIODS:
+        conn.execute(f"DELETE FROM {table}")
+        conn.execute(f"DELETE FROM {latency_table}")
+
+    # Stream the rows in batches so memory stays bounded by the number of groups
+    cursor = conn.execute(_ROLLUP_QUERY)
+    rolled = 0
+    while True:
+        rows = cursor.fetchmany(50000)
+        if not rows:
+            return rolled
+        update_rollups(conn, rows)
+        rolled += len(rows)
+
+
+def prune_rollups(conn, before_ms):
+    """
+    Remove deleted interactions from the rollups, in the caller's transaction
+
+    Call after deleting every interaction older than before_ms, in the same
+    transaction. Periods that ended by then are dropped; the hour and day
+    containing before_ms, which lost only some of their rows, are recomputed
+    from the rows that remain.
+
+    Args:
+        conn (sqlite3.Connection): Log database connection
+        before_ms (int): Epoch-ms cutoff of the deletion
+    """
+    for table, latency_table, key, _ in _PERIODS:
+        bound = _period_key(key, before_ms)
+        conn.execute(f"DELETE FROM {table} WHERE {key} < ?", (bound,))
+        conn.execute(f"DELETE FROM {latency_table} WHERE {key} < ?", (bound,))
+    _recompute_periods(conn, before_ms, before_ms + 1)
+
+
+def usage_by_model(conn):
+    """
+    Interactions, total latency, max latency and errors per model over all days
+
+    Returns:
+        list: (model_name, count, latency_sum, latency_max, errors) tuples, most used first
+    """
+    return conn.execute(
+        "SELECT model_name, SUM(count), SUM(latency_sum), MAX(latency_max), SUM(errors) "
+        "FROM rollup_daily GROUP BY model_name ORDER BY SUM(count) DESC"
+    ).fetchall()
+
+
+def usage_by_day(conn):
+    """
+    Interactions per local day
+
+    Returns:
+        list: (day, count) tuples in date order
+    """
+    return conn.execute("SELECT day, SUM(count) FROM rollup_daily GROUP BY day ORDER BY day").fetchall()
+
+
+def histogram_quantiles(buckets, quantiles, maximum=None):
+    """
+    Quantiles of a latency histogram
+
+    Args:
+        buckets (dict): Count per bucket index
+        quantiles (list): Quantiles between 0 and 1
+        maximum (int, optional): Exact largest value, caps the estimates
+
+    Returns:
+        list: Milliseconds per quantile, within latency_relative_error, or None
+            values for an empty histogram
+    """
+    total = sum(buckets.values())
+    if not total:
+        return [None] * len(quantiles)
+    ordered = sorted(buckets.items())
+    results = []
+    for q in quantiles:
+        rank = q * (total - 1)
+        seen = 0
+        for bucket, count in ordered:
+            seen += count
+            if seen > rank:
+                break
+        value = bucket_latency(bucket)
+        results.append(min(value, maximum) if maximum is not None else value)
+    return results
+
+
+def _window_label(window, hour=None, day=None):
+    if window == "hour":
+        return datetime.datetime.fromtimestamp(hour / 1000).strftime("%Y-%m-%d %H:00")
+    if window == "day":
+        return day if day is not None else day_of(hour)
+    return "all"
+
+
+def latency_percentiles(conn, since_ms=None, window="all", quantiles=(0.5, 0.9, 0.95, 0.99)):
+    """
+    Latency percentiles per model and time window, merged from the rollup histograms
+
+    Whole hours (or days, without since_ms) are read from the rollups by their
+    primary key; a partial first hour after since_ms is read from the raw rows
+    through the timestamp index. Memory is bounded by the number of windows,
+    models and buckets, not by the number of interactions.
+
+    Args:
+        conn (sqlite3.Connection): Log database connection
+        since_ms (int, optional): Only count interactions at or after this epoch-ms time
+        window (str): "all", "day" or "hour"
+        quantiles (tuple): Quantiles between 0 and 1
+
+    Returns:
+        list: Dicts with window, model_name, count, errors, one "p<q>" key per
+            quantile (e.g. p50, p99) and max, ordered by window then model
+    """
+    groups = defaultdict(lambda: {"count": 0, "errors": 0, "max": 0, "buckets": defaultdict(int)})
+
+    def add(label, model_name, count, errors, maximum):
+        group = groups[(label, model_name)]
+        group["count"] += count
+        group["errors"] += errors
+        group["max"] = max(group["max"], maximum)
+        return group
+
+    if since_ms is None and window != "hour":
+        # Daily rollups are enough: fewer rows than hourly ones
+        for day, model_name, count, maximum, errors in conn.execute(
+            "SELECT day, model_name, count, latency_max, errors FROM rollup_daily"
+        ):
+            add(_window_label(window, day=day), model_name, count, errors, maximum)
+        for day, model_name, bucket, count in conn.execute(
+            "SELECT day, model_name, bucket, count FROM rollup_daily_latency"
+        ):
+            groups[(_window_label(window, day=day), model_name)]["buckets"][bucket] += count
+    else:
+        first_hour = 0
+        if since_ms is not None:
+            first_hour = hour_of(since_ms)
+            if first_hour < since_ms:
+                # The partial first hour comes from the raw rows
+                first_hour += HOUR_MS
+                for timestamp, model_name, latency, is_error in conn.execute(
+                    "SELECT timestamp, model_name, execution_time_ms, is_error FROM interactions "
+                    "WHERE timestamp >= ? AND timestamp < ?",
+                    (since_ms, first_hour)
+                ):
+                    latency = latency or 0
+                    group = add(_window_label(window, hour=hour_of(timestamp)), model_name or "", 1,
+                                1 if is_error else 0, latency)
+                    group["buckets"][latency_bucket(latency)] += 1
+        for hour, model_name, count, maximum, errors in conn.execute(
+            "SELECT hour, model_name, count, latency_max, errors FROM rollup_hourly WHERE hour >= ?",
+            (first_hour,)
+        ):
+            add(_window_label(window, hour=hour), model_name, count, errors, maximum)
+        for hour, model_name, bucket, count in conn.execute(
+            "SELECT hour, model_name, bucket, count FROM rollup_hourly_latency WHERE hour >= ?",
+            (first_hour,)
+        ):
+            groups[(_window_label(window, hour=hour), model_name)]["buckets"][bucket] += count
+
+    results = []
+    for (label, model_name), group in sorted(groups.items()):
+        row = {"window": label, "model_name": model_name, "count": group["count"], "errors": group["errors"]}
+        values = histogram_quantiles(group["buckets"], quantiles, group["max"])
+        for q, value in zip(quantiles, values):
+            row[f"p{q * 100:g}"] = round(value) if value is not None else None
+        row["max"] = group["max"]
+        results.append(row)
+    return results
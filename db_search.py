@@ -0,0 +1,134 @@
+import re
+import sqlite3
+
+# External-content FTS5 index over interactions: the text is stored once, in
+# interactions, and the index is kept in sync by triggers, so inserts from the
+# log writer and deletes from db_tool cleanup both update it.
+_INDEX_SQL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS interactions_fts USING fts5("
+    "user_query, model_response, content='interactions', content_rowid='id', "
+    "tokenize='porter unicode61')"
+)
+
+_TRIGGERS_SQL = (
+    '''
+    CREATE TRIGGER IF NOT EXISTS interactions_fts_insert AFTER INSERT ON interactions BEGIN
+        INSERT INTO interactions_fts (rowid, user_query, model_response)
+        VALUES (new.id, new.user_query, new.model_response);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS interactions_fts_delete AFTER DELETE ON interactions BEGIN
+        INSERT INTO interactions_fts (interactions_fts, rowid, user_query, model_response)
+        VALUES ('delete', old.id, old.user_query, old.model_response);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS interactions_fts_update AFTER UPDATE OF user_query, model_response ON interactions BEGIN
+        INSERT INTO interactions_fts (interactions_fts, rowid, user_query, model_response)
+        VALUES ('delete', old.id, old.user_query, old.model_response);
+        INSERT INTO interactions_fts (rowid, user_query, model_response)
+        VALUES (new.id, new.user_query, new.model_response);
+    END
+    ''',
+)
+
+
+def fts5_available(conn):
+    """Whether this SQLite build has the FTS5 extension."""
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp._fts5_probe USING fts5(x)")
+        conn.execute("DROP TABLE temp._fts5_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def has_search_index(conn):
+    """Whether the database has the full-text index."""
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'interactions_fts'").fetchone()
+    return row is not None
+
+
+def create_search_index(conn):
+    """
+    Create the full-text index and its sync triggers, and index existing rows
+
+    Runs in the caller's transaction. Does nothing if the index exists.
+
+    Args:
+        conn (sqlite3.Connection): Log database connection
+
+    Returns:
+        bool: True if the index was created
+    """
+    if has_search_index(conn):
+        return False
+    conn.execute(_INDEX_SQL)
+    for trigger in _TRIGGERS_SQL:
+        conn.execute(trigger)
+    rebuild_search_index(conn)
+    return True
+
+
+def rebuild_search_index(conn):
+    """Re-index every interaction from the interactions table, in the caller's transaction."""
+    conn.execute("INSERT INTO interactions_fts (interactions_fts) VALUES ('rebuild')")
+
+
+def match_expression(text):
+    """
+    FTS5 query matching every word of plain text, in any order
+
+    Args:
+        text (str): Search words as typed
+
+    Returns:
+        str: Each word quoted, so punctuation and FTS5 keywords are taken literally
+    """
+    words = re.findall(r"\w+", text)
+    return " ".join(f'"{word}"' for word in words)
+
+
+def search(conn, query, session_id=None, model_name=None, since_ms=None, limit=20, raw=False):
+    """
+    Rank logged interactions by relevance to a query
+
+    Args:
+        conn (sqlite3.Connection): Log database connection
+        query (str): Words to search for, or an FTS5 query when raw is True
+        session_id (str, optional): Only search this session
+        model_name (str, optional): Only search this model's replies
+        since_ms (int, optional): Only search interactions at or after this epoch-ms time
+        limit (int): Matches to return at most
+        raw (bool): Pass query to FTS5 unchanged (phrases, OR, NEAR, prefix*)
+
+    Returns:
+        list: (interaction_id, session_id, timestamp, model_name, query snippet,
+            response snippet) tuples, best match first; matched terms are in [brackets]
+    """
+    expression = query if raw else match_expression(query)
+    if not expression:
+        return []
+
+    sql = (
+        "SELECT i.interaction_id, i.session_id, i.timestamp, i.model_name, "
+        "snippet(interactions_fts, 0, '[', ']', '...', 12), "
+        "snippet(interactions_fts, 1, '[', ']', '...', 24) "
+        "FROM interactions_fts JOIN interactions i ON i.id = interactions_fts.rowid "
+        "WHERE interactions_fts MATCH ?"
+    )
+    params = [expression]
+    if session_id:
+        sql += " AND i.session_id = ?"
+        params.append(session_id)
+    if model_name:
+        sql += " AND i.model_name = ?"
+        params.append(model_name)
+    if since_ms is not None:
+        sql += " AND i.timestamp >= ?"
+        params.append(since_ms)
+    # bm25() is lower for better matches; weight query words above response words
+    sql += " ORDER BY bm25(interactions_fts, 2.0, 1.0) LIMIT ?"
+    params.append(limit)
+    return conn.execute(sql, params).fetchall()
@@ -10,7 +10,12 @@ import sqlite3
 import os
 import sys
 import datetime
-from database_handler import DatabaseLogger
+import json
+from database_handler import DatabaseLogger, format_timestamp, to_epoch_ms
+from db_migrations import applied_migrations
+from db_rollups import latency_percentiles, prune_rollups, rebuild_rollups, usage_by_day, usage_by_model
+from db_search import create_search_index, fts5_available, has_search_index, rebuild_search_index, search
+from config import ROLLUP_SETTINGS
 
 def list_sessions(db_logger, limit=10):
     """List the most recent sessions."""
@@ -53,7 +58,7 @@ def show_session(db_logger, session_id):
         return
     
     print(f"\nSession Details: {session_id}")
-    print(f"Start Time: {session[1]}")
+    print(f"Start Time: {format_timestamp(session[1])}")
     print(f"Browser: {session[2]}")
     print(f"IP: {session[3]}")
     
@@ -131,25 +136,15 @@ def export_stats(db_logger, output_format="csv"):
     # Get basic stats
     stats = db_logger.get_stats()
     
-    # Query for model usage
-    db_logger.cursor.execute(
-        "SELECT model_name, COUNT(*) as count FROM interactions GROUP BY model_name ORDER BY count DESC"
-    )
-    model_usage = db_logger.cursor.fetchall()
-    model_df = pd.DataFrame(model_usage, columns=["Model", "Count"])
+    # Model usage, daily usage and response times come from the daily rollups,
+    # so the cost grows with the number of days logged, not of interactions
+    model_rollup = usage_by_model(db_logger.conn)
+    model_df = pd.DataFrame([(row[0], row[1]) for row in model_rollup], columns=["Model", "Count"])
     
-    # Query for daily interactions
-    db_logger.cursor.execute(
-        "SELECT date(timestamp) as date, COUNT(*) as count FROM interactions GROUP BY date(timestamp) ORDER BY date"
-    )
-    daily_usage = db_logger.cursor.fetchall()
+    daily_usage = usage_by_day(db_logger.conn)
     daily_df = pd.DataFrame(daily_usage, columns=["Date", "Count"])
     
-    # Query for average response time by model
-    db_logger.cursor.execute(
-        "SELECT model_name, AVG(execution_time_ms) as avg_time FROM interactions GROUP BY model_name"
-    )
-    execution_times = db_logger.cursor.fetchall()
+    execution_times = [(row[0], row[2] / row[1] if row[1] else None) for row in model_rollup]
     time_df = pd.DataFrame(execution_times, columns=["Model", "Average Time (ms)"])
     
     # Create filename
@@ -210,17 +205,19 @@ def run_query(db_logger, query):
 def cleanup_database(db_logger, days=30):
     """Clean up old records from the database."""
     cutoff_date = datetime.datetime.now() - datetime.timedelta(days=days)
+    # Timestamps are epoch milliseconds, so these comparisons can use the indexes
+    cutoff_ms = to_epoch_ms(cutoff_date)
     
     # Get count of records to be deleted
     db_logger.cursor.execute(
-        "SELECT COUNT(*) FROM interactions WHERE datetime(timestamp) < datetime(?)",
-        (cutoff_date.strftime("%Y-%m-%d %H:%M:%S"),)
+        "SELECT COUNT(*) FROM interactions WHERE timestamp < ?",
+        (cutoff_ms,)
     )
     interaction_count = db_logger.cursor.fetchone()[0]
     
     db_logger.cursor.execute(
-        "SELECT COUNT(*) FROM sessions WHERE datetime(start_time) < datetime(?)",
-        (cutoff_date.strftime("%Y-%m-%d %H:%M:%S"),)
+        "SELECT COUNT(*) FROM sessions WHERE start_time < ?",
+        (cutoff_ms,)
     )
     session_count = db_logger.cursor.fetchone()[0]
     
@@ -232,28 +229,116 @@ def cleanup_database(db_logger, days=30):
         return
     
     try:
-        # Delete old interactions
+        # Delete old interactions, and take them out of the rollups in the same
+        # transaction so the statistics keep matching the rows that remain
         db_logger.cursor.execute(
-            "DELETE FROM interactions WHERE datetime(timestamp) < datetime(?)",
-            (cutoff_date.strftime("%Y-%m-%d %H:%M:%S"),)
+            "DELETE FROM interactions WHERE timestamp < ?",
+            (cutoff_ms,)
         )
+        prune_rollups(db_logger.conn, cutoff_ms)
         
         # Delete old sessions that have no interactions left
         db_logger.cursor.execute(
             """
             DELETE FROM sessions 
-            WHERE session_id NOT IN (SELECT DISTINCT session_id FROM interactions)
-            AND datetime(start_time) < datetime(?)
+            WHERE start_time < ?
+            AND NOT EXISTS (SELECT 1 FROM interactions WHERE interactions.session_id = sessions.session_id)
             """,
-            (cutoff_date.strftime("%Y-%m-%d %H:%M:%S"),)
+            (cutoff_ms,)
         )
         
         db_logger.conn.commit()
         print(f"Successfully deleted {interaction_count} interactions and {session_count} sessions.")
         
     except sqlite3.Error as e:
+        db_logger.conn.rollback()
         print(f"Error during cleanup: {e}")
 
+def parse_since(value):
+    """Parse a --since value: "YYYY-MM-DD", "YYYY-MM-DD HH:MM" or a number of hours ago like "24h"."""
+    if value.endswith("h") and value[:-1].isdigit():
+        return datetime.datetime.now() - datetime.timedelta(hours=int(value[:-1]))
+    for fmt in ("%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return datetime.datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError(f"Invalid time: {value} (use YYYY-MM-DD, 'YYYY-MM-DD HH:MM' or e.g. 24h)")
+
+def latency_report(db_logger, since=None, window="all", output_format="table"):
+    """Print latency percentiles per model from the rollup histograms."""
+    since_ms = to_epoch_ms(since) if since else None
+    rows = latency_percentiles(db_logger.conn, since_ms, window)
+    if not rows:
+        print("No interactions found.")
+        return
+    
+    df = pd.DataFrame(rows)
+    df.columns = ["Window", "Model", "Count", "Errors", "p50 (ms)", "p90 (ms)", "p95 (ms)", "p99 (ms)", "Max (ms)"]
+    if output_format == "csv":
+        df.to_csv(sys.stdout, index=False)
+    elif output_format == "json":
+        print(json.dumps(rows, indent=2))
+    else:
+        print(f"\nLatency by model{' since ' + since.strftime('%Y-%m-%d %H:%M') if since else ''} "
+              f"(percentiles within {ROLLUP_SETTINGS['latency_relative_error']:.0%}):")
+        print(df.to_string(index=False))
+
+def search_interactions(db_logger, query, session_id=None, model_name=None, since=None, limit=20, raw=False):
+    """Print the logged interactions that best match a full-text query."""
+    if not has_search_index(db_logger.conn):
+        print("The search index does not exist. Run the rebuild-search-index command first.")
+        return
+    try:
+        results = search(db_logger.conn, query, session_id, model_name,
+                         to_epoch_ms(since) if since else None, limit, raw)
+    except sqlite3.OperationalError as e:
+        print(f"Search error: {e}")
+        return
+    
+    if not results:
+        print("No matches found.")
+        return
+    
+    print(f"\nTop {len(results)} matches for: {query}")
+    print("-" * 100)
+    for interaction_id, session_id, timestamp, model_name, query_snippet, response_snippet in results:
+        print(f"{format_timestamp(timestamp)} | Session {session_id} | {model_name}")
+        print(f"User: {query_snippet}")
+        print(f"Assistant: {response_snippet}")
+        print("-" * 100)
+
+def rebuild_search_index_command(db_logger):
+    """Create the full-text index if needed and re-index every interaction."""
+    if not fts5_available(db_logger.conn):
+        print("This SQLite build does not include FTS5; full-text search is unavailable.")
+        return
+    try:
+        with db_logger.conn:
+            if not create_search_index(db_logger.conn):
+                rebuild_search_index(db_logger.conn)
+        count = db_logger.conn.execute("SELECT COUNT(*) FROM interactions").fetchone()[0]
+        print(f"Indexed {count} interactions.")
+    except sqlite3.Error as e:
+        print(f"Error rebuilding the search index: {e}")
+
+def rebuild_rollups_command(db_logger, since=None):
+    """Recompute the usage rollups from the raw interactions."""
+    since_ms = to_epoch_ms(datetime.datetime.strptime(since, "%Y-%m-%d")) if since else None
+    try:
+        with db_logger.conn:
+            count = rebuild_rollups(db_logger.conn, since_ms)
+        print(f"Rebuilt rollups from {count} interactions" + (f" since {since}." if since else "."))
+    except sqlite3.Error as e:
+        print(f"Error rebuilding rollups: {e}")
+
+def show_schema(db_logger):
+    """List the schema migrations applied to the database."""
+    print(f"\n{'Version':<8} | {'Applied':<26} | Description")
+    print("-" * 80)
+    for version, description, applied_at in applied_migrations(db_logger.conn):
+        print(f"{version:<8} | {format_timestamp(applied_at):<26} | {description}")
+
 def main():
     parser = argparse.ArgumentParser(description="ResearchBuddy AI Database Management Tool")
     parser.add_argument("--db", help="Database file path", default="logs/chat_logs.db")
@@ -285,6 +370,31 @@ def main():
     cleanup_parser = subparsers.add_parser("cleanup", help="Clean up old records")
     cleanup_parser.add_argument("--days", type=int, default=30, help="Delete records older than this many days")
     
+    # Latency command
+    latency_parser = subparsers.add_parser("latency", help="Latency percentiles per model")
+    latency_parser.add_argument("--since", type=parse_since, help="Only count interactions since YYYY-MM-DD, 'YYYY-MM-DD HH:MM' or e.g. 24h")
+    latency_parser.add_argument("--window", choices=["all", "day", "hour"], default="all", help="Report per time window")
+    latency_parser.add_argument("--format", choices=["table", "csv", "json"], default="table", help="Output format")
+    
+    # Search command
+    search_parser = subparsers.add_parser("search", help="Full-text search of logged queries and responses")
+    search_parser.add_argument("search_query", help="Words to search for")
+    search_parser.add_argument("--session", help="Only search this session ID")
+    search_parser.add_argument("--model", help="Only search this model name")
+    search_parser.add_argument("--since", type=parse_since, help="Only search since YYYY-MM-DD, 'YYYY-MM-DD HH:MM' or e.g. 24h")
+    search_parser.add_argument("--limit", type=int, default=20, help="Number of matches to show")
+    search_parser.add_argument("--raw", action="store_true", help="Treat the query as FTS5 syntax (phrases, OR, NEAR, prefix*)")
+    
+    # Rebuild search index command
+    subparsers.add_parser("rebuild-search-index", help="Create or rebuild the full-text search index")
+    
+    # Rebuild rollups command
+    rollups_parser = subparsers.add_parser("rebuild-rollups", help="Recompute the usage rollups from the raw interactions")
+    rollups_parser.add_argument("--since", help="Only rebuild from this date (YYYY-MM-DD)")
+    
+    # Schema command
+    subparsers.add_parser("schema", help="List the schema migrations applied to the database")
+    
     args = parser.parse_args()
     
     # Check if database file exists
@@ -309,6 +419,16 @@ def main():
             run_query(db_logger, args.sql_query)
         elif args.command == "cleanup":
             cleanup_database(db_logger, args.days)
+        elif args.command == "latency":
+            latency_report(db_logger, args.since, args.window, args.format)
+        elif args.command == "search":
+            search_interactions(db_logger, args.search_query, args.session, args.model, args.since, args.limit, args.raw)
+        elif args.command == "rebuild-search-index":
+            rebuild_search_index_command(db_logger)
+        elif args.command == "rebuild-rollups":
+            rebuild_rollups_command(db_logger, args.since)
+        elif args.command == "schema":
+            show_schema(db_logger)
         else:
             parser.print_help()
     finally:
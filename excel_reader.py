@@ -0,0 +1,151 @@
+import io
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+
+import pandas as pd
+
+from config import EXCEL_SETTINGS
+from csv_profiler import profile_chunks, format_profile
+from table_store import TableWriter, store_chunks, table_exists, table_key as make_table_key
+from worker_pool import get_process_pool, reset_process_pool, worker_count
+
+
+def _open_workbook(data):
+    import openpyxl
+    # read_only streams rows from the XML instead of building every cell object
+    return openpyxl.load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+
+
+def sheet_names(data):
+    """
+    Names of the worksheets in a workbook, in tab order
+
+    Args:
+        data (bytes): .xlsx file contents
+
+    Returns:
+        list: Sheet names
+    """
+    workbook = _open_workbook(data)
+    try:
+        return list(workbook.sheetnames)
+    finally:
+        workbook.close()
+
+
+def _header(row):
+    """Column names from a header row: blanks get pandas-style names, duplicates a suffix."""
+    names, seen = [], {}
+    for i, value in enumerate(row):
+        name = f"Unnamed: {i}" if value is None or str(value).strip() == "" else str(value)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def _row_chunks(rows, header, chunk_rows):
+    """Turn a stream of row tuples into DataFrame chunks, padding or cutting ragged rows."""
+    width = len(header)
+    while True:
+        batch = [tuple(row[:width]) + (None,) * (width - len(row)) for row in islice(rows, chunk_rows)]
+        if not batch:
+            return
+        yield pd.DataFrame.from_records(batch, columns=header).infer_objects()
+
+
+def profile_sheet(data, sheet_name, max_rows=None, chunk_rows=None, table_key=None):
+    """
+    Profile one worksheet with bounded memory. Runs in a worker process.
+
+    Args:
+        data (bytes): .xlsx file contents
+        sheet_name (str): Worksheet to read
+        max_rows (int, optional): Data rows to read at most, defaults to EXCEL_SETTINGS
+        chunk_rows (int, optional): Rows per chunk, defaults to EXCEL_SETTINGS
+        table_key (str, optional): Also store the sheet in the table store under this key
+
+    Returns:
+        dict: name and truncated plus the rows, columns and head of
+            csv_profiler.profile_chunks()
+    """
+    max_rows = max_rows or EXCEL_SETTINGS["max_rows_per_sheet"]
+    chunk_rows = chunk_rows or EXCEL_SETTINGS["chunk_rows"]
+
+    workbook = _open_workbook(data)
+    try:
+        rows = workbook[sheet_name].iter_rows(values_only=True)
+        first = next(rows, None)
+        if first is None:
+            profile = {"rows": 0, "columns": [], "head": pd.DataFrame()}
+            truncated = False
+        else:
+            header = _header(first)
+            chunks = _row_chunks(islice(rows, max_rows), header, chunk_rows)
+            if table_key and not table_exists(table_key):
+                chunks = store_chunks(chunks, TableWriter(table_key, sheet_name))
+            profile = profile_chunks(chunks)
+            truncated = next(rows, None) is not None
+    finally:
+        workbook.close()
+
+    profile["name"] = sheet_name
+    profile["truncated"] = truncated
+    return profile
+
+
+def profile_workbook(data, store_tables=False):
+    """
+    Profile every worksheet of a workbook
+
+    Sheets are profiled in parallel by the shared process pool when there is more
+    than one sheet and more than one CPU; otherwise in this process.
+
+    Args:
+        data (bytes): .xlsx file contents
+        store_tables (bool): Also store each sheet in the table store; its key is
+            returned as the profile's "table_key"
+
+    Returns:
+        list: profile_sheet() result per sheet, in tab order
+    """
+    names = sheet_names(data)
+    keys = [make_table_key(data, f"sheet-{i}") if store_tables else None for i in range(len(names))]
+    if len(names) < 2 or worker_count() < 2:
+        profiles = [profile_sheet(data, name, table_key=key) for name, key in zip(names, keys)]
+    else:
+        try:
+            pool = get_process_pool()
+            futures = [pool.submit(profile_sheet, data, name, table_key=key) for name, key in zip(names, keys)]
+            profiles = [future.result() for future in futures]
+        except BrokenProcessPool:
+            reset_process_pool()
+            raise
+
+    for profile, key in zip(profiles, keys):
+        profile["table_key"] = key
+    return profiles
+
+
+def format_workbook(profiles):
+    """
+    Render workbook profiles as the Excel summary text sent to the model
+
+    Args:
+        profiles (list): Result of profile_workbook()
+
+    Returns:
+        str: Sheet list followed by the summary of each sheet
+    """
+    summary = f"Excel File Summary:\n\n"
+    summary += f"Sheets: {', '.join(profile['name'] for profile in profiles)}\n\n"
+    sections = []
+    for profile in profiles:
+        section = format_profile(profile, title=f"Sheet '{profile['name']}'")
+        if profile["truncated"]:
+            section += f"\n\n[Only the first {profile['rows']} rows of this sheet were read]"
+        sections.append(section)
+    return summary + "\n\n".join(sections)
@@ -0,0 +1,181 @@
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+from config import FILE_CACHE_SETTINGS
+
+
+def content_key(data, parser_version, file_type=""):
+    """
+    Cache key for a parsed upload
+
+    Args:
+        data (bytes): Raw uploaded bytes
+        parser_version (str): Version of the parser; bump it to invalidate old entries
+        file_type (str): MIME type the upload was parsed as
+
+    Returns:
+        str: Hex SHA-256 of the bytes, parser version and type
+    """
+    digest = hashlib.sha256(data)
+    digest.update(f"\0{parser_version}\0{file_type}".encode())
+    return digest.hexdigest()
+
+
+def _estimate_size(value):
+    """Rough in-memory size of a parsed upload, for the memory bound."""
+    size = 0
+    for item in value.values():
+        if isinstance(item, (str, bytes)):
+            size += len(item)
+        elif hasattr(item, "size") and hasattr(item, "getbands"):
+            # PIL image: decoded pixel data dominates
+            width, height = item.size
+            size += width * height * len(item.getbands())
+    return size + 256
+
+
+class FileCache:
+    """
+    Content-addressed cache of parsed uploads.
+
+    A memory LRU bounded in bytes is shared by every session in the process; an
+    optional pickle-per-entry directory keeps results across restarts. Each entry
+    remembers how long parsing took, so hits report the time they saved.
+    """
+
+    def __init__(self, memory_max_bytes=None, disk_dir=None):
+        """
+        Args:
+            memory_max_bytes (int, optional): Size limit of the memory tier
+            disk_dir (str, optional): Directory for the disk tier, None to use
+                FILE_CACHE_SETTINGS, "" to disable
+        """
+        self.memory_max_bytes = memory_max_bytes or FILE_CACHE_SETTINGS["memory_max_bytes"]
+        self.disk_dir = FILE_CACHE_SETTINGS["disk_dir"] if disk_dir is None else disk_dir
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "parse_ms": 0.0,
+            "parse_ms_saved": 0.0
+        }
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.pkl")
+
+    def _remember(self, key, entry):
+        size = _estimate_size(entry["value"])
+        if size > self.memory_max_bytes:
+            return
+        if key in self._memory:
+            self._memory_bytes -= self._memory.pop(key)["size"]
+        entry["size"] = size
+        self._memory[key] = entry
+        self._memory_bytes += size
+        while self._memory_bytes > self.memory_max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted["size"]
+            self.stats["evictions"] += 1
+
+    def get(self, key):
+        """
+        Look up a parsed upload
+
+        Returns:
+            dict: Cached parse result, or None on a miss
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                self.stats["parse_ms_saved"] += entry["parse_ms"]
+                return entry["value"]
+
+        if self.disk_dir and os.path.exists(self._disk_path(key)):
+            try:
+                with open(self._disk_path(key), "rb") as f:
+                    entry = pickle.load(f)
+            except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+                entry = None
+            if entry is not None:
+                with self._lock:
+                    self._remember(key, entry)
+                    self.stats["disk_hits"] += 1
+                    self.stats["parse_ms_saved"] += entry["parse_ms"]
+                return entry["value"]
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def set(self, key, value, parse_ms):
+        """
+        Store a parse result
+
+        Args:
+            key (str): Key from content_key()
+            value (dict): Parse result
+            parse_ms (float): Time the parse took
+        """
+        entry = {"value": value, "parse_ms": parse_ms}
+        with self._lock:
+            self._remember(key, dict(entry))
+            self.stats["parse_ms"] += parse_ms
+
+        if self.disk_dir:
+            # Write to a temporary file first so readers never see a partial entry
+            path = self._disk_path(key)
+            temp_path = f"{path}.{threading.get_ident()}.tmp"
+            try:
+                with open(temp_path, "wb") as f:
+                    pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(temp_path, path)
+            except (OSError, pickle.PicklingError, TypeError):
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+    def get_stats(self):
+        """
+        Get cache counters
+
+        Returns:
+            dict: Hits per tier, misses, evictions, hit_rate, total parse time and the
+                parse time saved by hits (ms), memory tier size
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_entries"] = len(self._memory)
+            stats["memory_bytes"] = self._memory_bytes
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+
+_file_cache = None
+_file_cache_lock = threading.Lock()
+
+
+def get_file_cache():
+    """
+    Get the process-wide upload cache, creating it on first use
+
+    Returns:
+        FileCache: Shared cache instance
+    """
+    global _file_cache
+    if _file_cache is None:
+        with _file_cache_lock:
+            if _file_cache is None:
+                _file_cache = FileCache()
+    return _file_cache
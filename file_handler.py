@@ -3,25 +3,76 @@ import io
 import base64
 import streamlit as st
 import os
-from PIL import Image
+import time
+from file_cache import content_key, get_file_cache
+from image_store import get_image_store
+from config import PDF_SETTINGS
+from csv_profiler import profile_csv, format_profile
+from excel_reader import profile_workbook, format_workbook
+from table_store import TableWriter, table_key, table_exists
 
-def process_uploaded_file(uploaded_file):
+# Bump when parsing output changes so cached results from older parsers are ignored
+PARSER_VERSION = "7"
+
+def _parser_signature():
+    """Parser version plus the extraction limits that shape the parsed output."""
+    return f"{PARSER_VERSION}:{PDF_SETTINGS['max_pages']}:{PDF_SETTINGS['max_chars']}"
+
+def process_uploaded_file(uploaded_file, progress_callback=None):
     """
     Process the uploaded file and extract its content
     
+    Results are cached by a hash of the uploaded bytes and PARSER_VERSION, so an
+    unchanged upload is parsed once no matter how many reruns or sessions see it.
+    
     Args:
         uploaded_file: The file uploaded through Streamlit's file_uploader
+        progress_callback (callable, optional): Called as progress_callback(done, total)
+            while a PDF's pages are extracted
         
     Returns:
         dict: A dictionary containing file details and content
     """
+    cache = get_file_cache()
+    key = content_key(uploaded_file.getvalue(), _parser_signature(), uploaded_file.type)
+    file_details = cache.get(key)
+    
+    if file_details is None:
+        start = time.perf_counter()
+        file_details, cacheable = _parse_uploaded_file(uploaded_file, progress_callback)
+        if cacheable:
+            cache.set(key, file_details, (time.perf_counter() - start) * 1000)
+    
+    # The parse result outlives the stored image bytes if they were evicted or removed
+    if file_details.get("is_image") and not get_image_store().contains(file_details["image"].key):
+        get_image_store().put(uploaded_file.getvalue(), uploaded_file.name)
+    
+    # Cached results are shared between sessions; hand out a copy carrying this upload's name
+    file_details = dict(file_details)
+    file_details["name"] = uploaded_file.name
+    return file_details
+
+def _parse_uploaded_file(uploaded_file, progress_callback=None):
+    """
+    Parse an uploaded file without consulting the cache
+    
+    Args:
+        uploaded_file: The file uploaded through Streamlit's file_uploader
+        progress_callback (callable, optional): PDF page progress callback
+        
+    Returns:
+        tuple: (dict file details, bool whether the result may be cached)
+    """
+    cacheable = True
     file_details = {
         "name": uploaded_file.name,
         "size": uploaded_file.size,
         "type": uploaded_file.type,
         "content": None,
         "is_image": False,
-        "image": None
+        "image": None,
+        "tables": [],
+        "error": None
     }
     
     try:
@@ -34,37 +85,63 @@ def process_uploaded_file(uploaded_file):
         elif uploaded_file.type == "application/pdf":
             # Handle PDF files
             try:
-                import PyPDF2
-                pdf_reader = PyPDF2.PdfReader(io.BytesIO(uploaded_file.getvalue()))
-                pdf_text = ""
+                import PyPDF2  # Fail early with ImportError when it is not installed
+                from pdf_extractor import extract_text
+                pdf_text, report = extract_text(
+                    uploaded_file.getvalue(),
+                    last_page=PDF_SETTINGS["max_pages"],
+                    max_chars=PDF_SETTINGS["max_chars"],
+                    progress_callback=progress_callback
+                )
                 
-                # Extract text from each page
-                for page_num in range(len(pdf_reader.pages)):
-                    page = pdf_reader.pages[page_num]
-                    pdf_text += page.extract_text() + "\n\n"
-                
-                file_details["content"] = pdf_text if pdf_text.strip() else "No extractable text found in PDF."
+                if not pdf_text.strip():
+                    file_details["content"] = "No extractable text found in PDF."
+                elif report["truncated"]:
+                    file_details["content"] = (
+                        pdf_text + f"\n\n[Extracted {report['pages_extracted']} of {report['pages_total']} pages]"
+                    )
+                else:
+                    file_details["content"] = pdf_text
+                file_details["pages"] = report["pages_total"]
             except ImportError:
                 file_details["content"] = "PDF content extraction. Please install PyPDF2 library."
+                cacheable = False
             
         elif "csv" in uploaded_file.type:
-            # Handle CSV files
-            df = pd.read_csv(uploaded_file)
-            buffer = io.StringIO()
-            df.info(buf=buffer)
-            stats = buffer.getvalue()
-            
-            # Create a summary of the CSV content
-            summary = f"CSV File Summary:\n\n"
-            summary += f"Shape: {df.shape[0]} rows, {df.shape[1]} columns\n"
-            summary += f"Columns: {', '.join(df.columns.tolist())}\n\n"
-            summary += f"Data Types:\n{stats}\n\n"
-            summary += f"Sample Data (first 5 rows):\n{df.head().to_string()}"
+            # Handle CSV files: profiled in chunks so large files never load whole, and
+            # stored column by column in the same pass for exact follow-up answers
+            key = table_key(uploaded_file.getvalue())
+            writer = None if table_exists(key) else TableWriter(key, uploaded_file.name)
+            try:
+                profile = profile_csv(uploaded_file, table_writer=writer)
+            except Exception:
+                # e.g. EmptyDataError or ParserError: leave no partial table behind
+                if writer:
+                    writer.abort()
+                raise
+            file_details["content"] = format_profile(profile)
+            file_details["profile"] = {"rows": profile["rows"], "columns": profile["columns"]}
+            file_details["tables"] = [{"key": key, "name": uploaded_file.name}]
             
-            file_details["content"] = summary
+        elif "spreadsheetml" in uploaded_file.type or uploaded_file.name.lower().endswith(".xlsx"):
+            # Handle .xlsx workbooks: every sheet, streamed row by row
+            try:
+                profiles = profile_workbook(uploaded_file.getvalue(), store_tables=True)
+                file_details["content"] = format_workbook(profiles)
+                file_details["profile"] = [
+                    {"name": p["name"], "rows": p["rows"], "columns": p["columns"], "truncated": p["truncated"]}
+                    for p in profiles
+                ]
+                file_details["tables"] = [
+                    {"key": p["table_key"], "name": f"{uploaded_file.name} / {p['name']}"}
+                    for p in profiles if p["columns"]
+                ]
+            except ImportError:
+                file_details["content"] = "Excel content extraction. Please install openpyxl library."
+                cacheable = False
             
         elif "xlsx" in uploaded_file.type or "xls" in uploaded_file.type:
-            # Handle Excel files
+            # Handle legacy Excel files
             df = pd.read_excel(uploaded_file)
             buffer = io.StringIO()
             df.info(buf=buffer)
@@ -81,11 +158,12 @@ def process_uploaded_file(uploaded_file):
             
         # Handle image files
         elif uploaded_file.type.startswith('image/'):
-            # Process image file
-            image = Image.open(uploaded_file)
+            # Store the bytes once and keep only a small reference; the pixels are
+            # decoded for the thumbnail and again only when a vision request needs them
+            image = get_image_store().put(uploaded_file.getvalue(), uploaded_file.name)
             
             # Create a description of the image
-            width, height = image.size
+            width, height = image.width, image.height
             format_type = image.format
             mode = image.mode
             
@@ -105,8 +183,10 @@ def process_uploaded_file(uploaded_file):
     
     except Exception as e:
         file_details["content"] = f"Error processing file: {str(e)}"
+        file_details["error"] = str(e)
+        cacheable = False
     
-    return file_details
+    return file_details, cacheable
 
 def get_file_download_link(content, filename, mime_type):
     """
@@ -0,0 +1,217 @@
+import asyncio
+import queue
+import threading
+import time
+
+from config import HEDGING_SETTINGS
+from async_api import get_async_client, get_scheduler, submit_async
+from model_stats import get_model_stats
+from resilience import admit_async, get_breaker, record_outcome, release_probe, OPEN
+
+_stats_lock = threading.Lock()
+HEDGE_STATS = {
+    "requests": 0,      # Hedged-mode requests
+    "hedges": 0,        # Duplicates sent because the current model was slow
+    "fallbacks": 0,     # Next model tried because the current one failed
+    "hedge_wins": 0     # Requests answered by a model other than the primary
+}
+
+
+def _count(key):
+    with _stats_lock:
+        HEDGE_STATS[key] += 1
+
+
+def get_hedge_stats():
+    """Return a snapshot of the hedging counters."""
+    with _stats_lock:
+        return dict(HEDGE_STATS)
+
+
+def hedge_delay_ms(model_id):
+    """
+    How long to wait for a model's first token before hedging
+
+    Uses the configured percentile of the model's observed latency, or the default
+    delay while there are too few samples.
+
+    Returns:
+        float: Delay in ms
+    """
+    observed = get_model_stats().percentile(model_id, HEDGING_SETTINGS["percentile"])
+    if observed is None:
+        return HEDGING_SETTINGS["default_delay_ms"]
+    return max(HEDGING_SETTINGS["min_delay_ms"], observed)
+
+
+async def hedged_stream_events(messages, model_ids, api_key, temperature=0.5, max_tokens=2000):
+    """
+    Stream a chat completion, hedging across models
+
+    The request goes to model_ids[0]. If it has not produced a first token within
+    hedge_delay_ms(), the same request also goes to the next model whose circuit
+    is not open; if it fails before its first token, the next model is tried
+    straight away. The first model to produce a token wins and the others are
+    cancelled. Every attempt, hedges included, runs under the request scheduler's
+    concurrency limits and passes the model's circuit breaker and rate limits
+    first; an attempt that is not admitted counts as failing before its first token.
+
+    Args:
+        messages (list): List of message objects
+        model_ids (list): Primary model ID followed by fallbacks, in preference order
+        api_key (str): Euron API key
+        temperature (float): Temperature parameter
+        max_tokens (int): Maximum tokens for response
+
+    Yields:
+        dict: Events as from AsyncEuronClient.stream_chat; the "done" event's timing
+            also names the winning "model_id"
+    """
+    client = get_async_client()
+    scheduler = get_scheduler()
+    candidates = [m for m in model_ids if get_breaker(m).snapshot()["state"] != OPEN] or list(model_ids[:1])
+    pending = list(candidates)
+    max_launches = 1 + HEDGING_SETTINGS["max_hedges"]
+    signals = asyncio.Queue()
+    event_queues = {}
+    tasks = {}
+    launched = []
+    running = set()
+    answered = set()
+    _count("requests")
+
+    async def pump(model_id):
+        rejected = await admit_async(model_id, api_key)
+        if rejected:
+            await event_queues[model_id].put({"error": rejected})
+            signals.put_nowait((model_id, "error"))
+            return
+        start = time.perf_counter()
+        first = True
+        try:
+            async for event in client.stream_chat(messages, model_id, api_key, temperature, max_tokens):
+                await event_queues[model_id].put(event)
+                if first and ("delta" in event or "done" in event):
+                    first = False
+                    answered.add(model_id)
+                    record_outcome(model_id, 200, (time.perf_counter() - start) * 1000)
+                    signals.put_nowait((model_id, "ok"))
+                elif "error" in event:
+                    if first:
+                        record_outcome(model_id, event.get("status_code"), error=event["error"])
+                        signals.put_nowait((model_id, "error"))
+                    return
+        except asyncio.CancelledError:
+            # Cancelled before an outcome was recorded; free a half-open probe slot
+            if first:
+                release_probe(model_id)
+            raise
+        except Exception as e:
+            await event_queues[model_id].put({"error": f"An error occurred: {str(e)}"})
+            if first:
+                record_outcome(model_id, error=str(e))
+                signals.put_nowait((model_id, "error"))
+
+    def finished(model_id, task):
+        # The scheduler returns an error instead of raising when the deadline passes
+        if task.cancelled() or task.result() is None:
+            return
+        event_queues[model_id].put_nowait(task.result())
+        if model_id not in answered:
+            signals.put_nowait((model_id, "error"))
+
+    def launch():
+        model_id = pending.pop(0)
+        event_queues[model_id] = asyncio.Queue()
+        tasks[model_id] = scheduler.submit(model_id, lambda: pump(model_id))
+        tasks[model_id].add_done_callback(lambda task: finished(model_id, task))
+        launched.append(model_id)
+        running.add(model_id)
+        return time.perf_counter() + hedge_delay_ms(model_id) / 1000
+
+    winner = None
+    last_error = None
+    try:
+        hedge_at = launch()
+        while winner is None:
+            can_hedge = pending and len(launched) < max_launches
+            timeout = max(0.0, hedge_at - time.perf_counter()) if can_hedge else None
+            try:
+                model_id, kind = await asyncio.wait_for(signals.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                _count("hedges")
+                hedge_at = launch()
+                continue
+
+            if kind == "ok":
+                winner = model_id
+                break
+
+            running.discard(model_id)
+            last_error = model_id
+            if not running:
+                if pending:
+                    _count("fallbacks")
+                    hedge_at = launch()
+                    continue
+                break
+
+        if winner is None:
+            # Every model tried failed; surface the last error
+            while True:
+                event = await event_queues[last_error].get()
+                if "error" in event:
+                    yield {"error": event["error"]}
+                    return
+
+        if winner != launched[0]:
+            _count("hedge_wins")
+        for model_id, task in tasks.items():
+            if model_id != winner:
+                task.cancel()
+
+        while True:
+            event = await event_queues[winner].get()
+            if "done" in event:
+                yield {"done": True, "timing": dict(event["timing"], model_id=winner)}
+                return
+            yield event
+            if "error" in event:
+                return
+    finally:
+        for task in tasks.values():
+            task.cancel()
+
+
+def hedged_stream(messages, model_ids, api_key, temperature=0.5, max_tokens=2000):
+    """
+    Synchronous generator over hedged_stream_events, for Streamlit script threads
+
+    The hedged request runs on the shared background loop. Closing the generator
+    early cancels every request still in flight.
+
+    Yields:
+        dict: Events as from hedged_stream_events
+    """
+    events = queue.Queue()
+
+    async def run():
+        try:
+            async for event in hedged_stream_events(messages, model_ids, api_key, temperature, max_tokens):
+                events.put(event)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            events.put({"error": f"An error occurred: {str(e)}"})
+        finally:
+            events.put(None)
+
+    future = submit_async(run())
+    try:
+        while True:
+            event = events.get()
+            if event is None:
+                return
+            yield event
+    finally:
+        future.cancel()
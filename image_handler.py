@@ -1,55 +1,209 @@
 import requests
 from PIL import Image
 import io
-from config import SPECIALIZED_MODELS, MODEL_CAPABILITIES
+import base64
+import glob
+import hashlib
+import os
+import threading
+from config import AVAILABLE_MODELS, SPECIALIZED_MODELS, MODEL_CAPABILITIES, IMAGE_GENERATION_SETTINGS
 from api_utils import call_image_api
+from transport import get_transport
 
-def generate_image(prompt, api_key, selected_model_name):
+
+class ImageDownloadError(Exception):
+    """Raised when a generated image cannot be fetched within the size limit."""
+    pass
+
+
+def resolve_image_model(selected_model_name):
     """
-    Generate an image based on the provided prompt
-    
+    Model ID to generate images with
+
     Args:
-        prompt (str): The description of the image to generate
-        api_key (str): API key for authentication (legacy parameter, now uses secrets)
         selected_model_name (str): Current selected model name
-        
+
     Returns:
-        dict: Contains either the generated image or an error message
+        str: The selected model's ID if it can generate images, otherwise the
+            specialized image generation model
     """
-    # Check if the selected model supports image generation
     if not MODEL_CAPABILITIES.get(selected_model_name, {}).get("Image Generation", False):
-        # Switch to a model that supports image generation
-        model_id = SPECIALIZED_MODELS["image_generation"]
-    else:
-        # Get the model ID for the selected model
-        from config import AVAILABLE_MODELS
-        model_id = AVAILABLE_MODELS[selected_model_name]
-    
+        return SPECIALIZED_MODELS["image_generation"]
+    return AVAILABLE_MODELS[selected_model_name]
+
+
+def download_image(url, max_bytes=None):
+    """
+    Stream a generated image over the pooled transport
+
+    Args:
+        url (str): Image URL returned by the image API
+        max_bytes (int, optional): Size limit, defaults to
+            IMAGE_GENERATION_SETTINGS["max_download_bytes"]
+
+    Returns:
+        bytes: Image file contents
+
+    Raises:
+        ImageDownloadError: If the image is larger than max_bytes
+        requests.exceptions.RequestException: If the download fails
+    """
+    max_bytes = max_bytes or IMAGE_GENERATION_SETTINGS["max_download_bytes"]
+    response, _ = get_transport().get(url, stream=True, timeout=IMAGE_GENERATION_SETTINGS["download_timeout"])
     try:
-        # Call the image API using our utility function
-        response_data = call_image_api(prompt=prompt, model_id=model_id)
-        
-        # Check for errors in the response
+        response.raise_for_status()
+        declared = response.headers.get("Content-Length")
+        if declared and declared.isdigit() and int(declared) > max_bytes:
+            raise ImageDownloadError(f"Generated image is {int(declared)} bytes, over the {max_bytes} byte limit")
+
+        # Read in chunks and stop at the limit, whatever the server declared
+        parts = []
+        received = 0
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            received += len(chunk)
+            if received > max_bytes:
+                raise ImageDownloadError(f"Generated image is over the {max_bytes} byte limit")
+            parts.append(chunk)
+        return b"".join(parts)
+    finally:
+        response.close()
+
+
+def _variant_bytes(item):
+    """Image bytes of one entry of the API's "data" list, given as a URL or inline base64."""
+    if item.get("b64_json"):
+        data = base64.b64decode(item["b64_json"])
+        if len(data) > IMAGE_GENERATION_SETTINGS["max_download_bytes"]:
+            raise ImageDownloadError("Generated image is over the size limit")
+        return data
+    return download_image(item["url"])
+
+
+def generation_key(model_id, prompt, size):
+    """
+    Cache key for generated images
+
+    Returns:
+        str: Hex SHA-256 of the model, prompt and size
+    """
+    return hashlib.sha256(f"{model_id}\0{prompt}\0{size}".encode("utf-8")).hexdigest()
+
+
+_cache_lock = threading.Lock()
+
+
+def cached_images(key):
+    """
+    Generated images stored under a key, in the order they were generated
+
+    Args:
+        key (str): Key from generation_key()
+
+    Returns:
+        list: Image file contents
+    """
+    cache_dir = IMAGE_GENERATION_SETTINGS["cache_dir"]
+    if not cache_dir:
+        return []
+    paths = glob.glob(os.path.join(cache_dir, f"{key}.*.img"))
+    paths.sort(key=lambda path: int(path.rsplit(".", 2)[-2]))
+    images = []
+    for path in paths:
+        try:
+            with open(path, "rb") as f:
+                images.append(f.read())
+        except OSError:
+            break
+    return images
+
+
+def _store_images(key, images):
+    """Append images to those cached under a key."""
+    cache_dir = IMAGE_GENERATION_SETTINGS["cache_dir"]
+    if not cache_dir:
+        return
+    os.makedirs(cache_dir, exist_ok=True)
+    with _cache_lock:
+        index = len(glob.glob(os.path.join(cache_dir, f"{key}.*.img")))
+        for offset, data in enumerate(images):
+            path = os.path.join(cache_dir, f"{key}.{index + offset}.img")
+            # Write to a temporary file first so readers never see a partial image
+            temp_path = f"{path}.{threading.get_ident()}.tmp"
+            try:
+                with open(temp_path, "wb") as f:
+                    f.write(data)
+                os.replace(temp_path, path)
+            except OSError:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                return
+
+
+def generate_images(prompt, model_id, n=1, size=None, api_key=None):
+    """
+    Generate n variants of an image, reusing earlier results for the same prompt
+
+    Variants already cached for (model_id, prompt, size) are returned first; only
+    the missing ones are requested, all in one API call.
+
+    Args:
+        prompt (str): The description of the image to generate
+        model_id (str): ID of the image model
+        n (int): Number of variants wanted
+        size (str, optional): Image size, defaults to IMAGE_GENERATION_SETTINGS["size"]
+        api_key (str, optional): Euron API key; required off the script thread, where
+            the key entered in the sidebar cannot be read
+
+    Returns:
+        dict: images (list of image file contents) and cached (how many came from
+            the cache), or error
+    """
+    size = size or IMAGE_GENERATION_SETTINGS["size"]
+    key = generation_key(model_id, prompt, size)
+    images = cached_images(key)[:n]
+    cached = len(images)
+    if cached == n:
+        return {"images": images, "cached": cached}
+
+    try:
+        response_data = call_image_api(prompt=prompt, model_id=model_id, n=n - cached, size=size, api_key=api_key)
         if "error" in response_data:
             return {"error": response_data["error"]}
-        
-        # Check if image data is in the response
-        if "data" in response_data and len(response_data["data"]) > 0 and "url" in response_data["data"][0]:
-            # Get the image URL
-            image_url = response_data["data"][0]["url"]
-            
-            # Download the image
-            image_response = requests.get(image_url)
-            image_response.raise_for_status()
-            
-            # Create an Image object
-            image = Image.open(io.BytesIO(image_response.content))
-            
-            return {"image": image}
-        else:
+
+        items = [item for item in response_data.get("data") or [] if item.get("url") or item.get("b64_json")]
+        if not items:
             return {"error": "No image data in response"}
-    
+
+        generated = []
+        for item in items:
+            data = _variant_bytes(item)
+            # Reject anything that is not an image before it is cached
+            Image.open(io.BytesIO(data))
+            generated.append(data)
+        _store_images(key, generated)
+        return {"images": images + generated, "cached": cached}
+
     except requests.exceptions.RequestException as e:
         return {"error": f"Error communicating with the API: {str(e)}"}
+    except ImageDownloadError as e:
+        return {"error": str(e)}
     except Exception as e:
         return {"error": f"An error occurred: {str(e)}"}
+
+
+def generate_image(prompt, api_key, selected_model_name):
+    """
+    Generate an image based on the provided prompt
+
+    Args:
+        prompt (str): The description of the image to generate
+        api_key (str): API key for authentication (legacy parameter, now uses secrets)
+        selected_model_name (str): Current selected model name
+
+    Returns:
+        dict: Contains either the generated image or an error message
+    """
+    result = generate_images(prompt, resolve_image_model(selected_model_name))
+    if "error" in result:
+        return {"error": result["error"]}
+    return {"image": Image.open(io.BytesIO(result["images"][0]))}
@@ -0,0 +1,126 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from api_utils import get_euron_api_key
+from config import IMAGE_GENERATION_SETTINGS
+from image_handler import generate_images, resolve_image_model
+from image_store import get_image_store
+
+
+class ImageJobs:
+    """
+    Image generation jobs run on background threads.
+
+    The UI submits a job and polls it by ID, so the script thread never waits on
+    the image API and chatting keeps working while an image is being produced.
+    Results are put in the image store; a job only holds ImageRefs.
+    """
+
+    def __init__(self, workers=None):
+        """
+        Args:
+            workers (int, optional): Jobs run at the same time, defaults to
+                IMAGE_GENERATION_SETTINGS["workers"]
+        """
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers or IMAGE_GENERATION_SETTINGS["workers"],
+            thread_name_prefix="image-job"
+        )
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, prompt, selected_model_name, n=1, size=None):
+        """
+        Start generating an image
+
+        Args:
+            prompt (str): The description of the image to generate
+            selected_model_name (str): Current selected model name
+            n (int): Number of variants to generate
+            size (str, optional): Image size, defaults to IMAGE_GENERATION_SETTINGS["size"]
+
+        Returns:
+            str: Job ID for get()
+        """
+        job_id = uuid.uuid4().hex
+        job = {
+            "id": job_id,
+            "prompt": prompt,
+            "n": n,
+            "status": "queued",
+            "images": [],
+            "cached": 0,
+            "error": None,
+            "submitted": time.time(),
+            "finished": None,
+            "elapsed_ms": None
+        }
+        with self._lock:
+            self._prune()
+            self._jobs[job_id] = job
+        # Read the key here: the sidebar key in st.session_state is not available on pool threads
+        self._executor.submit(self._run, job, resolve_image_model(selected_model_name), size, get_euron_api_key())
+        return job_id
+
+    def _run(self, job, model_id, size, api_key):
+        job["status"] = "running"
+        start = time.perf_counter()
+        try:
+            result = generate_images(job["prompt"], model_id, n=job["n"], size=size, api_key=api_key)
+            if "error" in result:
+                job["error"] = result["error"]
+            else:
+                store = get_image_store()
+                job["images"] = [
+                    store.put(data, f"generated-{i + 1}") for i, data in enumerate(result["images"])
+                ]
+                job["cached"] = result["cached"]
+        except Exception as e:
+            job["error"] = f"An error occurred: {str(e)}"
+        job["elapsed_ms"] = int((time.perf_counter() - start) * 1000)
+        job["finished"] = time.time()
+        job["status"] = "error" if job["error"] else "done"
+
+    def _prune(self):
+        """Forget finished jobs older than IMAGE_GENERATION_SETTINGS["job_ttl"]. Call with the lock held."""
+        cutoff = time.time() - IMAGE_GENERATION_SETTINGS["job_ttl"]
+        expired = [job_id for job_id, job in self._jobs.items() if job["finished"] and job["finished"] < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        """
+        Current state of a job
+
+        Args:
+            job_id (str): ID from submit()
+
+        Returns:
+            dict: id, prompt, n, status ("queued", "running", "done" or "error"),
+                images (ImageRefs), cached, error and elapsed_ms, or None if the job
+                is unknown or expired
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+
+_image_jobs = None
+_image_jobs_lock = threading.Lock()
+
+
+def get_image_jobs():
+    """
+    Get the process-wide image job runner, creating it on first use
+
+    Returns:
+        ImageJobs: Shared job runner
+    """
+    global _image_jobs
+    if _image_jobs is None:
+        with _image_jobs_lock:
+            if _image_jobs is None:
+                _image_jobs = ImageJobs()
+    return _image_jobs
@@ -0,0 +1,195 @@
+import base64
+import hashlib
+import io
+import threading
+import time
+from collections import OrderedDict
+
+from PIL import Image
+
+from config import IMAGE_PAYLOAD_SETTINGS
+
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+_lock = threading.Lock()
+_payloads = OrderedDict()
+_payload_bytes = 0
+_stats = {
+    "hits": 0,
+    "misses": 0,
+    "evictions": 0,
+    "encode_ms": 0.0,
+    "payload_bytes_sent": 0,
+    "bytes_saved": 0
+}
+
+
+def image_hash(image):
+    """
+    Content hash of a decoded image
+
+    Args:
+        image (PIL.Image): Image to hash
+
+    Returns:
+        str: Hex SHA-256 of the mode, size and pixel data
+    """
+    digest = hashlib.sha256(f"{image.mode}:{image.size}".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+def max_dimension_for(model_id):
+    """Largest side, in pixels, worth sending to a model."""
+    return IMAGE_PAYLOAD_SETTINGS["model_max_dimension"].get(model_id, IMAGE_PAYLOAD_SETTINGS["max_dimension"])
+
+
+def compress_image(image, max_dimension, image_format, quality):
+    """
+    Downsize and compress an image for upload
+
+    Args:
+        image (PIL.Image): Source image, left unchanged
+        max_dimension (int): Largest side of the result in pixels
+        image_format (str): "JPEG", "WEBP" or "PNG"
+        quality (int): Encoder quality for lossy formats
+
+    Returns:
+        bytes: Encoded image
+    """
+    prepared = image
+    if max(prepared.size) > max_dimension:
+        prepared = prepared.copy()
+        prepared.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+    if image_format == "JPEG" and prepared.mode != "RGB":
+        # JPEG has no alpha channel: flatten transparent images onto white
+        if prepared.mode in ("RGBA", "LA") or (prepared.mode == "P" and "transparency" in prepared.info):
+            rgba = prepared.convert("RGBA")
+            background = Image.new("RGB", rgba.size, (255, 255, 255))
+            background.paste(rgba, mask=rgba.split()[-1])
+            prepared = background
+        else:
+            prepared = prepared.convert("RGB")
+    elif image_format == "WEBP" and prepared.mode not in ("RGB", "RGBA"):
+        prepared = prepared.convert("RGBA" if "A" in prepared.mode or "transparency" in prepared.info else "RGB")
+
+    buffered = io.BytesIO()
+    if image_format == "PNG":
+        prepared.save(buffered, format="PNG", optimize=True)
+    else:
+        prepared.save(buffered, format=image_format, quality=quality)
+    return buffered.getvalue()
+
+
+def png_data_url_bytes(image):
+    """
+    Size of the data URL sent before payloads were compressed and cached
+
+    Args:
+        image (PIL.Image): Full-resolution image
+
+    Returns:
+        int: Length of "data:image/png;base64,..." for the image saved as PNG
+    """
+    buffered = io.BytesIO()
+    image.save(buffered, format="PNG")
+    return len("data:image/png;base64,") + 4 * ((len(buffered.getvalue()) + 2) // 3)
+
+
+def prepare_image_part(image, model_id, content_hash=None):
+    """
+    Get the image_url message part for an image, encoding it at most once
+
+    The image is downsized to the model's maximum useful resolution and encoded
+    with IMAGE_PAYLOAD_SETTINGS["format"] and ["quality"]. The resulting data URL
+    is cached by content hash and encoding settings, so later chat turns reuse it.
+
+    Args:
+        image (PIL.Image or callable): Uploaded image, or a function returning it
+            that is only called when the payload is not cached
+        model_id (str): Model the request goes to
+        content_hash (str, optional): Precomputed image_hash(image), or any other
+            hash identifying the image; required when image is a function
+
+    Returns:
+        tuple: (dict image_url part, dict report with width, height, payload_bytes,
+            baseline_bytes, bytes_saved and cached)
+    """
+    global _payload_bytes
+
+    max_dimension = max_dimension_for(model_id)
+    image_format = IMAGE_PAYLOAD_SETTINGS["format"]
+    quality = IMAGE_PAYLOAD_SETTINGS["quality"]
+    key = (content_hash or image_hash(image), max_dimension, image_format, quality)
+
+    with _lock:
+        entry = _payloads.get(key)
+        if entry is not None:
+            _payloads.move_to_end(key)
+            _stats["hits"] += 1
+
+    if entry is None:
+        start = time.perf_counter()
+        if callable(image):
+            image = image()
+        encoded = compress_image(image, max_dimension, image_format, quality)
+        data_url = f"data:{MIME_TYPES[image_format]};base64,{base64.b64encode(encoded).decode()}"
+        encode_ms = (time.perf_counter() - start) * 1000
+        width, height = image.size
+        scale = min(1.0, max_dimension / max(width, height))
+        # Baseline: the full-resolution PNG data URL that used to be sent every turn.
+        # Measured once per entry and kept out of encode_ms.
+        baseline_bytes = png_data_url_bytes(image)
+        entry = {
+            "data_url": data_url,
+            "width": max(1, int(width * scale)),
+            "height": max(1, int(height * scale)),
+            "payload_bytes": len(encoded),
+            "baseline_bytes": baseline_bytes
+        }
+        with _lock:
+            _stats["misses"] += 1
+            _stats["encode_ms"] += encode_ms
+            if key not in _payloads:
+                _payloads[key] = entry
+                _payload_bytes += len(data_url)
+                # Counted once per entry, not again on every turn that reuses it
+                _stats["bytes_saved"] += max(0, baseline_bytes - len(data_url))
+                while _payload_bytes > IMAGE_PAYLOAD_SETTINGS["cache_max_bytes"] and len(_payloads) > 1:
+                    _, evicted = _payloads.popitem(last=False)
+                    _payload_bytes -= len(evicted["data_url"])
+                    _stats["evictions"] += 1
+        cached = False
+    else:
+        cached = True
+
+    with _lock:
+        _stats["payload_bytes_sent"] += entry["payload_bytes"]
+
+    part = {"type": "image_url", "image_url": {"url": entry["data_url"]}}
+    report = {
+        "width": entry["width"],
+        "height": entry["height"],
+        "payload_bytes": entry["payload_bytes"],
+        "baseline_bytes": entry["baseline_bytes"],
+        "bytes_saved": max(0, entry["baseline_bytes"] - len(entry["data_url"])),
+        "cached": cached
+    }
+    return part, report
+
+
+def get_image_payload_stats():
+    """
+    Get image payload cache counters
+
+    Returns:
+        dict: hits, misses, evictions, total encode_ms, payload_bytes_sent,
+            bytes_saved against the full-resolution PNG data URLs (once per cached
+            payload), and cache size
+    """
+    with _lock:
+        stats = dict(_stats)
+        stats["entries"] = len(_payloads)
+        stats["cache_bytes"] = _payload_bytes
+    return stats
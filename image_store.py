@@ -0,0 +1,274 @@
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+from config import IMAGE_STORE_SETTINGS
+from image_payload import compress_image
+
+
+class ImageUnavailableError(Exception):
+    """Raised when a stored image's bytes are gone, e.g. evicted from a memory-only store."""
+    pass
+
+
+class ImageRef:
+    """
+    Small, picklable handle to an uploaded image in the image store.
+
+    This is what sessions and the upload cache keep instead of a decoded image:
+    a few hundred bytes, whatever the image's resolution.
+    """
+
+    def __init__(self, key, name, image_format, width, height, mode, size):
+        self.key = key
+        self.name = name
+        self.format = image_format
+        self.width = width
+        self.height = height
+        self.mode = mode
+        self.size = size
+
+    def open(self):
+        """
+        Decode the full-resolution image
+
+        Returns:
+            PIL.Image: The uploaded image
+
+        Raises:
+            ImageUnavailableError: If the store no longer has the image
+        """
+        return get_image_store().open(self.key)
+
+    def thumbnail(self):
+        """
+        Encoded display thumbnail, made once per image
+
+        Returns:
+            bytes: JPEG, or PNG for images with transparency
+        """
+        return get_image_store().thumbnail(self.key)
+
+    def __repr__(self):
+        return f"ImageRef({self.name!r}, {self.width}x{self.height}, {self.key[:12]})"
+
+
+def _has_alpha(image):
+    return image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+
+
+def make_thumbnail(data, thumbnail_size=None):
+    """
+    Encode a display thumbnail of an image
+
+    Args:
+        data (bytes): Original image file contents
+        thumbnail_size (int, optional): Largest side in pixels, defaults to
+            IMAGE_STORE_SETTINGS["thumbnail_size"]
+
+    Returns:
+        bytes: JPEG, or PNG for images with transparency
+    """
+    thumbnail_size = thumbnail_size or IMAGE_STORE_SETTINGS["thumbnail_size"]
+    image = Image.open(io.BytesIO(data))
+    # JPEGs can be decoded directly at a fraction of their size
+    image.draft("RGB", (thumbnail_size, thumbnail_size))
+    image_format = "PNG" if _has_alpha(image) else "JPEG"
+    return compress_image(image, thumbnail_size, image_format, 85)
+
+
+class ImageStore:
+    """
+    Content-addressed store of uploaded images.
+
+    Original bytes and a display thumbnail are kept per content hash in a
+    directory, with the recently used ones also in a memory LRU bounded in bytes;
+    without a directory the LRU is the only copy. Nothing is kept decoded: full
+    resolution is decoded from the bytes only when a request needs the pixels.
+    """
+
+    def __init__(self, memory_max_bytes=None, directory=None):
+        """
+        Args:
+            memory_max_bytes (int, optional): Size limit of the memory LRU
+            directory (str, optional): Directory for the files, None to use
+                IMAGE_STORE_SETTINGS, "" to keep images in memory only
+        """
+        self.memory_max_bytes = memory_max_bytes or IMAGE_STORE_SETTINGS["memory_max_bytes"]
+        self.directory = IMAGE_STORE_SETTINGS["dir"] if directory is None else directory
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {
+            "stored": 0,
+            "thumbnails": 0,
+            "decodes": 0,
+            "evictions": 0
+        }
+
+    def _path(self, key, kind):
+        return os.path.join(self.directory, f"{key}.{kind}")
+
+    def _remember(self, item, data):
+        if len(data) > self.memory_max_bytes:
+            return
+        with self._lock:
+            if item in self._memory:
+                self._memory_bytes -= len(self._memory.pop(item))
+            self._memory[item] = data
+            self._memory_bytes += len(data)
+            while self._memory_bytes > self.memory_max_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+                self.stats["evictions"] += 1
+
+    def _load(self, key, kind):
+        with self._lock:
+            data = self._memory.get((key, kind))
+            if data is not None:
+                self._memory.move_to_end((key, kind))
+                return data
+
+        if self.directory:
+            try:
+                with open(self._path(key, kind), "rb") as f:
+                    data = f.read()
+            except OSError:
+                return None
+            self._remember((key, kind), data)
+        return data
+
+    def _save(self, key, kind, data):
+        self._remember((key, kind), data)
+        if self.directory:
+            # Write to a temporary file first so readers never see a partial image
+            path = self._path(key, kind)
+            temp_path = f"{path}.{threading.get_ident()}.tmp"
+            try:
+                with open(temp_path, "wb") as f:
+                    f.write(data)
+                os.replace(temp_path, path)
+            except OSError:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+    def _exists(self, key, kind):
+        with self._lock:
+            if (key, kind) in self._memory:
+                return True
+        return bool(self.directory) and os.path.exists(self._path(key, kind))
+
+    def put(self, data, name):
+        """
+        Store an uploaded image, once per content
+
+        Only the image header is read; the pixels are decoded once, at reduced
+        size where the format allows, to make the thumbnail.
+
+        Args:
+            data (bytes): Image file contents
+            name (str): File name
+
+        Returns:
+            ImageRef: Handle to the stored image
+        """
+        key = hashlib.sha256(data).hexdigest()
+        image = Image.open(io.BytesIO(data))
+        ref = ImageRef(key, name, image.format, image.width, image.height, image.mode, len(data))
+
+        if not self._exists(key, "orig"):
+            self._save(key, "orig", data)
+            with self._lock:
+                self.stats["stored"] += 1
+        if not self._exists(key, "thumb"):
+            self._save(key, "thumb", make_thumbnail(data))
+            with self._lock:
+                self.stats["thumbnails"] += 1
+        return ref
+
+    def contains(self, key):
+        """Whether the original bytes of an image are still stored."""
+        return self._exists(key, "orig")
+
+    def thumbnail(self, key):
+        """
+        Display thumbnail of a stored image
+
+        Raises:
+            ImageUnavailableError: If the store no longer has the image
+        """
+        data = self._load(key, "thumb")
+        if data is None:
+            data = make_thumbnail(self.original(key))
+            self._save(key, "thumb", data)
+            with self._lock:
+                self.stats["thumbnails"] += 1
+        return data
+
+    def original(self, key):
+        """
+        Original file contents of a stored image
+
+        Raises:
+            ImageUnavailableError: If the store no longer has the image
+        """
+        data = self._load(key, "orig")
+        if data is None:
+            raise ImageUnavailableError("The uploaded image is no longer available. Please upload it again.")
+        return data
+
+    def open(self, key):
+        """
+        Decode a stored image at full resolution
+
+        Returns:
+            PIL.Image: Fully loaded image
+
+        Raises:
+            ImageUnavailableError: If the store no longer has the image
+        """
+        image = Image.open(io.BytesIO(self.original(key)))
+        image.load()
+        with self._lock:
+            self.stats["decodes"] += 1
+        return image
+
+    def get_stats(self):
+        """
+        Get store counters
+
+        Returns:
+            dict: Images stored, thumbnails made, full-resolution decodes, evictions,
+                and the memory LRU's entries and bytes
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_entries"] = len(self._memory)
+            stats["memory_bytes"] = self._memory_bytes
+        return stats
+
+
+_image_store = None
+_image_store_lock = threading.Lock()
+
+
+def get_image_store():
+    """
+    Get the process-wide image store, creating it on first use
+
+    Returns:
+        ImageStore: Shared store instance
+    """
+    global _image_store
+    if _image_store is None:
+        with _image_store_lock:
+            if _image_store is None:
+                _image_store = ImageStore()
+    return _image_store
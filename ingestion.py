@@ -0,0 +1,89 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from config import INGEST_SETTINGS
+from file_handler import process_uploaded_file
+
+
+def _ingest_one(uploaded_file, status):
+    """Parse one upload, recording its progress and outcome in status. Runs in a worker thread."""
+    def page_progress(done, total):
+        status["pages_done"], status["pages_total"] = done, total
+
+    status["status"] = "parsing"
+    start = time.perf_counter()
+    try:
+        details = process_uploaded_file(uploaded_file, progress_callback=page_progress)
+        status["details"] = details
+        status["error"] = details.get("error")
+    except Exception as e:
+        # process_uploaded_file reports parse errors itself; this covers the cache and the rest
+        status["error"] = str(e)
+    status["elapsed_ms"] = int((time.perf_counter() - start) * 1000)
+    status["status"] = "error" if status["error"] else "done"
+
+
+def ingest_files(uploaded_files, progress_callback=None):
+    """
+    Parse several uploaded files at the same time
+
+    Each file is parsed on its own thread, so reading and hashing overlap and the
+    CPU-heavy parts (PDF page batches, Excel sheets) run side by side on the
+    shared process pool. The total time is close to that of the slowest file.
+    One file failing does not affect the others.
+
+    Args:
+        uploaded_files (list): Files from Streamlit's file_uploader
+        progress_callback (callable, optional): Called on this thread with the list
+            of statuses while files are parsed and once when all are done, so it
+            may update Streamlit elements
+
+    Returns:
+        list: One status per file, in upload order, with name, status ("done" or
+            "error"), details (process_uploaded_file() result), error, elapsed_ms,
+            pages_done and pages_total
+    """
+    statuses = [
+        {
+            "name": uploaded_file.name,
+            "status": "queued",
+            "details": None,
+            "error": None,
+            "elapsed_ms": 0,
+            "pages_done": 0,
+            "pages_total": 0
+        }
+        for uploaded_file in uploaded_files
+    ]
+    if not uploaded_files:
+        return statuses
+
+    threads = min(INGEST_SETTINGS["max_threads"], len(uploaded_files))
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix="ingest") as executor:
+        pending = {
+            executor.submit(_ingest_one, uploaded_file, status)
+            for uploaded_file, status in zip(uploaded_files, statuses)
+        }
+        while pending:
+            # Workers only update their status dicts; the callback runs here
+            _, pending = wait(pending, timeout=INGEST_SETTINGS["poll_interval"], return_when=FIRST_COMPLETED)
+            if progress_callback:
+                progress_callback(statuses)
+    return statuses
+
+
+def uploaded_documents(statuses):
+    """
+    The successfully parsed non-image files of an ingest, for select_files_context()
+
+    Args:
+        statuses (list): Result of ingest_files()
+
+    Returns:
+        list: Dicts with the name and content of each document
+    """
+    return [
+        {"name": status["name"], "content": status["details"]["content"]}
+        for status in statuses
+        if status["status"] == "done" and not status["details"]["is_image"] and status["details"]["content"]
+    ]
@@ -0,0 +1,208 @@
+import os
+import sqlite3
+import threading
+
+from config import AVAILABLE_MODELS, MODEL_CAPABILITIES, ROUTER_SETTINGS, LOG_DB_PATH
+from model_stats import get_model_stats
+from resilience import get_breaker, OPEN
+
+MODEL_NAMES = {model_id: name for name, model_id in AVAILABLE_MODELS.items()}
+
+
+def required_capabilities(file_content=None, image=None):
+    """
+    Capabilities a model needs to answer a chat turn
+
+    Args:
+        file_content (str, optional): Content of uploaded file if any
+        image (image_store.ImageRef, optional): Uploaded image if any
+
+    Returns:
+        list: Capability names as used in MODEL_CAPABILITIES
+    """
+    required = ["Text Generation"]
+    if file_content:
+        required.append("File Analysis")
+    if image:
+        required.append("Image Analysis")
+    return required
+
+
+def capable_model_ids(required):
+    """
+    IDs of the models that have every required capability, in config order
+
+    Args:
+        required (list): Capability names as used in MODEL_CAPABILITIES
+
+    Returns:
+        list: Model IDs
+    """
+    return [
+        AVAILABLE_MODELS[name]
+        for name, capabilities in MODEL_CAPABILITIES.items()
+        if all(capabilities.get(capability, False) for capability in required)
+    ]
+
+
+class ModelRouter:
+    """
+    Chooses the model for a request from measured performance.
+
+    Candidates are the models whose MODEL_CAPABILITIES cover the request. A
+    candidate is healthy if its circuit is not open and its recent error rate is
+    below ROUTER_SETTINGS["max_error_rate"]. The selected model is kept when it is
+    a healthy candidate, unless prefer_fastest is set; otherwise the healthy
+    candidate with the lowest median latency wins.
+    """
+
+    def __init__(self, stats=None):
+        self.stats = stats or get_model_stats()
+
+    def seed_from_database(self, db_path=None):
+        """
+        Load recent model latencies logged by DatabaseLogger.log_interaction
+
+        Only successful turns with a logged latency_ms are used: it is measured
+        like the live samples (time to first token for streams), unlike
+        execution_time_ms, which covers the whole turn. Failed turns are skipped
+        because is_error also flags turns that never reached the model.
+
+        Args:
+            db_path (str, optional): Log database, defaults to LOG_DB_PATH
+
+        Returns:
+            int: Number of samples loaded
+        """
+        db_path = db_path or LOG_DB_PATH
+        if not os.path.exists(db_path):
+            return 0
+
+        loaded = 0
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            for model_id in AVAILABLE_MODELS.values():
+                rows = conn.execute(
+                    "SELECT latency_ms FROM interactions "
+                    "WHERE model_id = ? AND latency_ms IS NOT NULL AND is_error = 0 "
+                    "ORDER BY timestamp DESC LIMIT ?",
+                    (model_id, self.stats.window_size)
+                ).fetchall()
+                # Oldest first, so the rolling window ends with the newest sample
+                self.stats.seed(model_id, [row[0] for row in reversed(rows)])
+                loaded += len(rows)
+        except sqlite3.Error:
+            pass
+        finally:
+            conn.close()
+        return loaded
+
+    def describe(self, model_id):
+        """
+        Health and latency of one model
+
+        Returns:
+            dict: model_id, model_name, state, samples, p50_ms, p95_ms, error_rate, healthy
+        """
+        info = self.stats.snapshot(model_id)
+        info["model_id"] = model_id
+        info["model_name"] = MODEL_NAMES.get(model_id, model_id)
+        info["state"] = get_breaker(model_id).snapshot()["state"]
+        error_rate = info["error_rate"] or 0.0
+        info["healthy"] = info["state"] != OPEN and error_rate <= ROUTER_SETTINGS["max_error_rate"]
+        return info
+
+    def route(self, required, selected_model_id, prefer_fastest=False):
+        """
+        Pick the model for a request
+
+        Args:
+            required (list): Capability names the model must have
+            selected_model_id (str): Model chosen by the user
+            prefer_fastest (bool): Ignore the selection when a faster healthy model exists
+
+        Returns:
+            dict: model_id, model_name, reason and candidates (describe() for each
+                capable model, fastest first)
+        """
+        candidates = [self.describe(model_id) for model_id in capable_model_ids(required)]
+
+        def latency_key(info):
+            # Models without measurements rank after measured ones, in config order
+            return (info["p50_ms"] is None, info["p50_ms"] or 0.0)
+
+        candidates.sort(key=latency_key)
+        healthy = [info for info in candidates if info["healthy"]]
+        selected = next((info for info in candidates if info["model_id"] == selected_model_id), None)
+
+        if selected is not None and selected["healthy"] and not prefer_fastest:
+            chosen, reason = selected, "selected model is capable and healthy"
+        elif healthy:
+            chosen = healthy[0]
+            if selected is None:
+                selected_capabilities = MODEL_CAPABILITIES.get(MODEL_NAMES.get(selected_model_id), {})
+                missing = [c for c in required if not selected_capabilities.get(c, False)]
+                reason = f"selected model lacks {', '.join(missing)}; fastest healthy capable model"
+            elif not selected["healthy"]:
+                reason = "selected model is unhealthy; fastest healthy capable model"
+            else:
+                reason = "fastest healthy capable model"
+        elif candidates:
+            chosen, reason = (selected or candidates[0]), "no healthy capable model; using best available"
+        else:
+            return {
+                "model_id": selected_model_id,
+                "model_name": MODEL_NAMES.get(selected_model_id, selected_model_id),
+                "reason": "no model has the required capabilities; using the selected model",
+                "candidates": []
+            }
+
+        return {
+            "model_id": chosen["model_id"],
+            "model_name": chosen["model_name"],
+            "reason": reason,
+            "candidates": candidates
+        }
+
+
+def format_decision(decision):
+    """
+    Render a routing decision for display
+
+    Args:
+        decision (dict): Result of ModelRouter.route
+
+    Returns:
+        str: Markdown explanation with one line per candidate
+    """
+    lines = [f"**{decision['model_name']}** ({decision['reason']})", ""]
+    for info in decision["candidates"]:
+        p50 = f"{info['p50_ms']:.0f} ms" if info["p50_ms"] is not None else "no data"
+        error_rate = f"{info['error_rate']:.0%}" if info["error_rate"] is not None else "n/a"
+        marker = "✓" if info["healthy"] else "✗"
+        lines.append(
+            f"- {marker} {info['model_name']}: p50 {p50}, errors {error_rate}, "
+            f"circuit {info['state']}, {info['samples']} samples"
+        )
+    return "\n".join(lines)
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router():
+    """
+    Get the process-wide router, seeding it from the log database on first use
+
+    Returns:
+        ModelRouter: Shared router
+    """
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                router = ModelRouter()
+                router.seed_from_database()
+                _router = router
+    return _router
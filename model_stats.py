@@ -0,0 +1,100 @@
+import threading
+from collections import deque
+
+from config import MODEL_STATS_SETTINGS
+
+
+class ModelStats:
+    """
+    Rolling per-model latency and error statistics.
+
+    Keeps the last window_size outcomes of each model. Latency is the delay the
+    user waits for the start of a reply: time to first token for streams, time to
+    the full response otherwise.
+    """
+
+    def __init__(self, window_size=None):
+        self.window_size = window_size or MODEL_STATS_SETTINGS["window_size"]
+        self._latencies = {}
+        self._errors = {}
+        self._lock = threading.Lock()
+
+    def record(self, model_id, latency_ms=None, error=False):
+        """
+        Record the outcome of one request
+
+        Args:
+            model_id (str): Model the request was for
+            latency_ms (float, optional): Observed latency of a successful request
+            error (bool): Whether the request failed
+        """
+        with self._lock:
+            if model_id not in self._latencies:
+                self._latencies[model_id] = deque(maxlen=self.window_size)
+                self._errors[model_id] = deque(maxlen=self.window_size)
+            self._errors[model_id].append(bool(error))
+            if latency_ms is not None and not error:
+                self._latencies[model_id].append(float(latency_ms))
+
+    def seed(self, model_id, latencies):
+        """
+        Add historical latency samples, e.g. from the log database
+
+        Args:
+            model_id (str): Model ID
+            latencies (list): Latencies in ms, oldest first
+        """
+        for latency_ms in latencies:
+            self.record(model_id, latency_ms)
+
+    def percentile(self, model_id, q, min_samples=None):
+        """
+        Latency percentile of a model over the window
+
+        Args:
+            model_id (str): Model ID
+            q (float): Quantile between 0 and 1
+            min_samples (int, optional): Return None with fewer samples than this
+
+        Returns:
+            float: Latency in ms, or None if there is not enough data
+        """
+        if min_samples is None:
+            min_samples = MODEL_STATS_SETTINGS["min_samples"]
+        with self._lock:
+            samples = sorted(self._latencies.get(model_id, ()))
+        if not samples or len(samples) < min_samples:
+            return None
+        index = min(len(samples) - 1, max(0, int(round(q * (len(samples) - 1)))))
+        return samples[index]
+
+    def snapshot(self, model_id):
+        """
+        Summary of a model's recent behaviour
+
+        Returns:
+            dict: samples, p50_ms, p95_ms and error_rate (None where there is no data;
+                percentiles also None below MODEL_STATS_SETTINGS["min_samples"])
+        """
+        with self._lock:
+            samples = len(self._latencies.get(model_id, ()))
+            errors = list(self._errors.get(model_id, ()))
+        return {
+            "samples": samples,
+            "p50_ms": self.percentile(model_id, 0.5),
+            "p95_ms": self.percentile(model_id, 0.95),
+            "error_rate": sum(errors) / len(errors) if errors else None
+        }
+
+
+_model_stats = ModelStats()
+
+
+def get_model_stats():
+    """
+    Get the process-wide model statistics
+
+    Returns:
+        ModelStats: Shared instance
+    """
+    return _model_stats
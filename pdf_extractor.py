@@ -0,0 +1,174 @@
+import io
+import os
+import tempfile
+from concurrent.futures.process import BrokenProcessPool
+
+from config import PDF_SETTINGS
+from worker_pool import get_process_pool, reset_process_pool, worker_count
+
+
+def _reader(data):
+    import PyPDF2
+    return PyPDF2.PdfReader(io.BytesIO(data))
+
+
+# ((path, inode, mtime), file, reader) of the document this worker process last read from
+_worker_document = None
+
+
+def _worker_reader(path):
+    """Reader for a document, opened once per worker however many batches it extracts."""
+    global _worker_document
+    # Temp names can be reused by a later upload, so the file's identity is part of the key
+    stat = os.stat(path)
+    identity = (path, stat.st_ino, stat.st_mtime_ns)
+    if _worker_document is None or _worker_document[0] != identity:
+        import PyPDF2
+        if _worker_document is not None:
+            _worker_document[1].close()
+            _worker_document = None
+        # Read from the file as pages are needed rather than loading it all
+        pdf_file = open(path, "rb")
+        _worker_document = (identity, pdf_file, PyPDF2.PdfReader(pdf_file))
+    return _worker_document[2]
+
+
+def _extract_range(path, start, end):
+    """
+    Extract the text of pages [start, end). Runs in a worker process.
+
+    Args:
+        path (str): PDF file written by iter_pages for the workers
+
+    Returns:
+        list: (page_index, text) tuples
+    """
+    reader = _worker_reader(path)
+    return [(index, reader.pages[index].extract_text() or "") for index in range(start, end)]
+
+
+def count_pages(data):
+    """
+    Number of pages in a PDF
+
+    Args:
+        data (bytes): PDF file contents
+
+    Returns:
+        int: Page count
+    """
+    return len(_reader(data).pages)
+
+
+def iter_pages(data, first_page=1, last_page=None, reader=None):
+    """
+    Yield the text of each page in order, as soon as it is available
+
+    Large page ranges are split into batches that are extracted in parallel by a
+    shared process pool; small ranges, or any range on a single CPU, are extracted
+    in this process. Workers are sent the path of a temporary copy of the file
+    and page ranges, not the document itself, and each opens it once. Closing the
+    generator early cancels batches that have not started.
+
+    Args:
+        data (bytes): PDF file contents
+        first_page (int): First page to extract, 1-based
+        last_page (int, optional): Last page to extract, inclusive; defaults to the last page
+        reader (PyPDF2.PdfReader, optional): Reader already opened on data
+
+    Yields:
+        tuple: (page_number, text) with 1-based page numbers
+    """
+    reader = reader or _reader(data)
+    total = len(reader.pages)
+    start = max(0, first_page - 1)
+    end = total if last_page is None else min(total, last_page)
+    if start >= end:
+        return
+
+    # Worker processes open the document again, which only pays off with real parallelism
+    if end - start < PDF_SETTINGS["parallel_min_pages"] or worker_count() < 2:
+        for index in range(start, end):
+            yield index + 1, reader.pages[index].extract_text() or ""
+        return
+
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as pdf_file:
+        pdf_file.write(data)
+    batch = PDF_SETTINGS["pages_per_task"]
+    futures = []
+    try:
+        pool = get_process_pool()
+        futures = [
+            pool.submit(_extract_range, pdf_file.name, batch_start, min(end, batch_start + batch))
+            for batch_start in range(start, end, batch)
+        ]
+
+        # Batches finish in any order; wait on them in page order so pages stream sequentially
+        for future in futures:
+            for index, text in future.result():
+                yield index + 1, text
+    except BrokenProcessPool:
+        reset_process_pool()
+        raise
+    finally:
+        for future in futures:
+            future.cancel()
+        try:
+            os.remove(pdf_file.name)
+        except OSError:
+            # Still open in a worker on Windows; left for the OS temp cleanup
+            pass
+
+
+def extract_text(data, first_page=1, last_page=None, max_chars=None, progress_callback=None):
+    """
+    Extract a PDF's text with page-range and size limits
+
+    Args:
+        data (bytes): PDF file contents
+        first_page (int): First page to extract, 1-based
+        last_page (int, optional): Last page to extract, inclusive
+        max_chars (int, optional): Stop once this many characters have been extracted
+        progress_callback (callable, optional): Called as progress_callback(pages_done, pages_total)
+
+    Returns:
+        tuple: (str text, dict report with pages_total, pages_extracted and truncated)
+    """
+    # Parsed once here and shared with iter_pages
+    reader = _reader(data)
+    total = len(reader.pages)
+    last = total if last_page is None else min(total, last_page)
+    pages_wanted = max(0, last - max(1, first_page) + 1)
+
+    # Collect parts and join once; repeated string concatenation is quadratic
+    parts = []
+    chars = 0
+    pages_done = 0
+    truncated = False
+    pages = iter_pages(data, first_page, last, reader)
+    try:
+        for page_number, text in pages:
+            if max_chars is not None and chars + len(text) > max_chars:
+                parts.append(text[:max(0, max_chars - chars)])
+                truncated = True
+                break
+            parts.append(text)
+            chars += len(text)
+            pages_done += 1
+            if progress_callback:
+                progress_callback(pages_done, pages_wanted)
+            if max_chars is not None and chars >= max_chars:
+                truncated = pages_done < pages_wanted
+                break
+            # The page separator counts towards max_chars too
+            separator = "\n\n" if max_chars is None else "\n\n"[:max_chars - chars]
+            parts.append(separator)
+            chars += len(separator)
+    finally:
+        pages.close()
+
+    return "".join(parts), {
+        "pages_total": total,
+        "pages_extracted": pages_done,
+        "truncated": truncated or pages_wanted < total
+    }
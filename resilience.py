@@ -0,0 +1,304 @@
+import asyncio
+import hashlib
+import threading
+import time
+
+from config import RATE_LIMIT_SETTINGS, CIRCUIT_BREAKER_SETTINGS
+from model_stats import get_model_stats
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class TokenBucket:
+    """Thread-safe token bucket: refills at rate tokens per second up to capacity."""
+
+    def __init__(self, rate, capacity):
+        """
+        Args:
+            rate (float): Tokens added per second
+            capacity (float): Maximum tokens, i.e. the allowed burst
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens=1):
+        """
+        Take tokens without waiting
+
+        Returns:
+            float: 0 if the tokens were taken, otherwise seconds until they will be available
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0.0
+            return (tokens - self.tokens) / self.rate
+
+    def acquire(self, tokens=1, max_wait=0.0):
+        """
+        Take tokens, waiting up to max_wait seconds for them
+
+        Returns:
+            bool: True if the tokens were taken
+        """
+        deadline = time.monotonic() + max_wait
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait == 0.0:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Per-model circuit breaker.
+
+    Opens after failure_threshold consecutive failures, where a response slower
+    than the latency SLO also counts as a failure. While open, calls are rejected
+    without touching the network. After probe_interval seconds the breaker goes
+    half-open and lets a single probe through: success closes it, failure opens
+    it again.
+    """
+
+    def __init__(self, failure_threshold=None, latency_slo_ms=None, probe_interval=None):
+        self.failure_threshold = failure_threshold or CIRCUIT_BREAKER_SETTINGS["failure_threshold"]
+        self.latency_slo_ms = latency_slo_ms or CIRCUIT_BREAKER_SETTINGS["latency_slo_ms"]
+        self.probe_interval = probe_interval or CIRCUIT_BREAKER_SETTINGS["probe_interval"]
+
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.probe_in_flight = False
+        self.last_error = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        Check whether a call may go out now
+
+        Returns:
+            bool: False while the circuit is open or a half-open probe is already running
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.probe_interval:
+                self.state = HALF_OPEN
+                self.probe_in_flight = False
+            if self.state == HALF_OPEN and not self.probe_in_flight:
+                self.probe_in_flight = True
+                return True
+            return False
+
+    def retry_in(self):
+        """Return seconds until the next probe is allowed (0 unless open)."""
+        with self._lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(0.0, self.probe_interval - (time.monotonic() - self.opened_at))
+
+    def _trip(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.probe_in_flight = False
+
+    def record_success(self, latency_ms=None):
+        """Record a completed call; a call slower than the SLO is recorded as a failure."""
+        if latency_ms is not None and latency_ms > self.latency_slo_ms:
+            self.record_failure(f"Latency {latency_ms:.0f} ms exceeded the {self.latency_slo_ms:.0f} ms SLO")
+            return
+        with self._lock:
+            self.state = CLOSED
+            self.consecutive_failures = 0
+            self.probe_in_flight = False
+
+    def record_failure(self, error=None):
+        """Record a failed call, opening the circuit if the threshold is reached."""
+        with self._lock:
+            self.consecutive_failures += 1
+            self.last_error = error
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                self._trip()
+
+    def release_probe(self):
+        """Give back a half-open probe slot for a call that was never sent."""
+        with self._lock:
+            self.probe_in_flight = False
+
+    def snapshot(self):
+        """
+        Get the breaker state for display
+
+        Returns:
+            dict: state, consecutive_failures, retry_in seconds and last_error
+        """
+        retry_in = self.retry_in()
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "retry_in": round(retry_in, 1),
+                "last_error": self.last_error
+            }
+
+
+_registry_lock = threading.Lock()
+_model_buckets = {}
+_key_buckets = {}
+_breakers = {}
+
+
+def _get_or_create(registry, key, factory):
+    with _registry_lock:
+        if key not in registry:
+            registry[key] = factory()
+        return registry[key]
+
+
+def get_breaker(model_id):
+    """
+    Get the circuit breaker for a model, creating it on first use
+
+    Returns:
+        CircuitBreaker: Breaker shared by all sessions
+    """
+    return _get_or_create(_breakers, model_id, CircuitBreaker)
+
+
+def _model_bucket(model_id):
+    rate, burst = RATE_LIMIT_SETTINGS["model_limits"].get(
+        model_id, (RATE_LIMIT_SETTINGS["model_rate"], RATE_LIMIT_SETTINGS["model_burst"])
+    )
+    return _get_or_create(_model_buckets, model_id, lambda: TokenBucket(rate, burst))
+
+
+def _key_bucket(api_key):
+    # Keep only a digest of the key in memory
+    digest = hashlib.sha256(api_key.encode()).hexdigest()[:16]
+    return _get_or_create(
+        _key_buckets, digest,
+        lambda: TokenBucket(RATE_LIMIT_SETTINGS["key_rate"], RATE_LIMIT_SETTINGS["key_burst"])
+    )
+
+
+def admit(model_id, api_key):
+    """
+    Apply the circuit breaker and rate limits before sending a request
+
+    Args:
+        model_id (str): Model the request is for
+        api_key (str): API key the request is sent with
+
+    Returns:
+        str: Error message if the request must not be sent, otherwise None
+    """
+    breaker = get_breaker(model_id)
+    if not breaker.allow():
+        return (f"{model_id} is temporarily unavailable after repeated failures; "
+                f"retrying in {breaker.retry_in():.0f}s. Try another model.")
+
+    max_wait = RATE_LIMIT_SETTINGS["max_wait"]
+    if not _model_bucket(model_id).acquire(max_wait=max_wait):
+        release_probe(model_id)
+        return f"Rate limit reached for {model_id}. Please wait a moment and try again."
+    if not _key_bucket(api_key).acquire(max_wait=max_wait):
+        release_probe(model_id)
+        return "Rate limit reached for this API key. Please wait a moment and try again."
+    return None
+
+
+async def admit_async(model_id, api_key, max_wait=None):
+    """
+    admit() for coroutines: waits for rate-limit tokens without blocking the event loop
+
+    Args:
+        model_id (str): Model the request is for
+        api_key (str): API key the request is sent with
+        max_wait (float, optional): Seconds to wait for tokens, defaults to
+            RATE_LIMIT_SETTINGS["max_wait"]
+
+    Returns:
+        str: Error message if the request must not be sent, otherwise None
+    """
+    breaker = get_breaker(model_id)
+    if not breaker.allow():
+        return (f"{model_id} is temporarily unavailable after repeated failures; "
+                f"retrying in {breaker.retry_in():.0f}s. Try another model.")
+
+    deadline = time.monotonic() + (RATE_LIMIT_SETTINGS["max_wait"] if max_wait is None else max_wait)
+    limits = (
+        (_model_bucket(model_id), f"Rate limit reached for {model_id}. Please wait a moment and try again."),
+        (_key_bucket(api_key), "Rate limit reached for this API key. Please wait a moment and try again.")
+    )
+    try:
+        for bucket, message in limits:
+            while True:
+                wait = bucket.try_acquire()
+                if wait == 0.0:
+                    break
+                if time.monotonic() + wait > deadline:
+                    release_probe(model_id)
+                    return message
+                await asyncio.sleep(wait)
+    except asyncio.CancelledError:
+        release_probe(model_id)
+        raise
+    return None
+
+
+def release_probe(model_id):
+    """Give back a half-open probe slot taken by admit() for a request that was not sent."""
+    get_breaker(model_id).release_probe()
+
+
+def record_outcome(model_id, status_code=None, latency_ms=None, error=None):
+    """
+    Feed the result of a request to the model's circuit breaker
+
+    Connection errors, timeouts, 429 and 5xx responses count as failures. Other
+    responses, including 4xx client errors, show the model is reachable and count
+    as successes, subject to the latency SLO. The outcome is also added to the
+    rolling model statistics.
+
+    Args:
+        model_id (str): Model the request was for
+        status_code (int, optional): HTTP status, None if no response was received
+        latency_ms (float, optional): Time to the full response (or first token when streaming)
+        error (str, optional): Error description
+    """
+    breaker = get_breaker(model_id)
+    if status_code is None and error is not None:
+        breaker.record_failure(error)
+        get_model_stats().record(model_id, error=True)
+    elif status_code is not None and (status_code == 429 or status_code >= 500):
+        breaker.record_failure(error or f"HTTP {status_code}")
+        get_model_stats().record(model_id, error=True)
+    else:
+        breaker.record_success(latency_ms)
+        get_model_stats().record(model_id, latency_ms)
+
+
+def get_model_states(model_ids):
+    """
+    Get breaker states for display
+
+    Args:
+        model_ids (iterable): Model IDs to report
+
+    Returns:
+        dict: model_id -> CircuitBreaker.snapshot()
+    """
+    return {model_id: get_breaker(model_id).snapshot() for model_id in model_ids}
@@ -0,0 +1,229 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from config import CACHE_SETTINGS
+
+
+def request_key(model_id, messages, temperature, max_tokens):
+    """
+    Canonical hash of a chat completion request
+
+    Args:
+        model_id (str): ID of the model
+        messages (list): List of message objects
+        temperature (float): Temperature parameter
+        max_tokens (int): Maximum tokens for response
+
+    Returns:
+        str: Hex SHA-256 digest that is identical for identical requests
+    """
+    canonical = json.dumps(
+        {
+            "model": model_id,
+            "messages": messages,
+            "temperature": float(temperature),
+            "max_tokens": int(max_tokens)
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier cache of API responses: an in-process LRU bounded by size in bytes,
+    backed by a SQLite table whose entries expire after a TTL.
+    """
+
+    def __init__(self, memory_max_bytes=None, db_path=None, ttl_seconds=None):
+        """
+        Args:
+            memory_max_bytes (int, optional): Size limit of the in-memory tier
+            db_path (str, optional): SQLite file for the persistent tier, None to use
+                CACHE_SETTINGS, "" to disable the persistent tier
+            ttl_seconds (float, optional): Lifetime of persistent entries
+        """
+        self.memory_max_bytes = memory_max_bytes or CACHE_SETTINGS["memory_max_bytes"]
+        self.ttl_seconds = ttl_seconds or CACHE_SETTINGS["ttl_seconds"]
+        if db_path is None:
+            db_path = CACHE_SETTINGS["db_path"]
+
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expired": 0,
+            "stores": 0
+        }
+
+        self.conn = None
+        if db_path:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # One connection shared by all threads, serialised by self._lock
+            self.conn = sqlite3.connect(db_path, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT,
+                created_at REAL,
+                expires_at REAL
+            )
+            ''')
+            self.conn.commit()
+
+    def _remember(self, key, value):
+        """Put a serialised value in the memory tier, evicting least recently used entries."""
+        size = len(key) + len(value)
+        if size > self.memory_max_bytes:
+            return
+        if key in self._memory:
+            self._memory_bytes -= self._memory.pop(key)[1]
+        self._memory[key] = (value, size)
+        self._memory_bytes += size
+        while self._memory_bytes > self.memory_max_bytes:
+            _, (_, evicted_size) = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted_size
+            self.stats["evictions"] += 1
+
+    def get(self, key):
+        """
+        Look up a response
+
+        Args:
+            key (str): Key from request_key()
+
+        Returns:
+            dict: Cached response with "timing" describing the hit, or None on a miss
+        """
+        start = time.perf_counter()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                value, tier = entry[0], "memory"
+            else:
+                value, tier = None, "disk"
+                if self.conn is not None:
+                    row = self.conn.execute(
+                        "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+                    ).fetchone()
+                    if row and row[1] < time.time():
+                        self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                        self.conn.commit()
+                        self.stats["expired"] += 1
+                    elif row:
+                        value = row[0]
+                        self._remember(key, value)
+                        self.stats["disk_hits"] += 1
+                if value is None:
+                    self.stats["misses"] += 1
+                    return None
+
+        response = json.loads(value)
+        response["timing"] = {
+            "cache_hit": tier,
+            "total_ms": round((time.perf_counter() - start) * 1000, 2)
+        }
+        return response
+
+    def set(self, key, response):
+        """
+        Store a successful response in both tiers
+
+        Args:
+            key (str): Key from request_key()
+            response (dict): API response; per-request timing is not stored
+        """
+        if "error" in response:
+            return
+        value = json.dumps({k: v for k, v in response.items() if k != "timing"}, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._remember(key, value)
+            self.stats["stores"] += 1
+            if self.conn is not None:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                    (key, value, now, now + self.ttl_seconds)
+                )
+                # Prune expired rows now and then rather than on every write
+                if self.stats["stores"] % 100 == 0:
+                    self.conn.execute("DELETE FROM responses WHERE expires_at < ?", (now,))
+                self.conn.commit()
+
+    def clear(self):
+        """Remove every entry from both tiers."""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            if self.conn is not None:
+                self.conn.execute("DELETE FROM responses")
+                self.conn.commit()
+
+    def get_stats(self):
+        """
+        Get cache counters
+
+        Returns:
+            dict: Hit, miss, eviction and store counts plus the memory tier size
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_entries"] = len(self._memory)
+            stats["memory_bytes"] = self._memory_bytes
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+
+def should_cache(temperature, use_cache=None):
+    """
+    Decide whether a request may be served from or stored in the cache
+
+    Args:
+        temperature (float): Temperature of the request
+        use_cache (bool, optional): Explicit opt-in or opt-out; by default only
+            deterministic (temperature 0) requests are cached
+
+    Returns:
+        bool: True if the cache should be used
+    """
+    if not CACHE_SETTINGS["enabled"]:
+        return False
+    if use_cache is None:
+        return float(temperature) == 0.0
+    return bool(use_cache)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """
+    Get the process-wide response cache, creating it on first use
+
+    Returns:
+        ResponseCache: Shared cache instance
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache()
+    return _cache
@@ -0,0 +1,316 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from config import RETRIEVAL_SETTINGS, INGEST_SETTINGS
+from context_builder import count_tokens
+
+_TERM_PATTERN = re.compile(r"\w+", re.UNICODE)
+_PARAGRAPH_PATTERN = re.compile(r"\n\s*\n")
+_WORD_PATTERN = re.compile(r"\S+\s*")
+
+
+def tokenize(text):
+    """Lowercased word terms used for indexing and queries."""
+    return _TERM_PATTERN.findall(text.lower())
+
+
+def chunk_text(text, chunk_tokens=None):
+    """
+    Split a document into chunks of roughly chunk_tokens tokens
+
+    Paragraphs are packed together until a chunk is full; paragraphs larger than
+    a chunk are split between words.
+
+    Args:
+        text (str): Document text
+        chunk_tokens (int, optional): Target chunk size, defaults to RETRIEVAL_SETTINGS
+
+    Returns:
+        list: Chunk strings in document order
+    """
+    chunk_tokens = chunk_tokens or RETRIEVAL_SETTINGS["chunk_tokens"]
+
+    pieces = []
+    for paragraph in _PARAGRAPH_PATTERN.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        tokens = count_tokens(paragraph)
+        if tokens <= chunk_tokens:
+            pieces.append((paragraph, tokens))
+            continue
+        words, size = [], 0
+        for word in _WORD_PATTERN.findall(paragraph):
+            word_tokens = count_tokens(word)
+            if words and size + word_tokens > chunk_tokens:
+                pieces.append(("".join(words).strip(), size))
+                words, size = [], 0
+            words.append(word)
+            size += word_tokens
+        if words:
+            pieces.append(("".join(words).strip(), size))
+
+    chunks, current, size = [], [], 0
+    for piece, tokens in pieces:
+        if current and size + tokens > chunk_tokens:
+            chunks.append("\n\n".join(current))
+            current, size = [], 0
+        current.append(piece)
+        size += tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+class BM25Index:
+    """
+    Okapi BM25 index over the chunks of one document.
+
+    Postings are stored as flat NumPy arrays sorted by term, so scoring a query
+    is a handful of vectorized operations per query term.
+    """
+
+    def __init__(self, chunks, k1=None, b=None):
+        """
+        Args:
+            chunks (list): Chunk strings in document order
+            k1 (float, optional): Term frequency saturation, defaults to RETRIEVAL_SETTINGS
+            b (float, optional): Length normalization, defaults to RETRIEVAL_SETTINGS
+        """
+        self.chunks = chunks
+        self.chunk_tokens = np.array([count_tokens(chunk) for chunk in chunks], dtype=np.int64)
+        self.total_tokens = int(self.chunk_tokens.sum())
+        self.k1 = RETRIEVAL_SETTINGS["k1"] if k1 is None else k1
+        self.b = RETRIEVAL_SETTINGS["b"] if b is None else b
+
+        self.vocabulary = {}
+        term_ids, doc_ids = [], []
+        lengths = np.zeros(len(chunks), dtype=np.float64)
+        for doc, chunk in enumerate(chunks):
+            terms = tokenize(chunk)
+            lengths[doc] = len(terms)
+            term_ids.extend(self.vocabulary.setdefault(term, len(self.vocabulary)) for term in terms)
+            doc_ids.extend([doc] * len(terms))
+
+        n_docs = max(1, len(chunks))
+        pairs, tf = np.unique(
+            np.asarray(term_ids, dtype=np.int64) * n_docs + np.asarray(doc_ids, dtype=np.int64),
+            return_counts=True
+        )
+        # np.unique sorts the pairs, which groups postings by term
+        self.posting_terms = pairs // n_docs
+        self.posting_docs = pairs % n_docs
+        self.posting_tf = tf.astype(np.float64)
+        self.offsets = np.searchsorted(self.posting_terms, np.arange(len(self.vocabulary) + 1))
+
+        df = np.diff(self.offsets).astype(np.float64)
+        self.idf = np.log(1.0 + (len(chunks) - df + 0.5) / (df + 0.5))
+        self.length_norm = 1.0 - self.b + self.b * lengths / (lengths.mean() if len(chunks) and lengths.mean() else 1.0)
+
+    def score(self, query):
+        """
+        BM25 score of every chunk for a query
+
+        Args:
+            query (str): Query text
+
+        Returns:
+            numpy.ndarray: One score per chunk
+        """
+        scores = np.zeros(len(self.chunks), dtype=np.float64)
+        for term in set(tokenize(query)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = self.posting_docs[start:end]
+            tf = self.posting_tf[start:end]
+            scores[docs] += self.idf[term_id] * tf * (self.k1 + 1) / (tf + self.k1 * self.length_norm[docs])
+        return scores
+
+    def search(self, query, token_budget, top_k=None):
+        """
+        Pick the most relevant chunks that fit a token budget
+
+        When no chunk matches the query (e.g. "summarize this"), chunks are taken
+        from the start of the document instead.
+
+        Args:
+            query (str): Query text
+            token_budget (int): Tokens the selected chunks may use
+            top_k (int, optional): Maximum chunks, defaults to RETRIEVAL_SETTINGS
+
+        Returns:
+            list: Indexes of the selected chunks in document order
+        """
+        top_k = top_k or RETRIEVAL_SETTINGS["top_k"]
+        scores = self.score(query)
+        if scores.any():
+            ranked = np.argsort(-scores, kind="stable")
+            ranked = ranked[scores[ranked] > 0]
+        else:
+            ranked = np.arange(len(self.chunks))
+
+        selected, used = [], 0
+        for doc in ranked:
+            if len(selected) >= top_k:
+                break
+            if used + self.chunk_tokens[doc] > token_budget:
+                continue
+            selected.append(int(doc))
+            used += int(self.chunk_tokens[doc])
+        return sorted(selected)
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def document_hash(text):
+    """Hex SHA-256 of a document's text."""
+    return hashlib.sha256(text.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+def get_index(text, content_hash=None):
+    """
+    Get the index for a document, building it once per document hash
+
+    Args:
+        text (str): Document text
+        content_hash (str, optional): Precomputed document_hash(text)
+
+    Returns:
+        BM25Index: Index of the document's chunks
+    """
+    key = (content_hash or document_hash(text), RETRIEVAL_SETTINGS["chunk_tokens"])
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+            return index
+
+    index = BM25Index(chunk_text(text))
+    with _indexes_lock:
+        _indexes[key] = index
+        while len(_indexes) > RETRIEVAL_SETTINGS["index_cache_size"]:
+            _indexes.popitem(last=False)
+    return index
+
+
+def needs_retrieval(file_content):
+    """
+    Whether a document is too large to send whole
+
+    Args:
+        file_content (str): Extracted document text
+
+    Returns:
+        bool: True if it has more than RETRIEVAL_SETTINGS["min_file_tokens"] tokens
+    """
+    # A text never has more tokens than characters, so short ones skip the index
+    if len(file_content) <= RETRIEVAL_SETTINGS["min_file_tokens"]:
+        return False
+    return get_index(file_content).total_tokens > RETRIEVAL_SETTINGS["min_file_tokens"]
+
+
+def select_file_context(file_content, query, token_budget=None):
+    """
+    Reduce a large document to the excerpts relevant to a query
+
+    Documents under RETRIEVAL_SETTINGS["min_file_tokens"] are returned whole.
+
+    Args:
+        file_content (str): Extracted document text
+        query (str): The user's current message
+        token_budget (int, optional): Tokens the excerpts may use, defaults to
+            RETRIEVAL_SETTINGS["context_tokens"]
+
+    Returns:
+        tuple: (str content to send, dict report with file_tokens, chunks_total,
+            chunks_sent and tokens_sent, or None when the document was sent whole)
+    """
+    if not needs_retrieval(file_content):
+        return file_content, None
+    return relevant_excerpts(file_content, query, token_budget or RETRIEVAL_SETTINGS["context_tokens"])
+
+
+def relevant_excerpts(file_content, query, token_budget):
+    """
+    The excerpts of a document most relevant to a query, whatever its size
+
+    Args:
+        file_content (str): Extracted document text
+        query (str): The user's current message
+        token_budget (int): Tokens the excerpts may use
+
+    Returns:
+        tuple: (str excerpts, dict report as for select_file_context)
+    """
+    index = get_index(file_content)
+    selected = index.search(query, token_budget)
+
+    excerpts = [
+        f"[Excerpt {n} of {len(selected)}, section {doc + 1} of {len(index.chunks)}]\n{index.chunks[doc]}"
+        for n, doc in enumerate(selected, start=1)
+    ]
+    content = "Relevant excerpts of the file:\n\n" + "\n\n".join(excerpts)
+    report = {
+        "file_tokens": index.total_tokens,
+        "chunks_total": len(index.chunks),
+        "chunks_sent": len(selected),
+        "tokens_sent": int(sum(index.chunk_tokens[doc] for doc in selected))
+    }
+    return content, report
+
+
+def select_files_context(files, query, token_budget=None):
+    """
+    Fit several documents into one token budget, relevant excerpts first
+
+    The budget is shared out by water-filling: documents smaller than an equal
+    share are sent whole and what they leave unused is split among the rest,
+    which are reduced to their excerpts most relevant to the query.
+
+    Args:
+        files (list): Dicts with the name and content of each document
+        query (str): The user's current message
+        token_budget (int, optional): Tokens all documents may use together,
+            defaults to INGEST_SETTINGS["context_tokens"]
+
+    Returns:
+        tuple: (str content to send, dict report with the select_file_context keys
+            summed over documents plus files)
+    """
+    token_budget = token_budget or INGEST_SETTINGS["context_tokens"]
+    indexes = [get_index(file["content"]) for file in files]
+
+    # Smallest documents first, so every one left over gets at least an equal share
+    shares = {}
+    remaining = token_budget
+    order = sorted(range(len(files)), key=lambda i: indexes[i].total_tokens)
+    for position, i in enumerate(order):
+        share = remaining // (len(order) - position)
+        shares[i] = min(indexes[i].total_tokens, share)
+        remaining -= shares[i]
+
+    sections = []
+    report = {"files": len(files), "file_tokens": 0, "chunks_total": 0, "chunks_sent": 0, "tokens_sent": 0}
+    for i, (file, index) in enumerate(zip(files, indexes)):
+        if index.total_tokens <= shares[i]:
+            content = file["content"]
+            file_report = {
+                "file_tokens": index.total_tokens,
+                "chunks_total": len(index.chunks),
+                "chunks_sent": len(index.chunks),
+                "tokens_sent": index.total_tokens
+            }
+        else:
+            content, file_report = relevant_excerpts(file["content"], query, shares[i])
+        sections.append(f"--- {file['name']} ---\n{content}")
+        for name, value in file_report.items():
+            report[name] += value
+    return "\n\n".join(sections), report
@@ -0,0 +1,189 @@
+import threading
+
+
+class _Call:
+    """An in-flight call that duplicate callers wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exception = None
+        self.waiters = 0
+
+
+class _Stream:
+    """An in-flight stream whose events are replayed to every reader."""
+
+    def __init__(self):
+        self.events = []
+        self.finished = False
+        self.readers = 0
+        self.changed = threading.Condition()
+
+
+class SingleFlight:
+    """
+    Collapse concurrent identical calls into one.
+
+    The first caller for a key runs the function; callers arriving with the same
+    key while it is running wait for it and receive the same result, or the same
+    exception. Once the call finishes the key is forgotten, so later callers run
+    the function again (the response cache handles reuse after completion).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._streams = {}
+        self.stats = {
+            "calls": 0,
+            "executions": 0,
+            "collapsed": 0
+        }
+
+    def do(self, key, fn):
+        """
+        Run fn once per key among concurrent callers
+
+        Args:
+            key (str): Identity of the call, e.g. response_cache.request_key()
+            fn (callable): Zero-argument function performing the call
+
+        Returns:
+            tuple: (result, shared) where shared is True if this caller waited on
+                another caller's execution
+        """
+        with self._lock:
+            self.stats["calls"] += 1
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.stats["collapsed"] += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.stats["executions"] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.exception is not None:
+                raise call.exception
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.exception = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stream(self, key, fn):
+        """
+        Share one streaming call per key among concurrent readers
+
+        The first reader for a key starts fn on a background thread; every reader,
+        including those joining later, receives all of its events from the start,
+        as they arrive. The upstream stream is closed once every reader has
+        stopped iterating.
+
+        Args:
+            key (str): Identity of the call
+            fn (callable): Zero-argument function returning an iterator of events.
+                It runs on another thread, so must not depend on thread-local state
+                such as Streamlit's session.
+
+        Yields:
+            tuple: (event, shared) where shared is True if this reader joined
+                another reader's stream
+        """
+        with self._lock:
+            self.stats["calls"] += 1
+            call = self._streams.get(key)
+            shared = call is not None
+            if shared:
+                self.stats["collapsed"] += 1
+            else:
+                call = _Stream()
+                self._streams[key] = call
+                self.stats["executions"] += 1
+                threading.Thread(target=self._pump, args=(key, call, fn),
+                                 name="single-flight-stream", daemon=True).start()
+            call.readers += 1
+
+        try:
+            index = 0
+            while True:
+                with call.changed:
+                    while index >= len(call.events) and not call.finished:
+                        call.changed.wait()
+                    if index >= len(call.events):
+                        return
+                    event = call.events[index]
+                index += 1
+                yield event, shared
+        finally:
+            with self._lock:
+                call.readers -= 1
+
+    def _pump(self, key, call, fn):
+        """Read fn's events into call until it ends or no reader is left."""
+        upstream = None
+        try:
+            upstream = iter(fn())
+            for event in upstream:
+                with call.changed:
+                    call.events.append(event)
+                    call.changed.notify_all()
+                with self._lock:
+                    if call.readers == 0:
+                        # Nobody is listening; later callers start a new stream
+                        if self._streams.get(key) is call:
+                            del self._streams[key]
+                        break
+        except Exception as e:
+            with call.changed:
+                call.events.append({"error": f"An error occurred: {str(e)}"})
+        finally:
+            if upstream is not None and hasattr(upstream, "close"):
+                upstream.close()
+            with self._lock:
+                if self._streams.get(key) is call:
+                    del self._streams[key]
+            with call.changed:
+                call.finished = True
+                call.changed.notify_all()
+
+    def in_flight(self):
+        """Return the number of keys currently being executed."""
+        with self._lock:
+            return len(self._calls) + len(self._streams)
+
+    def get_stats(self):
+        """
+        Get coalescing counters
+
+        Returns:
+            dict: Total calls, executions that reached the function, and calls collapsed
+                onto an in-flight execution
+        """
+        with self._lock:
+            return dict(self.stats)
+
+
+_chat_flights = SingleFlight()
+
+
+def get_chat_flights():
+    """
+    Get the process-wide SingleFlight used for chat completion requests
+
+    Returns:
+        SingleFlight: Shared instance
+    """
+    return _chat_flights
@@ -0,0 +1,187 @@
+import re
+import time
+
+from config import SUMMARY_SETTINGS
+from context_builder import count_tokens, message_tokens, prompt_budget, FILE_PREAMBLE
+from retrieval import chunk_text
+from async_api import call_euron_api_many
+from response_cache import request_key, should_cache, get_response_cache
+
+_DOCUMENT_WORDS = r"(?:document|file|paper|pdf|text|report|article|book|chapter|upload|contents?)s?"
+
+# Requests for a summary of the uploaded document as a whole. Data questions that
+# merely use the word ("summary statistics", "summarize sales by region") do not match.
+_SUMMARY_PATTERN = re.compile(
+    # "summarize", "can you summarise this?", "summarize it please"
+    r"\bsummari[sz]e(?:\s+(?:it|this|that|everything|all of it))?(?:\s+(?:for me|please))?\s*[.!?]*\s*$"
+    # "summarize the whole paper", "overview of this document"
+    r"|\b(?:summari[sz]e|summary of|overview of|gist of)\s+"
+    r"(?:(?:this|the|that|my|whole|entire|full|uploaded|attached)\s+)*" + _DOCUMENT_WORDS + r"\b"
+    # "give me a short summary", "what's the gist?"
+    r"|\b(?:a|an|the)\s+(?:\w+\s+)?(?:summary|overview|gist)(?:\s+of\s+(?:it|this|that))?\s*[.!?]*\s*$"
+    r"|\btl;?dr\b|\bkey (?:points|takeaways|findings)\b|\bmain (?:points|ideas)\b",
+    re.IGNORECASE
+)
+
+MAP_PROMPT = (
+    "You are summarizing one section of a longer document. Write a concise summary of "
+    "this section that keeps its key facts, figures, names and conclusions."
+)
+REDUCE_PROMPT = (
+    "The following are summaries of consecutive sections of one document. Combine them "
+    "into a single coherent summary that keeps the key facts, figures, names and conclusions."
+)
+
+
+class SummaryError(Exception):
+    """Raised when part of a map-reduce summary could not be produced."""
+
+
+def is_summary_request(query):
+    """
+    Whether a chat message asks for a summary of the uploaded document
+
+    Args:
+        query (str): The user's message
+
+    Returns:
+        bool: True for requests like "summarize this" or "what are the key points"
+    """
+    return bool(_SUMMARY_PATTERN.search(query))
+
+
+def needs_map_reduce(text, model_id, max_tokens, reserved_tokens=0):
+    """
+    Whether a document is too large to send whole to a model
+
+    Args:
+        text (str): Document text
+        model_id (str): Model that answers the request
+        max_tokens (int): Tokens reserved for the response
+        reserved_tokens (int): Prompt tokens needed by the rest of the request,
+            such as the query and any image
+
+    Returns:
+        bool: True if the document does not fit the model's MODEL_CONTEXT_BUDGETS
+            budget next to the rest of the request
+    """
+    available = (prompt_budget(model_id, max_tokens) - reserved_tokens
+                 - message_tokens({"role": "system", "content": FILE_PREAMBLE}))
+    # A text never has more tokens than characters, so short ones need no count
+    if len(text) <= available:
+        return False
+    return count_tokens(text) > available
+
+
+def _summarize_all(model_id, api_key, prompt, texts, report):
+    """
+    Summarize texts concurrently, serving repeated texts from the response cache
+
+    Returns:
+        list: Summary text per input text, in order
+
+    Raises:
+        SummaryError: If any request fails; the ones that succeeded stay cached
+    """
+    cache = get_response_cache() if should_cache(0.0, use_cache=True) else None
+    requests = [
+        {
+            "messages": [
+                {"role": "system", "content": prompt},
+                {"role": "user", "content": text}
+            ],
+            "model_id": model_id,
+            "temperature": 0.0,
+            "max_tokens": SUMMARY_SETTINGS["summary_max_tokens"]
+        }
+        for text in texts
+    ]
+    keys = [
+        request_key(r["model_id"], r["messages"], r["temperature"], r["max_tokens"])
+        for r in requests
+    ]
+
+    responses = [cache.get(key) if cache else None for key in keys]
+    missing = [i for i, response in enumerate(responses) if response is None]
+    report["requests"] += len(missing)
+    report["cached"] += len(texts) - len(missing)
+
+    # All misses go out at once; the scheduler's per-model limit bounds parallelism
+    if missing:
+        fetched = call_euron_api_many(
+            [requests[i] for i in missing], api_key, deadline=SUMMARY_SETTINGS["deadline"]
+        )
+        for i, response in zip(missing, fetched):
+            responses[i] = response
+            if cache and "error" not in response:
+                cache.set(keys[i], response)
+
+    summaries = []
+    for response in responses:
+        if "error" in response:
+            raise SummaryError(f"Summarizing a section failed: {response['error']}")
+        try:
+            summaries.append(response["choices"][0]["message"]["content"])
+        except (KeyError, IndexError):
+            raise SummaryError("Summarizing a section returned no text")
+    return summaries
+
+
+def _group_by_tokens(texts, max_tokens):
+    """Pack consecutive texts into groups of at most max_tokens (at least one text each)."""
+    groups, current, size = [], [], 0
+    for text in texts:
+        tokens = count_tokens(text)
+        if current and size + tokens > max_tokens:
+            groups.append(current)
+            current, size = [], 0
+        current.append(text)
+        size += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+
+def summarize_document(text, model_id, api_key):
+    """
+    Summarize a document of any length with map-reduce
+
+    The document is split into sections that are summarized concurrently (map);
+    the section summaries are then combined in groups that fit one request, level
+    by level, until a single summary remains (reduce). Every request is cached by
+    its content, so retries and follow-up questions only send what is missing.
+
+    Args:
+        text (str): Document text
+        model_id (str): Model that writes the summaries
+        api_key (str): Euron API key
+
+    Returns:
+        tuple: (str summary, dict report with sections, levels, requests, cached
+            and elapsed_ms)
+
+    Raises:
+        SummaryError: If a section or combination could not be summarized
+    """
+    start = time.perf_counter()
+    report = {"sections": 0, "levels": 0, "requests": 0, "cached": 0}
+
+    chunks = chunk_text(text, SUMMARY_SETTINGS["section_tokens"])
+    if not chunks:
+        raise SummaryError("The document has no text to summarize")
+    report["sections"] = len(chunks)
+    summaries = _summarize_all(model_id, api_key, MAP_PROMPT, chunks, report)
+    report["levels"] = 1
+
+    while len(summaries) > 1:
+        groups = _group_by_tokens(summaries, SUMMARY_SETTINGS["reduce_input_tokens"])
+        if len(groups) == len(summaries):
+            # Summaries too long to pair up; combine two at a time so the tree still shrinks
+            groups = [summaries[i:i + 2] for i in range(0, len(summaries), 2)]
+        summaries = _summarize_all(
+            model_id, api_key, REDUCE_PROMPT, ["\n\n---\n\n".join(group) for group in groups], report
+        )
+        report["levels"] += 1
+
+    report["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    return summaries[0], report
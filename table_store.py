@@ -0,0 +1,693 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from config import TABLE_SETTINGS
+
+NUMERIC = "numeric"
+CATEGORICAL = "categorical"
+DATETIME = "datetime"
+
+# Bump when the stored layout changes so old tables are not read
+TABLE_FORMAT_VERSION = "2"
+
+# Missing values in stored columns: NaN for numbers, code -1 for categories, NaT for datetimes
+_NAT = np.iinfo(np.int64).min
+
+
+def table_key(data, part=""):
+    """
+    Key of a table stored from an upload
+
+    Args:
+        data (bytes): Raw uploaded bytes
+        part (str): Distinguishes several tables of one upload, e.g. a sheet index
+
+    Returns:
+        str: Hex SHA-256 of the bytes, part and storage format version
+    """
+    digest = hashlib.sha256(data)
+    digest.update(f"\0{part}\0{TABLE_FORMAT_VERSION}".encode())
+    return digest.hexdigest()
+
+
+def table_exists(key, directory=None):
+    """Whether a table is stored under a key."""
+    return os.path.exists(os.path.join(table_path(key, directory), "meta.json"))
+
+
+def table_path(key, directory=None):
+    """Directory holding the stored table for a key."""
+    return os.path.join(directory or TABLE_SETTINGS["dir"], key)
+
+
+def _column_kind(series):
+    if pd.api.types.is_bool_dtype(series.dtype):
+        return CATEGORICAL
+    if pd.api.types.is_numeric_dtype(series.dtype):
+        return NUMERIC
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        return DATETIME
+    return CATEGORICAL
+
+
+def _category_labels(series):
+    """Values as category labels; whole floats read as in the file ("3", not "3.0")."""
+    if series.dtype.kind == "f":
+        values = series.dropna()
+        if len(values) and (values == np.floor(values)).all():
+            return series.astype("Int64").astype(str)
+    return series.astype(str)
+
+
+class TableWriter:
+    """
+    Converts a table delivered in DataFrame chunks into one .npy file per column.
+
+    Numbers are stored as float64, datetimes as int64 nanoseconds and everything
+    else as int32 category codes with the labels in a JSON file. A column's kind
+    comes from its first chunk; if a later chunk has values that are not numbers
+    (or dates), the column is converted to categories rather than storing those
+    values as missing. Chunks are appended
+    to raw files as they arrive, so memory stays bounded by the chunk size; the
+    table appears under its key atomically when close() is called. Nothing is
+    written to disk before the first chunk.
+    """
+
+    def __init__(self, key, name, directory=None):
+        """
+        Args:
+            key (str): Content hash identifying the table
+            name (str): Display name, e.g. the file or sheet name
+            directory (str, optional): Store directory, defaults to TABLE_SETTINGS["dir"]
+        """
+        self.path = table_path(key, directory)
+        self.temp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        self.name = name
+        self.columns = None
+        self.rows = 0
+        self._files = []
+        self._categories = []
+        # Per numeric column: whether every chunk so far had an integer dtype, so
+        # values converted to categories read as "3" rather than "3.0"
+        self._integral = []
+
+    def write(self, chunk):
+        """Append a DataFrame chunk; later chunks must have the same columns."""
+        if self.columns is None:
+            os.makedirs(self.temp_path, exist_ok=True)
+            self.columns = [
+                {"name": str(name), "kind": _column_kind(chunk.iloc[:, i]), "file": f"{i}.npy"}
+                for i, name in enumerate(chunk.columns)
+            ]
+            self._files = [open(os.path.join(self.temp_path, f"{i}.raw"), "wb") for i in range(len(self.columns))]
+            self._categories = [{} for _ in self.columns]
+            self._integral = [True for _ in self.columns]
+
+        for i, column in enumerate(self.columns):
+            series = chunk.iloc[:, i]
+            present = series.notna().to_numpy()
+            if column["kind"] == NUMERIC:
+                values = pd.to_numeric(series, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+                if (present & np.isnan(values)).any():
+                    self._to_categorical(i)
+                else:
+                    self._integral[i] = self._integral[i] and series.dtype.kind in "iu"
+            elif column["kind"] == DATETIME:
+                parsed = pd.to_datetime(series, errors="coerce")
+                if getattr(parsed.dt, "tz", None) is not None:
+                    parsed = parsed.dt.tz_localize(None)
+                values = parsed.to_numpy(dtype="datetime64[ns]").view(np.int64)
+                if (present & (values == _NAT)).any():
+                    self._to_categorical(i)
+            if column["kind"] == CATEGORICAL:
+                codes, labels = pd.factorize(_category_labels(series))
+                lookup = self._categories[i]
+                mapping = np.array([lookup.setdefault(label, len(lookup)) for label in labels], dtype=np.int32)
+                values = mapping[codes] if len(mapping) else np.zeros(len(series), dtype=np.int32)
+                values[~present] = -1
+            self._files[i].write(np.ascontiguousarray(values).tobytes())
+        self.rows += len(chunk)
+
+    def _to_categorical(self, i):
+        """Re-encode the values written so far for column i as category codes."""
+        column = self.columns[i]
+        if column["kind"] == NUMERIC:
+            dtype = np.float64
+            if self._integral[i]:
+                def label(value):
+                    return str(int(value)) if value.is_integer() else str(value)
+            else:
+                label = str
+        else:
+            dtype = np.int64
+            def label(value):
+                return str(pd.Timestamp(int(value)))
+
+        self._files[i].close()
+        raw_path = os.path.join(self.temp_path, f"{i}.raw")
+        codes_path = f"{raw_path}.codes"
+        lookup = self._categories[i]
+        with open(raw_path, "rb") as raw, open(codes_path, "wb") as out:
+            while True:
+                # Block by block, so memory stays bounded however much was written
+                block = np.fromfile(raw, dtype=dtype, count=TABLE_SETTINGS["convert_block_rows"])
+                if not block.size:
+                    break
+                present = ~np.isnan(block) if dtype is np.float64 else block != _NAT
+                uniques, inverse = np.unique(block[present], return_inverse=True)
+                mapping = np.array([lookup.setdefault(label(value.item()), len(lookup)) for value in uniques],
+                                   dtype=np.int32)
+                codes = np.full(len(block), -1, dtype=np.int32)
+                codes[present] = mapping[inverse] if len(mapping) else 0
+                out.write(codes.tobytes())
+        os.replace(codes_path, raw_path)
+        self._files[i] = open(raw_path, "ab")
+        column["kind"] = CATEGORICAL
+
+    def close(self):
+        """
+        Finish the table and publish it under its key
+
+        Returns:
+            str: Path of the stored table
+        """
+        columns = self.columns or []
+        for i, column in enumerate(columns):
+            self._files[i].close()
+            dtype = {NUMERIC: np.float64, DATETIME: np.int64, CATEGORICAL: np.int32}[column["kind"]]
+            raw_path = os.path.join(self.temp_path, f"{i}.raw")
+            # Prefix the raw values with a .npy header now that the row count is known
+            with open(os.path.join(self.temp_path, column["file"]), "wb") as out, open(raw_path, "rb") as raw:
+                np.lib.format.write_array_header_1_0(out, {
+                    "descr": np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                    "fortran_order": False,
+                    "shape": (self.rows,)
+                })
+                shutil.copyfileobj(raw, out)
+            os.remove(raw_path)
+            if column["kind"] == CATEGORICAL:
+                # Labels live beside the codes so opening a table stays cheap
+                column["categories"] = f"{i}.categories.json"
+                with open(os.path.join(self.temp_path, column["categories"]), "w", encoding="utf-8") as f:
+                    json.dump(list(self._categories[i]), f, ensure_ascii=False)
+
+        os.makedirs(self.temp_path, exist_ok=True)
+        with open(os.path.join(self.temp_path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"name": self.name, "rows": self.rows, "columns": columns}, f, ensure_ascii=False)
+
+        try:
+            os.replace(self.temp_path, self.path)
+        except OSError:
+            # Another process stored the same content first
+            shutil.rmtree(self.temp_path, ignore_errors=True)
+        return self.path
+
+    def abort(self):
+        """Discard a partially written table."""
+        for f in self._files:
+            f.close()
+        shutil.rmtree(self.temp_path, ignore_errors=True)
+
+
+def store_chunks(chunks, writer):
+    """
+    Pass DataFrame chunks through while writing them to a TableWriter
+
+    The writer is closed when the chunks are exhausted and aborted if iteration
+    fails, so a table can be stored in the same pass that profiles it.
+
+    Args:
+        chunks: Iterable of DataFrames
+        writer (TableWriter): Destination
+
+    Yields:
+        DataFrame: The chunks, unchanged
+    """
+    try:
+        for chunk in chunks:
+            writer.write(chunk)
+            yield chunk
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+
+
+class Table:
+    """A stored table; column values are memory-mapped and loaded on first use."""
+
+    def __init__(self, path):
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        self.path = path
+        self.name = meta["name"]
+        self.rows = meta["rows"]
+        self.columns = {column["name"]: column for column in meta["columns"]}
+        self._values = {}
+        self._categories = {}
+
+    def kind(self, name):
+        return self.columns[name]["kind"]
+
+    def values(self, name):
+        """Stored values of a column as a read-only memory map."""
+        if name not in self._values:
+            self._values[name] = np.load(os.path.join(self.path, self.columns[name]["file"]), mmap_mode="r")
+        return self._values[name]
+
+    def categories(self, name):
+        """Labels of a categorical column, indexed by code."""
+        if name not in self._categories:
+            with open(os.path.join(self.path, self.columns[name]["categories"]), encoding="utf-8") as f:
+                self._categories[name] = json.load(f)
+        return self._categories[name]
+
+    def _numbers(self, name, mask=None):
+        """Non-missing values of a numeric or datetime column as float64."""
+        values = self.values(name)
+        if mask is not None:
+            values = values[mask]
+        if self.kind(name) == DATETIME:
+            values = values[values != _NAT].astype(np.float64)
+        else:
+            values = values[~np.isnan(values)]
+        return values
+
+    def format_value(self, name, value):
+        """Display text of a value of a column."""
+        if value is None or (isinstance(value, float) and np.isnan(value)):
+            return "n/a"
+        if self.kind(name) == DATETIME:
+            return str(pd.Timestamp(int(value)))
+        return f"{value:.6g}" if isinstance(value, float) else str(value)
+
+    def mask(self, name, op, value):
+        """
+        Rows matching a comparison
+
+        Args:
+            name (str): Column name
+            op (str): One of ==, !=, >, >=, <, <=
+            value: Number, timestamp string or category label
+
+        Returns:
+            numpy.ndarray: Boolean mask over the rows
+        """
+        values = self.values(name)
+        if self.kind(name) == CATEGORICAL:
+            labels = {label.lower(): code for code, label in enumerate(self.categories(name))}
+            code = labels.get(str(value).lower(), -2)
+            if op == "==":
+                return values == code
+            if op == "!=":
+                return (values != code) & (values >= 0)
+            raise ValueError(f"'{name}' is a text column and only supports = and !=")
+
+        if self.kind(name) == DATETIME:
+            value = pd.Timestamp(value).value
+            valid = values != _NAT
+        else:
+            value = float(value)
+            valid = ~np.isnan(values)
+        compare = {
+            "==": np.equal, "!=": np.not_equal, ">": np.greater,
+            ">=": np.greater_equal, "<": np.less, "<=": np.less_equal
+        }[op]
+        return compare(values, value) & valid
+
+    def aggregate(self, name, agg, mask=None):
+        """
+        Aggregate a numeric column
+
+        Args:
+            name (str): Column name
+            agg (str): sum, mean, min, max, median, std or count
+            mask (numpy.ndarray, optional): Rows to include
+
+        Returns:
+            float: Result, NaN when no values match
+        """
+        if agg == "count":
+            if self.kind(name) == CATEGORICAL:
+                values = self.values(name) if mask is None else self.values(name)[mask]
+                return float(np.count_nonzero(values >= 0))
+            return float(len(self._numbers(name, mask)))
+        values = self._numbers(name, mask)
+        if not len(values):
+            return float("nan")
+        return float({
+            "sum": np.sum, "mean": np.mean, "min": np.min, "max": np.max,
+            "median": np.median, "std": lambda v: np.std(v, ddof=1) if len(v) > 1 else 0.0
+        }[agg](values))
+
+    def group_by(self, by, name=None, agg="count", mask=None):
+        """
+        Aggregate a column per category of another
+
+        Args:
+            by (str): Categorical column to group by
+            name (str, optional): Numeric column to aggregate; None counts rows
+            agg (str): Aggregation, as for aggregate()
+            mask (numpy.ndarray, optional): Rows to include
+
+        Returns:
+            list: (label, value) pairs, largest value first
+        """
+        codes = self.values(by)
+        if mask is not None:
+            codes = codes[mask]
+        if name is None or agg == "count" and name == by:
+            valid = codes >= 0
+            counts = np.bincount(codes[valid], minlength=len(self.categories(by)))
+            result = pd.Series(counts.astype(np.float64))
+            result = result[result > 0]
+        else:
+            values = self.values(name) if mask is None else self.values(name)[mask]
+            values = np.asarray(values, dtype=np.float64)
+            if self.kind(name) == DATETIME:
+                values[values == _NAT] = np.nan
+            valid = (codes >= 0) & ~np.isnan(values)
+            result = pd.Series(values[valid]).groupby(codes[valid]).agg(agg)
+        labels = self.categories(by)
+        result = result.sort_values(ascending=False, kind="stable")
+        return [(labels[int(code)], float(value)) for code, value in result.items()]
+
+    def describe(self, mask=None):
+        """
+        Exact summary statistics of every column
+
+        Returns:
+            list: Lines of text, one per column
+        """
+        lines = []
+        for name, column in self.columns.items():
+            if column["kind"] == CATEGORICAL:
+                codes = self.values(name) if mask is None else self.values(name)[mask]
+                counts = np.bincount(codes[codes >= 0], minlength=len(self.categories(name)))
+                if counts.sum():
+                    top = int(np.argmax(counts))
+                    lines.append(
+                        f"- {name}: {int(counts.sum())} values, {int(np.count_nonzero(counts))} unique, "
+                        f"most common '{self.categories(name)[top]}' ({int(counts[top])})"
+                    )
+                else:
+                    lines.append(f"- {name}: no values")
+                continue
+            values = self._numbers(name, mask)
+            if not len(values):
+                lines.append(f"- {name}: no values")
+                continue
+            p25, p50, p75 = np.percentile(values, [25, 50, 75])
+            stats = [("min", values.min()), ("p25", p25), ("median", p50), ("p75", p75), ("max", values.max())]
+            if column["kind"] == NUMERIC:
+                stats = [("mean", values.mean()), ("std", values.std(ddof=1) if len(values) > 1 else 0.0)] + stats
+            lines.append(
+                f"- {name}: {len(values)} values, "
+                + ", ".join(f"{label} {self.format_value(name, float(v))}" for label, v in stats)
+            )
+        return lines
+
+
+_tables = OrderedDict()
+_tables_lock = threading.Lock()
+
+
+def open_table(key, directory=None):
+    """
+    Open a stored table, reusing tables already opened in this process
+
+    Args:
+        key (str): Key the table was stored under
+        directory (str, optional): Store directory, defaults to TABLE_SETTINGS["dir"]
+
+    Returns:
+        Table: The table, or None if it is not stored
+    """
+    path = table_path(key, directory)
+    with _tables_lock:
+        table = _tables.get(path)
+        if table is not None:
+            _tables.move_to_end(path)
+            return table
+    if not table_exists(key, directory):
+        return None
+    table = Table(path)
+    with _tables_lock:
+        _tables[path] = table
+        while len(_tables) > TABLE_SETTINGS["open_tables"]:
+            _tables.popitem(last=False)
+    return table
+
+
+# Query words mapped to aggregations, checked in this order
+_AGGREGATIONS = [
+    ("median", r"\bmedian\b"),
+    ("std", r"\b(std|standard deviation|stdev)\b"),
+    ("mean", r"\b(average|avg|mean)\b"),
+    ("sum", r"\b(sum|total)\b"),
+    ("max", r"\b(max|maximum|highest|largest|biggest)\b"),
+    ("min", r"\b(min|minimum|lowest|smallest)\b"),
+    ("count", r"\b(count|how many|number of)\b")
+]
+_DESCRIBE = re.compile(r"\b(describe|statistics|stats|distribution)\b")
+_OPERATORS = [
+    (">=", [">=", "at least", "greater than or equal to"]),
+    ("<=", ["<=", "at most", "less than or equal to"]),
+    ("!=", ["!=", "is not", "not equal to"]),
+    (">", [">", "greater than", "more than", "above", "over", "after"]),
+    ("<", ["<", "less than", "below", "under", "before"]),
+    ("==", ["==", "=", "equals", "is"])
+]
+# Word operators must end at a word boundary ("is" must not match "island")
+_OPERATOR_PATTERNS = [
+    (op, re.compile(r"\s*(?:" + "|".join(
+        re.escape(word) + (r"\b" if word[-1].isalpha() else "") for word in words
+    ) + r")\s*"))
+    for op, words in _OPERATORS
+]
+_FILTER_VALUE = re.compile(r"['\"]?(.+?)['\"]?(?=\s+(?:and|by|per|group)\b|[,?;]|\.?$)")
+_GROUP_PREFIX = re.compile(r"\b(by|per|for each|each|across)$")
+_FILTER_PREFIX = re.compile(r"\b(where|with|when|whose|if|and|for|have|has|in|among)$")
+
+
+def _mentions(table, query):
+    """Columns mentioned in a lowercased query as (start, end, name), longest names first."""
+    found, taken = [], set()
+    for name in sorted(table.columns, key=len, reverse=True):
+        # "unit_price" also matches "unit price" and "unit-price"
+        words = [re.escape(word) for word in re.split(r"[\s_\-]+", name.lower().strip()) if word]
+        if not words:
+            continue
+        pattern = r"(?<!\w)" + r"[\s_\-]+".join(words) + r"(?!\w)"
+        for match in re.finditer(pattern, query):
+            span = set(range(match.start(), match.end()))
+            if not span & taken:
+                taken |= span
+                found.append((match.start(), match.end(), name))
+    return sorted(found)
+
+
+def _labels(table, name):
+    """Lowercased category labels of a text column, longest first."""
+    labels = {" ".join(str(label).lower().split()) for label in table.categories(name)}
+    return sorted((label for label in labels if label), key=len, reverse=True)
+
+
+def _leading_label(table, name, text):
+    """Length of the longest category label of a column that text starts with, 0 if none."""
+    for label in _labels(table, name):
+        if text.startswith(label) and not (label[-1].isalnum() and re.match(r"\w", text[len(label):])):
+            return len(label)
+    return 0
+
+
+def _parse_filter(table, name, after):
+    """
+    Read the "<operator> <value>" that follows a column mention
+
+    A category label straight after a text column is read as equality
+    ("status shipped"), and a text column's value is cut at the longest label
+    it starts with, so the rest of the message is still checked.
+
+    Args:
+        table (Table): Table the question is about
+        name (str): Mentioned column
+        after (str): Message text after the mention
+
+    Returns:
+        tuple: (op, value, characters of after consumed), or None
+    """
+    for op, pattern in _OPERATOR_PATTERNS:
+        match = pattern.match(after)
+        if match:
+            break
+    else:
+        op = None
+    if table.kind(name) == CATEGORICAL:
+        start = match.end() if match else len(after) - len(after.lstrip())
+        quoted = re.match(r"['\"]?", after[start:]).end()
+        length = _leading_label(table, name, after[start + quoted:])
+        if length:
+            end = start + quoted + length
+            if quoted and after[end:end + 1] in ("'", '"'):
+                end += 1
+            return op or "==", after[start + quoted:start + quoted + length], end
+    if match is None:
+        return None
+    value = _FILTER_VALUE.match(after[match.end():])
+    if value is None:
+        return None
+    return op, value.group(1).strip(), match.end() + value.end()
+
+
+def _unexplained(table, text):
+    """Whether text left over after parsing still holds a number or a category label."""
+    if re.search(r"\d", text):
+        return True
+    for name, column in table.columns.items():
+        if column["kind"] != CATEGORICAL:
+            continue
+        for label in _labels(table, name):
+            # Single characters ("a", "x") are too likely to be ordinary words
+            if len(label) > 1 and label in text and re.search(r"(?<!\w)" + re.escape(label) + r"(?!\w)", text):
+                return True
+    return False
+
+
+def parse_query(table, query):
+    """
+    Work out which computation a chat message asks for
+
+    Understands an aggregation word (average, total, max, how many, ...), a
+    numeric column, an optional "by/per <column>" grouping and optional
+    "where <column> <operator> <value>" filters, or a request to describe the data.
+    Messages that mention a column, number or category label the parse did not
+    use are refused, so a filter that was not understood is never dropped.
+
+    Args:
+        table (Table): Table the question is about
+        query (str): The user's message
+
+    Returns:
+        dict: agg, column, by, filters and describe, or None if the message is
+            not a question this engine can answer
+    """
+    text = " ".join(query.lower().split())
+    mentions = _mentions(table, text)
+    agg = next((agg for agg, pattern in _AGGREGATIONS if re.search(pattern, text)), None)
+    describe = bool(_DESCRIBE.search(text))
+    if agg is None and not describe:
+        return None
+
+    by, filters, free, consumed = None, [], [], set()
+    for start, end, name in mentions:
+        if start in consumed:
+            continue
+        before = text[:start].rstrip()
+        if _GROUP_PREFIX.search(before) and table.kind(name) == CATEGORICAL:
+            by = name
+            consumed.update(range(start, end))
+            continue
+        parsed = _parse_filter(table, name, text[end:]) if _FILTER_PREFIX.search(before) else None
+        if parsed:
+            op, value, length = parsed
+            filters.append((name, op, value))
+            consumed.update(range(start, end + length))
+            continue
+        free.append((start, end, name))
+
+    targets = [(start, end, name) for start, end, name in free if table.kind(name) != CATEGORICAL]
+    if len(targets) < len(free):
+        return None
+    names = list(dict.fromkeys(name for _, _, name in targets))
+    # An aggregation applies to one column; describe covers every column
+    if agg is not None and len(names) > 1:
+        return None
+    for start, end, _ in targets:
+        consumed.update(range(start, end))
+    if _unexplained(table, "".join(" " if index in consumed else char for index, char in enumerate(text))):
+        return None
+
+    column = names[0] if names else None
+    if agg is not None and agg != "count" and column is None:
+        return None if not describe else {"agg": None, "column": None, "by": by, "filters": filters, "describe": True}
+    return {"agg": agg, "column": column, "by": by, "filters": filters, "describe": describe}
+
+
+def run_query(table, intent):
+    """
+    Compute the result of a parsed query
+
+    Args:
+        table (Table): Table to query
+        intent (dict): Result of parse_query()
+
+    Returns:
+        str: Result lines, or an explanation if a filter could not be applied
+    """
+    mask, conditions = None, []
+    for name, op, value in intent["filters"]:
+        try:
+            condition = table.mask(name, op, value)
+        except (ValueError, TypeError) as e:
+            return f"Could not filter on {name} {op} {value}: {e}"
+        mask = condition if mask is None else mask & condition
+        conditions.append(f"{name} {op} {value}")
+    where = f" where {' and '.join(conditions)}" if conditions else ""
+    matched = table.rows if mask is None else int(np.count_nonzero(mask))
+
+    lines = []
+    if intent["agg"] is not None:
+        agg, column, by = intent["agg"], intent["column"], intent["by"]
+        subject = f"{agg} of {column}" if column else "row count"
+        if by:
+            groups = table.group_by(by, column, agg if column else "count", mask)
+            shown = groups[:TABLE_SETTINGS["max_groups"]]
+            lines.append(
+                f"{subject} by {by}{where} ({len(shown)} of {len(groups)} groups, largest first):"
+            )
+            lines.extend(f"  {label}: {table.format_value(column or by, value) if column else int(value)}" for label, value in shown)
+        elif column:
+            value = table.aggregate(column, agg, mask)
+            lines.append(f"{subject}{where}: {int(value) if agg == 'count' else table.format_value(column, value)}")
+        else:
+            lines.append(f"{subject}{where}: {matched}")
+    if intent["describe"]:
+        lines.append(f"Column statistics{where}:")
+        lines.extend(table.describe(mask))
+    return "\n".join(lines)
+
+
+def answer_from_tables(tables, query):
+    """
+    Answer a data question exactly from stored tables, if the engine understands it
+
+    Args:
+        tables (list): Dicts with key and name of stored tables (file_details["tables"])
+        query (str): The user's message
+
+    Returns:
+        str: Computed results to add to the prompt, or None
+    """
+    sections = []
+    for ref in tables or []:
+        table = open_table(ref["key"])
+        if table is None:
+            continue
+        intent = parse_query(table, query)
+        if intent is None:
+            continue
+        sections.append(
+            f"Table '{ref.get('name', table.name)}' ({table.rows} rows):\n{run_query(table, intent)}"
+        )
+    if not sections:
+        return None
+    return "Exact results computed locally from the full uploaded data:\n\n" + "\n\n".join(sections)
@@ -0,0 +1,60 @@
+import pandas as pd
+import pytest
+
+from table_store import Table, TableWriter, answer_from_tables, parse_query, run_query, table_path
+
+
+@pytest.fixture
+def orders(tmp_path):
+    frame = pd.DataFrame({
+        "order_date": pd.to_datetime(["2020-06-01"] * 50 + ["2021-06-01"] * 50),
+        "region": ["east"] * 25 + ["west"] * 75,
+        "status": ["shipped", "pending"] * 50,
+        "revenue": [float(i) for i in range(100)],
+        "quantity": [1] * 100,
+    })
+    writer = TableWriter("orders", "orders.csv", directory=str(tmp_path))
+    writer.write(frame)
+    writer.close()
+    return Table(table_path("orders", str(tmp_path)))
+
+
+def answer(table, query):
+    intent = parse_query(table, query)
+    return None if intent is None else run_query(table, intent)
+
+
+def test_unfiltered_aggregate(orders):
+    assert answer(orders, "What is the total revenue?") == "sum of revenue: 4950"
+
+
+def test_category_label_after_column_filters(orders):
+    assert answer(orders, "How many orders have status shipped?") == "row count where status == shipped: 50"
+
+
+def test_explicit_filter(orders):
+    assert answer(orders, "average revenue where region is east") == "mean of revenue where region == east: 12"
+
+
+def test_group_by(orders):
+    assert answer(orders, "total quantity by region").splitlines()[1:] == ["  west: 75", "  east: 25"]
+
+
+@pytest.mark.parametrize("query", [
+    "total revenue in 2021",
+    "total revenue for the east region",
+    "total revenue for east",
+    "How many orders were shipped in 2021?",
+    "total revenue where status is shipped in 2021",
+    "total revenue and quantity",
+    "average revenue per order_date",
+])
+def test_unparsed_filters_inject_nothing(orders, query):
+    assert parse_query(orders, query) is None
+
+
+def test_answer_from_tables_skips_unparsed_filters(orders, monkeypatch):
+    monkeypatch.setattr("table_store.open_table", lambda key: orders)
+    tables = [{"key": "orders", "name": "orders.csv"}]
+    assert answer_from_tables(tables, "total revenue in 2021") is None
+    assert "sum of revenue: 4950" in answer_from_tables(tables, "total revenue")
@@ -0,0 +1,259 @@
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, MaxRetryError
+
+from config import HTTP_SETTINGS
+
+# Per-thread accumulator for time spent opening new connections (DNS + TCP + TLS).
+# Reused keep-alive connections never call connect(), so this stays at zero for them.
+_connect_state = threading.local()
+
+# Methods that may be sent again after a connection broke mid-request
+_IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE", "TRACE"})
+
+
+def _record_connect(elapsed):
+    _connect_state.connect_ms = getattr(_connect_state, "connect_ms", 0.0) + elapsed * 1000
+    _connect_state.new_connections = getattr(_connect_state, "new_connections", 0) + 1
+
+
+def backoff_delay(attempt, settings, retry_after=None):
+    """
+    Delay before the next retry: exponential backoff with full jitter
+    
+    Args:
+        attempt (int): Zero-based number of the attempt that just failed
+        settings (dict): Transport settings with backoff_base and backoff_max
+        retry_after (str, optional): Retry-After header from the server, honoured if numeric
+        
+    Returns:
+        float: Seconds to sleep
+    """
+    if retry_after:
+        try:
+            return min(float(retry_after), settings["backoff_max"])
+        except ValueError:
+            pass
+    ceiling = min(settings["backoff_max"], settings["backoff_base"] * (2 ** attempt))
+    return random.uniform(0, ceiling)
+
+
+def _never_sent(error):
+    """
+    Whether a connection failure happened before the request reached the server
+
+    Args:
+        error (requests.exceptions.ConnectionError): The failure
+
+    Returns:
+        bool: True for connect timeouts and failures to open the connection
+            (NewConnectionError is a ConnectTimeoutError); False when an open
+            connection broke, e.g. "Connection aborted" after the body was sent
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = error.args[0] if error.args else None
+    if isinstance(reason, MaxRetryError):
+        reason = reason.reason
+    return isinstance(reason, ConnectTimeoutError)
+
+
+class _TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _record_connect(time.perf_counter() - start)
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _record_connect(time.perf_counter() - start)
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _TimedAdapter(HTTPAdapter):
+    """HTTPAdapter whose connection pools record how long new connections take to open."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool,
+        }
+
+
+class PooledTransport:
+    """Thread-safe, keep-alive HTTP transport with timeouts and retries."""
+
+    def __init__(self, settings=None):
+        """
+        Create the pooled session.
+
+        Args:
+            settings (dict, optional): Overrides for config.HTTP_SETTINGS
+        """
+        self.settings = dict(HTTP_SETTINGS)
+        if settings:
+            self.settings.update(settings)
+
+        self.session = requests.Session()
+        # Retries are handled in request() so that they get backoff with jitter
+        # and show up in the per-request timing.
+        adapter = _TimedAdapter(
+            pool_connections=self.settings["pool_connections"],
+            pool_maxsize=self.settings["pool_maxsize"],
+            max_retries=0,
+            pool_block=self.settings["pool_block"],
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._lock = threading.Lock()
+        self.stats = {
+            "requests": 0,
+            "attempts": 0,
+            "retries": 0,
+            "new_connections": 0,
+            "errors": 0,
+        }
+
+    def _backoff(self, attempt, response=None):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        return backoff_delay(attempt, self.settings, retry_after)
+
+    def _count(self, **increments):
+        with self._lock:
+            for key, value in increments.items():
+                self.stats[key] += value
+
+    def request(self, method, url, stream=False, timeout=None, **kwargs):
+        """
+        Send a request through the shared connection pool.
+
+        Responses with a status in HTTP_SETTINGS["retry_statuses"] and connection
+        failures are retried with exponential backoff and jitter. A connection that
+        broke after the request may have been sent is only retried for idempotent
+        methods, so a POST is never run twice; read timeouts are not retried either,
+        since the upstream may still be working on the request.
+
+        Args:
+            method (str): HTTP method
+            url (str): Request URL
+            stream (bool): Leave the body unread so the caller can iterate over it
+            timeout (tuple, optional): (connect, read) timeout in seconds
+            **kwargs: Passed through to requests.Session.request
+
+        Returns:
+            tuple: (requests.Response, dict timing). Timing holds connect_ms,
+                ttfb_ms, total_ms (None while a streamed body is unread), attempts
+                and reused_connection.
+        """
+        if timeout is None:
+            timeout = (self.settings["connect_timeout"], self.settings["read_timeout"])
+
+        max_retries = self.settings["max_retries"]
+        retry_statuses = self.settings["retry_statuses"]
+
+        _connect_state.connect_ms = 0.0
+        _connect_state.new_connections = 0
+        start = time.perf_counter()
+        attempt = 0
+
+        while True:
+            attempt += 1
+            try:
+                response = self.session.request(method, url, stream=True, timeout=timeout, **kwargs)
+            except requests.exceptions.ConnectionError as e:
+                retryable = method.upper() in _IDEMPOTENT_METHODS or _never_sent(e)
+                if attempt > max_retries or not retryable:
+                    self._count(requests=1, attempts=attempt, retries=attempt - 1,
+                                new_connections=_connect_state.new_connections, errors=1)
+                    raise
+                time.sleep(self._backoff(attempt - 1))
+                continue
+            except requests.exceptions.RequestException:
+                self._count(requests=1, attempts=attempt, retries=attempt - 1,
+                            new_connections=_connect_state.new_connections, errors=1)
+                raise
+
+            if response.status_code in retry_statuses and attempt <= max_retries:
+                delay = self._backoff(attempt - 1, response)
+                # Drain the (small) error body so the connection goes back to the pool
+                response.content
+                response.close()
+                time.sleep(delay)
+                continue
+            break
+
+        # Headers have been received at this point, so this is the time to first byte
+        ttfb = time.perf_counter()
+        if not stream:
+            # Reading the body here returns the connection to the pool
+            response.content
+
+        timing = {
+            "connect_ms": round(_connect_state.connect_ms, 2),
+            "ttfb_ms": round((ttfb - start) * 1000, 2),
+            "total_ms": None if stream else round((time.perf_counter() - start) * 1000, 2),
+            "attempts": attempt,
+            "reused_connection": _connect_state.new_connections == 0,
+        }
+        self._count(requests=1, attempts=attempt, retries=attempt - 1,
+                    new_connections=_connect_state.new_connections,
+                    errors=1 if response.status_code >= 400 else 0)
+        return response, timing
+
+    def post(self, url, **kwargs):
+        """Send a POST request. See request()."""
+        return self.request("POST", url, **kwargs)
+
+    def get(self, url, **kwargs):
+        """Send a GET request. See request()."""
+        return self.request("GET", url, **kwargs)
+
+    def get_stats(self):
+        """Return a snapshot of the transport counters."""
+        with self._lock:
+            return dict(self.stats)
+
+    def close(self):
+        """Close all pooled connections."""
+        self.session.close()
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_transport():
+    """
+    Get the process-wide pooled transport, creating it on first use
+
+    Returns:
+        PooledTransport: Shared transport instance
+    """
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = PooledTransport()
+    return _transport
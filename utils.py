@@ -1,4 +1,5 @@
 import streamlit as st
+import uuid
 
 def initialize_session_state():
     """
@@ -7,6 +8,9 @@ def initialize_session_state():
     if "messages" not in st.session_state:
         st.session_state.messages = []
     
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = str(uuid.uuid4())
+    
     if "api_key" not in st.session_state:
         st.session_state.api_key = ""
     
@@ -16,6 +20,18 @@ def initialize_session_state():
     if "max_tokens" not in st.session_state:
         st.session_state.max_tokens = 1000
     
+    if "stream_responses" not in st.session_state:
+        st.session_state.stream_responses = True
+    
+    if "prefer_fastest" not in st.session_state:
+        st.session_state.prefer_fastest = False
+    
+    if "hedge_requests" not in st.session_state:
+        st.session_state.hedge_requests = False
+    
+    if "cache_all_responses" not in st.session_state:
+        st.session_state.cache_all_responses = False
+    
     if "uploaded_file_content" not in st.session_state:
         st.session_state.uploaded_file_content = None
     
@@ -24,6 +40,15 @@ def initialize_session_state():
         
     if "uploaded_image" not in st.session_state:
         st.session_state.uploaded_image = None
+    
+    if "uploaded_tables" not in st.session_state:
+        st.session_state.uploaded_tables = []
+    
+    if "uploaded_files" not in st.session_state:
+        st.session_state.uploaded_files = []
+    
+    if "image_jobs" not in st.session_state:
+        st.session_state.image_jobs = []
 
 def format_message(message):
     """
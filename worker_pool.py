@@ -0,0 +1,49 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from config import WORKER_SETTINGS
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def worker_count():
+    """Number of worker processes used for CPU-bound parsing."""
+    return WORKER_SETTINGS["processes"] or os.cpu_count() or 1
+
+
+def _mp_context():
+    """Multiprocessing context for the pool: WORKER_SETTINGS["start_method"], or spawn."""
+    method = WORKER_SETTINGS["start_method"]
+    if method not in multiprocessing.get_all_start_methods():
+        method = "spawn"
+    context = multiprocessing.get_context(method)
+    if method == "forkserver":
+        context.set_forkserver_preload(WORKER_SETTINGS["preload"])
+    return context
+
+
+def get_process_pool():
+    """
+    Get the process pool shared by the file parsers, creating it on first use
+
+    Returns:
+        ProcessPoolExecutor: Shared pool
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(max_workers=worker_count(), mp_context=_mp_context())
+    return _pool
+
+
+def reset_process_pool():
+    """Discard the shared pool, e.g. after a worker crashed and broke it."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None